@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import datetime
+import gzip
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from dataset import DELTA_DIR
+from engines import ENGINES, open_dataset
+from filter_index import FilterIndex
+from result_cache import ResultCache, canonical_filters
+from selection import Selection
+from warmup import load_warm_cache
+
+HOST = os.environ.get('THEFT_API_HOST', '127.0.0.1')
+PORT = int(os.environ.get('THEFT_API_PORT', 8600))
+THREADS = int(os.environ.get('THEFT_API_THREADS', 4))
+GZIP_MIN_BYTES = 512
+SYNC_INTERVAL_SECONDS = 1.0
+MAX_HEADER_LINES = 100
+
+# Each endpoint is one of the selection's results, under the same filters.
+ENDPOINTS = {
+    '/kpis': 'kpis',
+    '/models': 'model_count',
+    '/models/regions': 'model_regions',
+    '/models/distinct': 'distinct_models',
+    '/makes': 'top_makes',
+    '/makes/types': 'make_type_counts',
+    '/makes/colors': 'maker_color_counts',
+    '/regions': 'location_counts',
+    '/regions/rates': 'region_data',
+    '/regions/density-fit': 'density_fit',
+    '/trends/quarterly': 'quarterly_counts',
+    '/trends/model-years': 'model_year_counts',
+    '/trends/hotspots/makes': 'make_hotspots',
+    '/trends/hotspots/types': 'type_hotspots',
+    '/trends/forecast': 'forecast',
+    '/vehicles/ages': 'age_type_trend',
+    '/vehicles/colors': 'color_counts',
+    '/vehicles/types': 'type_counts'
+}
+# The same keys as st.session_state.filters; each list filter is a repeated
+# query parameter, e.g. ?regions=Auckland&regions=Waikato.
+LIST_FILTERS = {'makes': 'make_name', 'types': 'vehicle_type', 'colors': 'color', 'regions': 'region', 'make_types': 'make_type'}
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def jsonable(value):
+    # Frames become lists of records; numpy scalars, timestamps and NaN
+    # become their plain JSON counterparts.
+    if isinstance(value, pd.DataFrame):
+        return jsonable(value.to_dict('records'))
+    if isinstance(value, pd.Series):
+        return jsonable(value.rename(value.name or 'count').reset_index().to_dict('records'))
+    if isinstance(value, dict):
+        return {str(key): jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray, pd.Index)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, np.generic):
+        return jsonable(value.item())
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def parse_filters(query):
+    params = parse_qs(query, keep_blank_values=False)
+    unknown = set(params) - set(LIST_FILTERS) - {'date_range'}
+    if unknown:
+        raise BadRequest(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    filters = {key: params[key] for key in LIST_FILTERS if key in params}
+    if 'date_range' in params:
+        parts = [part for value in params['date_range'] for part in value.split(',')]
+        try:
+            date_range = tuple(datetime.date.fromisoformat(part) for part in parts)
+        except ValueError:
+            raise BadRequest('date_range takes two ISO dates, e.g. date_range=2022-01-01,2022-03-31')
+        if len(date_range) != 2 or date_range[0] > date_range[1]:
+            raise BadRequest('date_range takes two ISO dates, e.g. date_range=2022-01-01,2022-03-31')
+        filters['date_range'] = date_range
+    return filters
+
+
+class AggregateApi:
+    # The HTTP-independent part: resolves a path and filters to an encoded
+    # body. Runs on the worker threads, so every cache access goes through
+    # the thread-safe result cache.
+
+    def __init__(self, dataset, cache, delta_dir=DELTA_DIR):
+        self.dataset = dataset
+        self.cache = cache
+        self.delta_dir = delta_dir
+        self.synced = time.monotonic()
+        self.sync_lock = threading.Lock()
+
+    def sync(self):
+        # New delta files are picked up at most once a second, and only the
+        # cached results they affect are dropped, as in the dashboard.
+        with self.sync_lock:
+            if time.monotonic() - self.synced < SYNC_INTERVAL_SECONDS:
+                return
+            self.synced = time.monotonic()
+            new_incidents = self.dataset.sync_deltas(self.delta_dir)
+        if new_incidents is not None:
+            self.cache.invalidate(FilterIndex(new_incidents).matches_any)
+
+    def options(self):
+        first, last = self.dataset.date_bounds()
+        return {
+            **{key: [str(value) for value in self.dataset.options(col)] for key, col in LIST_FILTERS.items()},
+            'date_range': [first.date().isoformat(), last.date().isoformat()],
+            'rows': int(self.dataset.n_rows)
+        }
+
+    def encode(self, value):
+        body = json.dumps(jsonable(value), separators=(',', ':')).encode()
+        return body, gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_BYTES else None
+
+    def respond(self, path, query):
+        # Returns (status, body, gzipped body or None). Encoded responses are
+        # cached next to the results they are made from, under a name with
+        # the same scope, so a repeated request costs a hash lookup.
+        self.sync()
+        if path == '/health':
+            return 200, b'{"status":"ok"}', None
+        if path == '/options':
+            return (200, *self.cache.get_or_compute('response:/options', {}, lambda: self.encode(self.options())))
+        name = ENDPOINTS.get(path)
+        if name is None:
+            return 404, json.dumps({'error': f'No endpoint {path}', 'endpoints': sorted(ENDPOINTS)}).encode(), None
+        try:
+            filters = parse_filters(query)
+        except BadRequest as e:
+            return 400, json.dumps({'error': str(e)}).encode(), None
+        selection = Selection(self.dataset, self.cache, filters)
+        encoded = self.cache.get_or_compute(
+            f'response:{path}{selection.scope(name)}', filters,
+            lambda: self.encode({'filters': canonical_filters(filters), 'result': getattr(selection, name)()})
+        )
+        return (200, *encoded)
+
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise BadRequest('Malformed request line')
+    return parts[0], parts[1], parts[2], headers
+
+
+def response_bytes(status, body, gzipped, headers, version, method):
+    accepts_gzip = 'gzip' in headers.get('accept-encoding', '')
+    keep_alive = (
+        headers.get('connection', '').lower() != 'close'
+        if version == 'HTTP/1.1' else headers.get('connection', '').lower() == 'keep-alive'
+    )
+    lines = [f'HTTP/1.1 {status} {STATUS[status]}', 'Content-Type: application/json', 'Vary: Accept-Encoding']
+    if gzipped is not None and accepts_gzip:
+        body = gzipped
+        lines.append('Content-Encoding: gzip')
+    lines.append(f'Content-Length: {len(body)}')
+    lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+    head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+    return head + (b'' if method == 'HEAD' else body), keep_alive
+
+
+async def handle_connection(api, executor, reader, writer):
+    # One coroutine per connection with HTTP/1.1 keep-alive; the aggregation
+    # itself runs on the thread pool, so a slow selection never blocks the
+    # event loop or the cache hits of other connections.
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except BadRequest as e:
+                writer.write(response_bytes(400, json.dumps({'error': str(e)}).encode(), None, {}, 'HTTP/1.0', 'GET')[0])
+                break
+            if request is None:
+                break
+            method, target, version, headers = request
+            if method not in ('GET', 'HEAD'):
+                status, body, gzipped = 405, b'{"error":"Only GET and HEAD are supported"}', None
+            else:
+                url = urlsplit(target)
+                try:
+                    status, body, gzipped = await loop.run_in_executor(executor, api.respond, url.path.rstrip('/') or '/', url.query)
+                except Exception as e:
+                    status, body, gzipped = 500, json.dumps({'error': f'{type(e).__name__}: {e}'}).encode(), None
+            data, keep_alive = response_bytes(status, body, gzipped, headers, version, method)
+            writer.write(data)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(api, host=HOST, port=PORT, threads=THREADS):
+    executor = ThreadPoolExecutor(threads, thread_name_prefix='api')
+    server = await asyncio.start_server(lambda r, w: handle_connection(api, executor, r, w), host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Serving {len(ENDPOINTS)} endpoints on http://{address[0]}:{address[1]}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the dashboard aggregates as JSON over HTTP.')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--threads', type=int, default=THREADS, help='Threads computing uncached selections')
+    parser.add_argument('--engine', choices=list(ENGINES), help='Defaults to THEFT_ENGINE')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    dataset = open_dataset(args.engine)
+    cache = ResultCache()
+    warmed = load_warm_cache(dataset, cache)
+    print(f"Loaded {dataset.n_rows:,} rows in {time.perf_counter() - started:.1f} s ({warmed:,} warm results)", flush=True)
+    try:
+        asyncio.run(serve(AggregateApi(dataset, cache), args.host, args.port, args.threads))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
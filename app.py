@@ -1,14 +1,36 @@
+import functools
+import os
+import threading
+
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
+
+from charts import (
+    age_figure, color_figure, fit_summary, forecast_figure, forecast_table, hotspot_figure, hotspot_table,
+    location_figure, make_color_figure, make_type_figure, model_region_figure, model_year_figure, models_figure,
+    quarterly_figure, rate_table_figure, top_makes_figure, vehicle_type_figure
+)
+from engines import open_dataset
+from filter_index import FilterIndex
+from forecast import FORECAST_GROUPS, MIN_WEEKS
+from hotspots import BASELINE_WEEKS, HOTSPOT_COLUMNS, RECENT_WEEKS
+from profiling import RerunTimer, append_log, finish_profile, start_profile
+from result_cache import ResultCache, canonical_filters
+from selection import Selection
+from warmup import load_warm_cache, prewarm, warm_states
+
+timer = RerunTimer()
+# Set once the full run has been timed and logged.
+timing_record = None
 
 st.set_page_config(
-    page_title="Vehicle Theft Analytics Dashboard",
+    page_title="Vehicle Theft Analysis",
     layout="wide"
 )
 
+DEBUG_PANEL = os.environ.get('THEFT_DEBUG') == '1' or st.query_params.get('debug') == '1'
+INSTRUMENTED = DEBUG_PANEL or 'THEFT_TIMINGS_LOG' in os.environ
+profiler = start_profile() if st.session_state.pop('profile_next_rerun', False) else None
+
 st.markdown("""
     <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;600;800&display=swap');
@@ -24,22 +46,23 @@ st.markdown("""
         font-family: 'Inter', system-ui, -apple-system, 'Segoe UI', Roboto, 'Helvetica Neue', Arial;
     }
 
-    .main {background-color: inherit}
+    .main {background-color: inherit; padding: 2rem}
     .stApp header {background-color: transparent}
     div[data-testid="stMetricValue"] {font-size: 20px}
     .streamlit-expanderHeader {background-color: #f0f2f6}
     div.css-12w0qpk.e1tzin5v1 {background-color: var(--card); padding: 20px; border-radius: 10px; box-shadow: 0 6px 18px rgba(16,24,40,0.06)}
 
     .title {
-        font-size: 2.25rem;
-        font-weight: 700;
-        margin-bottom: 0.6rem;
+        font-size: 2.5rem;
+        font-weight: bold;
+        margin-bottom: 2rem;
     }
 
     h1, .stMarkdown h1 {font-family: 'Inter', sans-serif}
 
     .css-1d391kg .sidebar .stButton>button {border-radius: 8px}
-    .filter-section {background-color: rgba(255,255,255,0.6); padding: 0.8rem; border-radius: 8px; margin-bottom: 0.8rem}
+    .sidebar-content {padding: 1rem}
+    .filter-section {background-color: rgba(255,255,255,0.1); padding: 1rem; border-radius: 0.5rem; margin-bottom: 1rem}
 
     </style>
 """, unsafe_allow_html=True)
@@ -58,46 +81,29 @@ COLOR_SCHEMES = {
     }
 }
 
-COLOR_SCHEME = {
-    'primary': ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728'],
-    'background': 'rgba(0,0,0,0)',
-    'text': 'auto'
-}
-
-import plotly.io as pio
-pio.templates.default = "plotly_white"
-
-def create_themed_chart(fig):
-    fig.update_layout(
-        plot_bgcolor=COLOR_SCHEME['background'],
-        paper_bgcolor=COLOR_SCHEME['background'],
-        margin=dict(t=30, l=10, r=10, b=10)
-    )
-    return fig
-
-st.set_page_config(page_title="Vehicle Theft Analysis", layout="wide")
-
-st.markdown("""
-    <style>
-    .main {
-        padding: 2rem;
-    }
-    .title {
-        font-size: 2.5rem;
-        font-weight: bold;
-        margin-bottom: 2rem;
-    }
-    .sidebar-content {
-        padding: 1rem;
-    }
-    .filter-section {
-        background-color: rgba(255,255,255,0.1);
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin-bottom: 1rem;
-    }
-    </style>
-""", unsafe_allow_html=True)
+def show_chart(section, fig):
+    timer.lap(section, 'figure')
+    st.plotly_chart(fig, width='stretch')
+    timer.lap(section, 'send')
+    if INSTRUMENTED:
+        timer.payload(section, fig)
+
+def timed_fragment(section):
+    # A control inside a section reruns only its fragment, after the full run
+    # has already logged its timer, so such a rerun is timed and logged on
+    # its own under the fragment's name.
+    @st.fragment
+    @functools.wraps(section)
+    def run():
+        global timer
+        if timing_record is None:
+            section()
+            return
+        timer = RerunTimer()
+        section()
+        if INSTRUMENTED:
+            append_log(timer.record(filters=canonical_filters(st.session_state.filters), fragment=section.__name__))
+    return run
 
 def initialize_filters():
     if 'filters' not in st.session_state:
@@ -110,62 +116,41 @@ def initialize_filters():
             'make_types': []
         }
 
-def apply_filters(df):
-    filtered_df = df.copy()
-    if st.session_state.filters['date_range'] and len(st.session_state.filters['date_range']) == 2:
-        start_date, end_date = st.session_state.filters['date_range']
-        filtered_df = filtered_df[
-            (filtered_df['date_stolen'].dt.date >= start_date) & 
-            (filtered_df['date_stolen'].dt.date <= end_date)
-        ]
-    if st.session_state.filters['makes']:
-        filtered_df = filtered_df[filtered_df['make_name'].isin(st.session_state.filters['makes'])]
-    
-    if st.session_state.filters['types']:
-        filtered_df = filtered_df[filtered_df['vehicle_type'].isin(st.session_state.filters['types'])]
-        
-    if st.session_state.filters['colors']:
-        filtered_df = filtered_df[filtered_df['color'].isin(st.session_state.filters['colors'])]
-        
-    if st.session_state.filters['regions']:
-        filtered_df = filtered_df[filtered_df['region'].isin(st.session_state.filters['regions'])]
-        
-    if st.session_state.filters['make_types']:
-        filtered_df = filtered_df[filtered_df['make_type'].isin(st.session_state.filters['make_types'])]
-    
-    return filtered_df
-
-def clean_categorical(df, columns):
-    df_clean = df.copy()
-    for col in columns:
-        if col in df_clean.columns:
-            df_clean[col] = df_clean[col].fillna('Unknown').astype(str)
-    return df_clean
-
-@st.cache_data
+@st.cache_resource
 def load_data():
-    df = pd.read_csv('stolen_vehicles_enhanced.csv')
-    df['date_stolen'] = pd.to_datetime(df['date_stolen'])
-    categorical_cols = ['make_name', 'vehicle_type', 'color', 'region', 'make_type']
-    df = clean_categorical(df, categorical_cols)
-    return df
+    return open_dataset()
+
+@st.cache_resource
+def get_result_cache(_dataset):
+    # Results precomputed by `python -m warmup` for this exact dataset are
+    # served from the first session on. THEFT_PREWARM=1 also computes the
+    # common selections in the background once the server has loaded the data.
+    cache = ResultCache()
+    load_warm_cache(_dataset, cache)
+    if os.environ.get('THEFT_PREWARM') == '1':
+        threading.Thread(target=prewarm, args=(_dataset, cache, warm_states(_dataset)), daemon=True).start()
+    return cache
 
 try:
-    df_f = load_data()
+    dataset = load_data()
 except FileNotFoundError:
     st.error("Please ensure 'stolen_vehicles_enhanced.csv' is in the same directory as this script.")
     st.stop()
 
 initialize_filters()
 
-df_original = load_data()
+result_cache = get_result_cache(dataset)
+new_incidents = dataset.sync_deltas()
+if new_incidents is not None:
+    result_cache.invalidate(FilterIndex(new_incidents).matches_any)
+timer.lap('setup', 'compute')
 
 with st.sidebar:
     st.title(" Filters")
     with st.expander(" Vehicle Filters", expanded=True):
         st.session_state.filters['makes'] = st.multiselect(
             "Make",
-            options=sorted(df_original['make_name'].unique().tolist()),
+            options=dataset.options('make_name'),
             default=st.session_state.filters['makes'],
             key="makes_filter",
             help="Select vehicle manufacturers to filter"
@@ -173,40 +158,59 @@ with st.sidebar:
         
         st.session_state.filters['types'] = st.multiselect(
             "Vehicle Type",
-            options=sorted(df_original['vehicle_type'].unique()),
+            options=dataset.options('vehicle_type'),
             default=st.session_state.filters['types'],
             key="types_filter"
         )
         
         st.session_state.filters['colors'] = st.multiselect(
             "Color",
-            options=sorted(df_original['color'].unique()),
+            options=dataset.options('color'),
             default=st.session_state.filters['colors'],
             key="colors_filter"
         )
     with st.expander(" Location", expanded=True):
         st.session_state.filters['regions'] = st.multiselect(
             "Region",
-            options=sorted(df_original['region'].unique()),
+            options=dataset.options('region'),
             default=st.session_state.filters['regions'],
             key="regions_filter"
         )
+    with st.expander(" Date", expanded=True):
+        first_date, last_date = (day.date() for day in dataset.date_bounds())
+        picked = st.date_input(
+            "Theft date",
+            value=st.session_state.filters['date_range'] or (first_date, last_date),
+            min_value=first_date,
+            max_value=last_date,
+            key="date_filter"
+        )
+        # The full span is the same selection as no date filter, and a range
+        # is only applied once both ends are picked.
+        picked = tuple(picked)
+        st.session_state.filters['date_range'] = (
+            picked if len(picked) == 2 and picked != (first_date, last_date) else None
+        )
     if st.button("Reset All Filters", type="primary"):
         for key in st.session_state.filters.keys():
             st.session_state.filters[key] = [] if isinstance(st.session_state.filters[key], list) else None
-        widget_keys = ["makes_filter", "types_filter", "colors_filter", "regions_filter"]
+        widget_keys = ["makes_filter", "types_filter", "colors_filter", "regions_filter", "date_filter"]
         for widget_key in widget_keys:
             if widget_key in st.session_state:
                 del st.session_state[widget_key]
         st.rerun()
+timer.lap('setup', 'send')
 
-df_filtered = apply_filters(df_original)
+selection = Selection(dataset, result_cache, st.session_state.filters)
+kpis = selection.kpis()
+total_thefts = kpis['total_thefts']
+timer.lap('kpis', 'compute')
 
 with st.sidebar:
     st.markdown("---")
     st.markdown("###  Filter Summary")
-    st.markdown(f"**Total Records:** {len(df_filtered):,}")
-    st.markdown(f"**Filter Reduction:** {((1 - len(df_filtered)/len(df_original)) * 100):.1f}%")
+    st.markdown(f"**Total Records:** {total_thefts:,}")
+    st.markdown(f"**Filter Reduction:** {((1 - total_thefts/dataset.n_rows) * 100):.1f}%")
 
 col1, col2, col3 = st.columns([1.5, 1, 1.5])
 with col2:
@@ -226,451 +230,271 @@ st.markdown("""
 st.sidebar.title(' Dashboard Controls')
 
 st.sidebar.markdown("###  Key Metrics")
-total_thefts = len(df_filtered)
-unique_makes = df_filtered['make_name'].nunique()
 st.sidebar.metric("Total Incidents", f"{total_thefts:,}")
-st.sidebar.metric("Unique Makes", f"{unique_makes:,}")
+st.sidebar.metric("Unique Makes", f"{kpis['unique_makes']:,}")
 
 st.markdown("### Analysis of Vehicle Theft")
 
 col1, col2, col3, col4 = st.columns(4)
 with col1:
-    total_luxury = len(df_filtered[df_filtered['make_type'] == 'Luxury'])
-    st.metric("Luxury Vehicles", f"{total_luxury:,}")
+    st.metric("Luxury Vehicles", f"{kpis['total_luxury']:,}")
 with col2:
-    avg_age = (pd.Timestamp.now().year - df_filtered['model_year'].mean()).round(1)
-    st.metric("Avg Vehicle Age", f"{avg_age:.1f} years")
+    st.metric("Avg Vehicle Age", f"{kpis['avg_age']:.1f} years")
 with col3:
-    most_stolen = df_filtered['make_name'].mode()[0]
-    st.metric("Most Stolen Make", most_stolen)
+    st.metric("Most Stolen Make", kpis['most_stolen'])
 with col4:
-    df_filtered['population'] = pd.to_numeric(df_filtered['population'].astype(str).str.replace(',', ''), errors='coerce')
-
-    avg_population = df_filtered['population'].mean()
-    if pd.notnull(avg_population) and avg_population > 0:
-        theft_rate = (total_thefts / avg_population * 100000).round(2)
-        st.metric("Thefts per 100k", f"{theft_rate:.2f}")
+    if kpis['theft_rate'] is not None:
+        st.metric("Thefts per 100k", f"{kpis['theft_rate']:.2f}")
     else:
         st.metric("Thefts per 100k", "N/A")
+timer.lap('kpis', 'send')
+timer.mark('first_render')
 
 st.markdown("### Detailed Analysis")
 
-st.subheader(" Most Frequently Stolen Vehicle Models")
-
-model_count = df_filtered['vehicle_desc'].value_counts().reset_index()
-model_count.columns = ['model', 'count']
-
-fig_models = px.bar(
-    model_count.head(20).sort_values('count', ascending=True),
-    x='count',
-    y='model',
-    orientation='h',
-    title='Top 20 Most Frequently Stolen Vehicle Models',
-    color='count',
-    color_continuous_scale='viridis'
-)
-
-fig_models.update_layout(
-    margin=dict(l=150, r=20, t=40, b=20),
-    yaxis={
-        'categoryorder': 'total descending',
-        'automargin': True
-    },
-    height=600,
-    xaxis_title="Number of Thefts",
-    yaxis_title="Vehicle Model"
-)
-
-fig_models.update_traces(marker_colorbar=dict(
-    title=dict(text='Number of Thefts'),
-    thickness=18,
-    len=0.75,
-    outlinewidth=1,
-    outlinecolor='rgba(128,128,128,0.3)'
-))
-
-st.plotly_chart(fig_models, width='stretch')
-
-st.subheader(" Vehicle Makes Analysis")
-col5, col6 = st.columns(2)
-
-with col5:
-    top_makes = (
-        df_filtered.groupby(['make_name', 'make_type'])
-        .size()
-        .reset_index(name='count')
-        .sort_values('count', ascending=False)
-        .head(15)
-    )
-    
-    fig = px.bar(
-        top_makes,
-        x='make_name',
-        y='count',
-        color='make_type',
-        title='Top 15 Most Stolen Vehicle Makes by Category',
-        barmode='group'
-    )
-    fig.update_layout(xaxis_tickangle=45, showlegend=True)
-    st.plotly_chart(fig, width='stretch')
-
-with col6:
-    make_type_counts = df_filtered['make_type'].value_counts()
-    if 'Unknown' in make_type_counts.index:
-        make_type_counts = make_type_counts[make_type_counts.index != 'Unknown']
-
-    fig = go.Figure(data=[go.Pie(
-        labels=make_type_counts.index,
-        values=make_type_counts.values,
-        hole=.7,
-        marker_colors=['#66b3ff', '#ff9999'][:len(make_type_counts)]
-    )])
-    fig.update_layout(
-        title='Luxury vs Standard Vehicle Thefts',
-        annotations=[dict(text='Vehicle<br>Types', x=0.5, y=0.5, font_size=20, showarrow=False)]
-    )
-    st.plotly_chart(fig, width='stretch')
-
-st.subheader(" Regional Theft Analysis")
-col3, col4 = st.columns(2)
-
-with col3:
-    location_counts = (
-        df_filtered['region']
-        .dropna()
-        .value_counts()
-        .head(10)
-        .reset_index()
-    )
-    location_counts.columns = ['region', 'theft_count']
-    
-    fig = px.bar(
-        location_counts,
-        x='region', 
-        y='theft_count',
-        title='Top 10 Locations for Vehicle Theft',
-        color='theft_count',
-        color_continuous_scale='viridis'
-    )
-    fig.update_layout(xaxis_tickangle=45)
-    st.plotly_chart(fig, width='stretch')
-
-with col4:
-    top_models = df_filtered['vehicle_desc'].value_counts().head(10).index
-    subset_df = df_filtered[df_filtered['vehicle_desc'].isin(top_models)]
-
-    fig = px.histogram(
-        subset_df,
-        x='region',
-        color='vehicle_desc',
-        title='Top 10 Stolen Vehicle Models by Region',
-        barmode='group'
-    )
-    fig.update_layout(
-        xaxis_tickangle=45,
-        legend_title="Vehicle Model",
-        showlegend=True
-    )
-    st.plotly_chart(fig, width='stretch')
-
-st.subheader(" Theft Trends Over Time")
-col_time1, col_time2 = st.columns(2)
-
-with col_time1:
-    df_filtered['date_stolen'] = pd.to_datetime(df_filtered['date_stolen'], errors='coerce')
-    quarterly_counts = (
-        df_filtered
-        .set_index('date_stolen')
-        .resample('Q')
-        .size()
-        .reset_index(name='theft_count')
-    )
-    quarterly_counts['quarter_label'] = quarterly_counts['date_stolen'].dt.to_period('Q').astype(str)
-    
-    fig = px.line(
-        quarterly_counts,
-        x='quarter_label',
-        y='theft_count',
-        title='Quarterly Vehicle Theft Trend',
-        markers=True
-    )
-    fig.update_layout(xaxis_tickangle=45)
-    st.plotly_chart(fig, width='stretch')
-
-with col_time2:
-    model_years = (
-        df_filtered['model_year']
-        .dropna()
-        .astype(int)
-        .value_counts()
-        .sort_index()
-        .reset_index()
-    )
-    model_years.columns = ['model_year', 'theft_count']
-
-    fig = px.line(
-        model_years,
-        x='model_year',
-        y='theft_count',
-        title='Number of Cars Stolen by Model Year',
-        markers=True
-    )
-    fig.update_layout(
-        xaxis_title="Model Year",
-        yaxis_title="Number of Thefts"
-    )
-    st.plotly_chart(fig, width='stretch')
-
-st.subheader(" Vehicle Demographics")
-col1, col2 = st.columns([1, 1])
-
-with col1:
-    st.markdown("#### Vehicle Colors Analysis")
-    color_counts = (
-        df_filtered['color']
-        .dropna()
-        .value_counts()
-        .reset_index()
-    )
-    color_counts.columns = ['color', 'theft_count']
-
-    fig_colors = px.bar(
-        color_counts,
-        x='color',
-        y='theft_count',
-        title='Total Count of Stolen Vehicles by Color',
-        labels={'color': 'Color', 'theft_count': 'Number of Thefts'},
-        color='theft_count',
-        color_continuous_scale='viridis',
-        template='plotly_white'
-    )
-    fig_colors.update_traces(hovertemplate="<b>%{x}</b><br>Thefts: %{y}<extra></extra>", marker=dict(showscale=True))
-    fig_colors.update_traces(marker_colorbar=dict(
-        title=dict(text='Number of Thefts'),
-        thickness=18,
-        len=0.75,
-        outlinewidth=1,
-        outlinecolor='rgba(128,128,128,0.3)'
-    ))
-    fig_colors.update_layout(
-        xaxis=dict(
-            tickangle=45,
-            title=dict(text='Color')
-        ),
-        yaxis=dict(
-            title=dict(text='Number of Thefts'),
-            gridcolor='rgba(128,128,128,0.2)'
-        ),
-        height=420,
-        margin=dict(t=40, l=10, r=10, b=40),
-        showlegend=False
-    )
-    fig_colors = create_themed_chart(fig_colors)
-    st.plotly_chart(fig_colors, width='stretch')
-
-with col2:
-    st.markdown("#### Top Vehicle Types")
-    type_counts = (
-        df_filtered['vehicle_type']
-        .dropna()
-        .value_counts()
-        .head(10)
-        .reset_index()
+def model_frames():
+    model_regions = selection.model_regions()
+    model_count = selection.model_count()
+    return model_regions, model_count
+
+@timed_fragment
+def models_section():
+    st.subheader(" Most Frequently Stolen Vehicle Models")
+
+    top_n = st.slider("Models shown", min_value=10, max_value=50, value=20, step=5, key="top_models_n")
+    model_regions, model_count = model_frames()
+    distinct_models = selection.distinct_models()
+    timer.lap('models', 'compute')
+    show_chart('models', models_figure(model_count, top_n))
+    if dataset.sketched:
+        st.caption(f"About {distinct_models:,} distinct models. Counts are sketch estimates and may run slightly high.")
+    else:
+        st.caption(f"{distinct_models:,} distinct models")
+
+@timed_fragment
+def makes_section():
+    st.subheader(" Vehicle Makes Analysis")
+    col5, col6 = st.columns(2)
+
+    with col5:
+        top_makes = selection.top_makes()
+        timer.lap('makes', 'compute')
+        show_chart('makes', top_makes_figure(top_makes))
+
+    with col6:
+        make_type_counts = selection.make_type_counts()
+        timer.lap('makes', 'compute')
+        show_chart('makes', make_type_figure(make_type_counts))
+
+@timed_fragment
+def regional_section():
+    st.subheader(" Regional Theft Analysis")
+    col3, col4 = st.columns(2)
+
+    with col3:
+        location_counts = selection.location_counts()
+        timer.lap('regional', 'compute')
+        show_chart('regional', location_figure(location_counts))
+
+    with col4:
+        model_regions, model_count = model_frames()
+        timer.lap('regional', 'compute')
+        show_chart('regional', model_region_figure(model_regions, model_count))
+
+@timed_fragment
+def density_section():
+    st.subheader(" Population Density Impact Analysis")
+
+    fit = selection.density_fit()
+    timer.lap('density', 'compute')
+    fig = selection.density_figure()
+    show_chart('density', fig)
+    summary = fit_summary(fit)
+    if summary:
+        st.caption(summary)
+
+@timed_fragment
+def per_capita_section():
+    col9, col10 = st.columns(2)
+
+    with col9:
+        st.subheader("Highest Per-Capita Theft Rates")
+        top5_formatted = selection.top5()
+        timer.lap('per_capita', 'compute')
+        show_chart('per_capita', rate_table_figure(top5_formatted, '#636EFA', 'rgba(99, 110, 250, 0.1)'))
+
+    with col10:
+        st.subheader("Lowest Per-Capita Theft Rates")
+        bottom5_formatted = selection.bottom5()
+        timer.lap('per_capita', 'compute')
+        show_chart('per_capita', rate_table_figure(bottom5_formatted, '#EF553B', 'rgba(239, 85, 59, 0.1)'))
+
+@timed_fragment
+def trends_section():
+    st.subheader(" Theft Trends Over Time")
+    col_time1, col_time2 = st.columns(2)
+
+    with col_time1:
+        quarter_counts = selection.quarterly_counts()
+        timer.lap('trends', 'compute')
+        show_chart('trends', quarterly_figure(quarter_counts))
+
+    with col_time2:
+        model_years = selection.model_year_counts()
+        timer.lap('trends', 'compute')
+        show_chart('trends', model_year_figure(model_years))
+
+@timed_fragment
+def forecast_section():
+    st.subheader(" Theft Forecast")
+    group = st.radio(
+        "Forecast by",
+        list(FORECAST_GROUPS),
+        format_func=FORECAST_GROUPS.get,
+        horizontal=True,
+        key="forecast_group"
     )
-    type_counts.columns = ['vehicle_type', 'theft_count']
-
-    fig_types = px.bar(
-        type_counts,
-        x='vehicle_type',
-        y='theft_count',
-        title='Top 10 Stolen Vehicle Types',
-        labels={'vehicle_type': 'Vehicle Type', 'theft_count': 'Number of Thefts'},
-        template='plotly_white',
-        color_discrete_sequence=[COLOR_SCHEME['primary'][0]]
+    fit = selection.forecast_fit()
+    result = selection.forecast()
+    timer.lap('forecast', 'compute')
+    if result is None:
+        st.info(f"No forecast: this needs at least {MIN_WEEKS} complete weeks of data.")
+        return
+    show_chart('forecast', forecast_figure(fit, result, group))
+    st.dataframe(forecast_table(result, group), width='stretch', hide_index=True)
+    model = "trend and quarter-of-year seasonality" if fit['seasonal'] else "trend"
+    st.caption(
+        f"Poisson {model} fitted to the {len(fit['weeks'])} complete weeks of the selection; "
+        f"ranges are 95% prediction intervals. The first quarter adds its weeks already observed to the projection."
     )
-    fig_types.update_traces(hovertemplate="<b>%{x}</b><br>Thefts: %{y}<extra></extra>")
-    fig_types.update_layout(
-        xaxis=dict(tickangle=45, title=dict(text='Vehicle Type')),
-        yaxis=dict(title=dict(text='Number of Thefts'), gridcolor='rgba(128,128,128,0.2)'),
-        height=420,
-        margin=dict(t=40, l=10, r=10, b=40),
-        showlegend=False
+    timer.lap('forecast', 'send')
+
+@timed_fragment
+def hotspot_section():
+    st.subheader(" Emerging Hotspots")
+    column = st.radio(
+        "Break down by",
+        list(HOTSPOT_COLUMNS),
+        format_func=HOTSPOT_COLUMNS.get,
+        horizontal=True,
+        key="hotspot_column"
     )
-    fig_types = create_themed_chart(fig_types)
-    st.plotly_chart(fig_types, width='stretch')
-
-st.subheader(" Vehicle Age Analysis")
-model_years = (
-    df_filtered['model_year']
-    .dropna()
-    .astype(int)
-    .value_counts()
-    .sort_index()
-    .reset_index()
-)
-df_filtered['vehicle_age'] = datetime.now().year - df_filtered['model_year']
-age_type_trend = (
-    df_filtered[(df_filtered['vehicle_age'] >= 0) & (df_filtered['vehicle_age'] < 100)]
-    .groupby(['vehicle_age', 'make_type'])
-    .size()
-    .reset_index(name='count')
-)
-
-fig = px.line(
-    age_type_trend,
-    x='vehicle_age',
-    y='count',
-    color='make_type',
-    title='Vehicle Age vs Theft Count by Type',
-    markers=True
-)
-fig.update_layout(
-    xaxis_title="Vehicle Age (years)",
-    yaxis_title="Number of Thefts"
-)
-st.plotly_chart(fig, width='stretch')
-
-st.subheader(" Vehicle Make & Color Distribution")
-col7, col8 = st.columns([2, 1])
-
-with col7:
-    maker_color_counts = (
-        df_filtered.groupby(['make_name', 'color'])
-        .size()
-        .reset_index(name='theft_count')
-    )
-    
-    top10_makers = df_filtered['make_name'].value_counts().head(10).index
-    filtered_data = maker_color_counts[maker_color_counts['make_name'].isin(top10_makers)]
-    
-    fig = px.bar(
-        filtered_data,
-        x='theft_count',
-        y='make_name',
-        color='color',
-        orientation='h',
-        title='Top 10 Vehicle Makers — Thefts by Color',
-        color_discrete_sequence=px.colors.qualitative.Set3,
-        barmode='stack'
-    )
-    
-    fig.update_layout(
-        showlegend=True,
-        legend_title="Vehicle Color",
-        yaxis={'categoryorder': 'total ascending'},
-        height=600
+    result = selection.hotspots(column)
+    timer.lap('hotspots', 'compute')
+    if result is None or result['hotspots'].empty:
+        st.info(
+            f"No hotspots: this needs {RECENT_WEEKS + BASELINE_WEEKS} complete weeks of data "
+            f"and a region with at least a few more thefts than usual."
+        )
+        return
+    show_chart('hotspots', hotspot_figure(result, column))
+    st.dataframe(hotspot_table(result, column), width='stretch', hide_index=True)
+    start, end = result['window']
+    st.caption(
+        f"{result['series']:,} region × {HOTSPOT_COLUMNS[column].lower()} series scored on the "
+        f"{RECENT_WEEKS} weeks from {start:%d %b} to {end:%d %b %Y} against the {BASELINE_WEEKS} weeks before. "
+        f"Surprise is −log10 of the Poisson probability of at least that many thefts."
     )
-    st.plotly_chart(fig, width='stretch')
-
-st.subheader(" Population Density Impact Analysis")
-
-region_thefts = df_filtered.groupby('region')['vehicle_id'].count().reset_index()
-region_thefts.rename(columns={'vehicle_id': 'theft_count'}, inplace=True)
-region_info = df_filtered[['region', 'population', 'density']].drop_duplicates()
-region_data = region_thefts.merge(region_info, on='region', how='left')
-corr_value = region_data['theft_count'].corr(region_data['density'])
-
-fig = px.scatter(
-    region_data,
-    x='density',
-    y='theft_count',
-    trendline="ols",
-    title=f'Correlation Between Vehicle Thefts and Population Density (r = {corr_value:.2f})',
-    color_discrete_sequence=['#636EFA'],
-    labels={
-        'density': 'Population Density',
-        'theft_count': 'Number of Thefts'
-    }
-)
-
-fig.update_traces(marker=dict(size=8, opacity=0.6))
-fig.update_layout(height=500)
-st.plotly_chart(fig, width='stretch')
-
-def clean_population(value):
-    if pd.isna(value):
-        return None
-    try:
-        return str(value).replace(',', '')
-    except:
-        return None
-
-region_data['population'] = pd.to_numeric(
-    region_data['population'].apply(clean_population), 
-    errors='coerce'
+    timer.lap('hotspots', 'send')
+
+@timed_fragment
+def age_section():
+    st.subheader(" Vehicle Age Analysis")
+    age_type_trend = selection.age_type_trend()
+    timer.lap('age', 'compute')
+    show_chart('age', age_figure(age_type_trend))
+
+@timed_fragment
+def demographics_section():
+    st.subheader(" Vehicle Demographics")
+    col1, col2 = st.columns([1, 1])
+
+    with col1:
+        st.markdown("#### Vehicle Colors Analysis")
+        color_counts = selection.color_counts()
+        timer.lap('demographics', 'compute')
+        show_chart('demographics', color_figure(color_counts))
+
+    with col2:
+        st.markdown("#### Top Vehicle Types")
+        type_counts = selection.type_counts()
+        timer.lap('demographics', 'compute')
+        show_chart('demographics', vehicle_type_figure(type_counts))
+
+@timed_fragment
+def make_color_section():
+    st.subheader(" Vehicle Make & Color Distribution")
+    col7, col8 = st.columns([2, 1])
+
+    with col7:
+        maker_color_counts = selection.maker_color_counts()
+        timer.lap('make_color', 'compute')
+        show_chart('make_color', make_color_figure(maker_color_counts, kpis['top10_makers']))
+
+# Each tab is a fragment, and only the open tab is computed and sent, so a
+# filter change costs one tab and a control inside a section reruns just
+# that section.
+models_tab, regions_tab, trends_tab, demographics_tab = st.tabs(
+    [" Models & Makes", " Regions", " Trends", " Demographics"],
+    key="section_tab",
+    on_change="rerun"
 )
+with models_tab:
+    if models_tab.open:
+        models_section()
+        makes_section()
+with regions_tab:
+    if regions_tab.open:
+        regional_section()
+        density_section()
+        per_capita_section()
+with trends_tab:
+    if trends_tab.open:
+        trends_section()
+        forecast_section()
+        hotspot_section()
+        age_section()
+with demographics_tab:
+    if demographics_tab.open:
+        demographics_section()
+        make_color_section()
 
-region_data['thefts_per_10k_pop'] = (region_data['theft_count'] / region_data['population']) * 10000
-
-def format_number(x):
-    if isinstance(x, (int, float)):
-        return f"{x:,.2f}" if x % 1 else f"{int(x):,}"
-    return str(x)
-
-col9, col10 = st.columns(2)
-
-with col9:
-    st.subheader("Highest Per-Capita Theft Rates")
-    top5 = region_data.nlargest(5, 'thefts_per_10k_pop')[
-        ['region', 'theft_count', 'thefts_per_10k_pop']
-    ]
-    
-    # Format the data
-    top5_formatted = top5.copy()
-    for col in top5_formatted.columns:
-        top5_formatted[col] = top5_formatted[col].apply(format_number)
-    
-    fig = go.Figure(data=[go.Table(
-        header=dict(
-            values=["Region", "Total Thefts", "Thefts per 10k"],
-            fill_color='#636EFA',
-            align='left',
-            font=dict(color='white', size=12)
-        ),
-        cells=dict(
-            values=[top5_formatted[k].tolist() for k in top5_formatted.columns],
-            fill_color=['rgba(99, 110, 250, 0.1)'] * len(top5_formatted),
-            align='left',
-            font=dict(size=11),
-            height=30
-        )
-    )])
-    fig.update_layout(
-        margin=dict(l=0, r=0, t=0, b=0),
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)'
-    )
-    st.plotly_chart(fig, width='stretch')
 
-with col10:
-    st.subheader("Lowest Per-Capita Theft Rates")
-    bottom5 = region_data.nsmallest(5, 'thefts_per_10k_pop')[
-        ['region', 'theft_count', 'thefts_per_10k_pop']
-    ]
-    
-    # Format the data
-    bottom5_formatted = bottom5.copy()
-    for col in bottom5_formatted.columns:
-        bottom5_formatted[col] = bottom5_formatted[col].apply(format_number)
-    
-    fig = go.Figure(data=[go.Table(
-        header=dict(
-            values=["Region", "Total Thefts", "Thefts per 10k"],
-            fill_color='#EF553B',
-            align='left',
-            font=dict(color='white', size=12)
-        ),
-        cells=dict(
-            values=[bottom5_formatted[k].tolist() for k in bottom5_formatted.columns],
-            fill_color=['rgba(239, 85, 59, 0.1)'] * len(bottom5_formatted),
-            align='left',
-            font=dict(size=11),
-            height=30
-        )
-    )])
-    fig.update_layout(
-        margin=dict(l=0, r=0, t=0, b=0),
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)'
+with st.sidebar:
+    st.markdown("---")
+    st.markdown("###  Result Cache")
+    cache_stats = result_cache.stats()
+    st.markdown(
+        f"**Hits:** {cache_stats['hits']:,} · **Misses:** {cache_stats['misses']:,} "
+        f"({cache_stats['hit_rate']:.0%} hit rate)"
     )
-    st.plotly_chart(fig, width='stretch')
+    st.markdown(f"**Entries:** {cache_stats['entries']:,} / {result_cache.max_entries:,} · **Evictions:** {cache_stats['evictions']:,}")
+
+timing_record = timer.record(filters=canonical_filters(st.session_state.filters))
+if profiler is not None:
+    profile_path, profile_summary = finish_profile(profiler)
+    st.session_state['last_profile'] = (profile_path, profile_summary)
+    timing_record['profile'] = profile_path
+if INSTRUMENTED:
+    append_log(timing_record)
+else:
+    # The selections opened are logged either way: warmup.py --top warms the
+    # most used ones.
+    append_log({'timestamp': timing_record['timestamp'], 'filters': timing_record['filters']})
+
+if DEBUG_PANEL:
+    with st.sidebar:
+        st.markdown("---")
+        st.markdown("###  Render Timings")
+        st.caption(f"This rerun: {timing_record['total_ms']:,.0f} ms (compute / figure / send, ms)")
+        st.dataframe(timer.table().round(1), width='stretch')
+        payloads = timer.payload_table()
+        st.caption(f"Figure payloads: {payloads['KB'].sum():,.1f} KB")
+        st.dataframe(payloads.round(1), width='stretch', hide_index=True)
+        if st.button("Profile next rerun"):
+            st.session_state['profile_next_rerun'] = True
+            st.rerun()
+        if 'last_profile' in st.session_state:
+            profile_path, profile_summary = st.session_state['last_profile']
+            with st.expander(f"cProfile: {profile_path}"):
+                st.code(profile_summary)
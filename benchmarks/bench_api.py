@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+import numpy as np
+
+from api import ENDPOINTS
+from benchmarks.bench_filters import SELECTIONS
+from benchmarks.synthetic import write_synthetic_csv
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def request_paths():
+    # Every endpoint under every representative selection.
+    paths = []
+    for filters in SELECTIONS.values():
+        params = [(key, value) for key, values in filters.items() if key != 'date_range' for value in values]
+        if 'date_range' in filters:
+            params.append(('date_range', ','.join(str(day) for day in filters['date_range'])))
+        query = urlencode(params)
+        paths.extend(f'{endpoint}?{query}' if query else endpoint for endpoint in ENDPOINTS)
+    return paths
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def fetch(reader, writer, path):
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding: gzip\r\n\r\n'.encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status, length
+
+
+async def client(port, queue, latencies, sizes):
+    # One keep-alive connection taking paths off the shared queue.
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        while not queue.empty():
+            path = queue.get_nowait()
+            started = time.perf_counter()
+            status, length = await fetch(reader, writer, path)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                raise RuntimeError(f'{path} returned {status}')
+            sizes.append(length)
+    finally:
+        writer.close()
+
+
+async def run_phase(port, paths, concurrency):
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+    latencies, sizes = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, queue, latencies, sizes) for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': max(latencies),
+        'requests_per_s': len(latencies) / seconds,
+        'mean_kb': float(np.mean(sizes)) / 1024
+    }
+
+
+def wait_until_ready(server, port, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('The server exited during start-up')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('The server did not start in time')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the JSON API with concurrent keep-alive clients.')
+    parser.add_argument('--rows', type=int, help='Serve this many synthetic rows instead of the bundled CSV')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=5000, help='Requests in the warm phase')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--out', default='bench_api.json')
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as work_dir:
+        # The server runs from the directory holding the data, so a synthetic
+        # CSV stands in for the bundled one.
+        data_dir = REPO_DIR
+        if args.rows:
+            data_dir = work_dir
+            write_synthetic_csv(os.path.join(work_dir, 'stolen_vehicles_enhanced.csv'), args.rows)
+        env = dict(os.environ, THEFT_WARM_CACHE=os.path.join(work_dir, 'none.pkl'))
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(REPO_DIR, 'api.py'), '--port', str(port), '--threads', str(args.threads)],
+            cwd=data_dir, env=env, stdout=subprocess.DEVNULL
+        )
+        try:
+            wait_until_ready(server, port)
+            paths = request_paths()
+            # Cold: every path once, so each request computes its selection.
+            # Warm: a random mix of the same paths, served from the cache.
+            cold = asyncio.run(run_phase(port, paths, args.concurrency))
+            warm = asyncio.run(run_phase(port, random.Random(0).choices(paths, k=args.requests), args.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+
+    report = {'rows': args.rows, 'concurrency': args.concurrency, 'threads': args.threads, 'cold': cold, 'warm': warm}
+    for phase in ['cold', 'warm']:
+        result = report[phase]
+        print(
+            f"{phase:<6}{result['requests']:>7,} requests  p50 {result['p50_ms']:>7.1f} ms  p99 {result['p99_ms']:>7.1f} ms  "
+            f"max {result['max_ms']:>7.1f} ms  {result['requests_per_s']:>8,.0f} req/s  {result['mean_kb']:>6.1f} KB"
+        )
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.bench_engines import LOADERS
+from benchmarks.bench_filters import SELECTIONS, best_of
+from benchmarks.synthetic import write_synthetic_csv
+from charts import build_density_figure, compute_kpis, compute_region_data, density_fit, format_rate_table
+from cube import age_type_counts, count_by, model_year_counts, quarterly_counts
+from forecast import fit_forecasts
+from hotspots import detect_hotspots
+
+# The aggregation behind each dashboard chart, as app.py computes it from
+# the cube cells and the model-by-region counts.
+CHART_STEPS = {
+    'kpis': lambda data, cells, models: compute_kpis(data.regions, cells),
+    'model_count': lambda data, cells, models: count_by(models, 'vehicle_desc'),
+    'top_makes': lambda data, cells, models: count_by(cells, ['make_name', 'make_type']).head(15),
+    'make_type_counts': lambda data, cells, models: count_by(cells, 'make_type'),
+    'location_counts': lambda data, cells, models: count_by(cells, 'region').head(10),
+    'quarterly_counts': lambda data, cells, models: quarterly_counts(cells),
+    'model_year_counts': lambda data, cells, models: model_year_counts(cells),
+    'color_counts': lambda data, cells, models: count_by(cells, 'color'),
+    'type_counts': lambda data, cells, models: count_by(cells, 'vehicle_type').head(10),
+    'age_type_trend': lambda data, cells, models: age_type_counts(cells, datetime.date.today().year),
+    'maker_color_counts': lambda data, cells, models: count_by(cells, ['make_name', 'color']).sort_index(),
+    'density_figure': lambda data, cells, models: density_figure(compute_region_data(data.regions, cells)),
+    'rate_tables': lambda data, cells, models: format_rate_table(compute_region_data(data.regions, cells).nlargest(5, 'thefts_per_10k_pop'))
+}
+
+
+def density_figure(region_data):
+    return build_density_figure(region_data, density_fit(region_data)).to_dict()
+
+
+def environment():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = ''
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': revision,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'cpu_count': os.cpu_count()
+    }
+
+
+def run_size(n_rows, engine, repeat, work_dir):
+    csv_path = os.path.join(work_dir, f'thefts_{n_rows}.csv')
+    if not os.path.exists(csv_path):
+        write_synthetic_csv(csv_path, n_rows)
+    start = time.perf_counter()
+    dataset = LOADERS[engine](csv_path, work_dir)
+    result = {'rows': n_rows, 'load_ms': (time.perf_counter() - start) * 1000, 'selections': {}}
+
+    for name, filters in SELECTIONS.items():
+        cells = dataset.cells(filters)
+        models = dataset.model_region_counts(filters)
+        timings = {
+            'cells_ms': best_of(lambda: dataset.cells(filters), repeat) * 1000,
+            'model_counts_ms': best_of(lambda: dataset.model_region_counts(filters), repeat) * 1000
+        }
+        if hasattr(dataset, 'rows'):
+            timings['filter_ms'] = best_of(lambda: dataset.rows(filters), repeat) * 1000
+        span = filters.get('date_range') or dataset.date_bounds()
+        timings['hotspots_ms'] = best_of(
+            lambda: detect_hotspots(dataset.weekly_counts(filters, 'make_name'), 'make_name', *span), repeat
+        ) * 1000
+        timings['forecast_ms'] = best_of(
+            lambda: fit_forecasts(dataset.weekly_counts(filters, 'make_type'), *span), repeat
+        ) * 1000
+        for step, compute in CHART_STEPS.items():
+            timings[f'{step}_ms'] = best_of(lambda: compute(dataset, cells, models), repeat) * 1000
+        result['selections'][name] = {'matches': int(cells['count'].sum()), 'timings': timings}
+    return result
+
+
+def regressions(report, baseline, tolerance, floor_ms):
+    # Timings below floor_ms are too noisy to compare.
+    found = []
+    previous = {size['rows']: size for size in baseline['sizes']}
+    for size in report['sizes']:
+        before = previous.get(size['rows'])
+        if before is None:
+            continue
+        pairs = [('load_ms', size['load_ms'], before['load_ms'])]
+        for name, selection in size['selections'].items():
+            old = before['selections'].get(name, {}).get('timings', {})
+            pairs.extend(
+                (f'{name}/{key}', value, old[key])
+                for key, value in selection['timings'].items() if key in old
+            )
+        found.extend(
+            f"{size['rows']:,} rows {key}: {old:.1f} -> {new:.1f} ms"
+            for key, new, old in pairs if new > floor_ms and new > old * tolerance
+        )
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time loading, filtering and every chart aggregation on synthetic data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--engine', choices=list(LOADERS), default='memory')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', help='Keep the generated CSVs here for reuse between runs')
+    parser.add_argument('--out', default='bench_report.json')
+    parser.add_argument('--baseline', help='Earlier report to compare against; exits non-zero on regressions')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    parser.add_argument('--floor-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = args.data_dir or tmp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        report = {'environment': environment(), 'engine': args.engine, 'repeat': args.repeat, 'sizes': []}
+        for n_rows in args.rows:
+            size = run_size(n_rows, args.engine, args.repeat, work_dir)
+            report['sizes'].append(size)
+            print(f"{n_rows:,} rows: load {size['load_ms']:.0f} ms")
+            for name, selection in size['selections'].items():
+                slowest = max(selection['timings'].items(), key=lambda item: item[1])
+                total = sum(selection['timings'].values())
+                print(f"  {name:<22}{total:>10.1f} ms total, slowest {slowest[0]} {slowest[1]:.1f} ms")
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance, args.floor_ms)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.bench_filters import SELECTIONS, best_of
+from benchmarks.synthetic import synthetic_frame
+from dataset import load_dataset
+from sql_engine import load_sql_dataset
+from streaming import load_streaming_dataset
+
+LOADERS = {
+    'memory': lambda csv_path, work_dir: load_dataset(
+        csv_path, os.path.join(work_dir, 'none.feather'), os.path.join(work_dir, 'deltas')
+    ),
+    'streaming': lambda csv_path, work_dir: load_streaming_dataset(
+        csv_path, os.path.join(work_dir, 'none.feather'), os.path.join(work_dir, 'deltas')
+    ),
+    'sql': lambda csv_path, work_dir: load_sql_dataset(
+        csv_path, os.path.join(work_dir, 'thefts.sqlite'), os.path.join(work_dir, 'deltas')
+    )
+}
+
+
+def measure(engine, csv_path, work_dir, repeat):
+    # Runs in a fresh process so that peak RSS belongs to this engine alone.
+    start = time.perf_counter()
+    dataset = LOADERS[engine](csv_path, work_dir)
+    load = time.perf_counter() - start
+    timings = {}
+    for name, filters in SELECTIONS.items():
+        timings[name] = best_of(lambda: (dataset.cells(filters), dataset.model_region_counts(filters)), repeat)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return load, timings, peak
+
+
+def run(n_rows, engines, repeat):
+    with tempfile.TemporaryDirectory() as work_dir:
+        csv_path = os.path.join(work_dir, 'thefts.csv')
+        synthetic_frame(n_rows).to_csv(csv_path, index=False, date_format='%Y-%m-%d')
+        results = {}
+        for engine in engines:
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                results[engine] = pool.submit(measure, engine, csv_path, work_dir, repeat).result()
+
+    print(f"{n_rows:,} rows, cells + model counts per selection (ms)")
+    print(f"{'':<22}" + ''.join(f"{engine:>12}" for engine in engines))
+    print(f"{'load (s)':<22}" + ''.join(f"{results[engine][0]:>12.1f}" for engine in engines))
+    print(f"{'peak RSS (MB)':<22}" + ''.join(f"{results[engine][2] / 1e6:>12.0f}" for engine in engines))
+    for name in SELECTIONS:
+        print(f"{name:<22}" + ''.join(f"{results[engine][1][name] * 1000:>12.1f}" for engine in engines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare load time, peak memory and query latency of the dataset engines.')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--engines', nargs='+', choices=list(LOADERS), default=list(LOADERS))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.engines, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
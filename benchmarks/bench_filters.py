@@ -0,0 +1,82 @@
+import argparse
+import datetime
+import gc
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_frame
+from filter_index import FilterIndex
+
+SELECTIONS = {
+    'no filters': {},
+    'one region': {'regions': ['Auckland']},
+    'makes + colour': {'makes': ['Toyota', 'Mazda'], 'colors': ['Silver']},
+    'type + two regions': {'types': ['Saloon'], 'regions': ['Wellington', 'Canterbury']},
+    'luxury only': {'make_types': ['Luxury']},
+    'date range + region': {
+        'date_range': (datetime.date(2022, 1, 1), datetime.date(2022, 2, 28)),
+        'regions': ['Auckland']
+    }
+}
+
+
+def legacy_apply_filters(df, filters):
+    # apply_filters() as it was before the index, minus st.session_state.
+    filtered_df = df.copy()
+    if filters.get('date_range') and len(filters['date_range']) == 2:
+        start_date, end_date = filters['date_range']
+        filtered_df = filtered_df[
+            (filtered_df['date_stolen'].dt.date >= start_date) &
+            (filtered_df['date_stolen'].dt.date <= end_date)
+        ]
+    if filters.get('makes'):
+        filtered_df = filtered_df[filtered_df['make_name'].isin(filters['makes'])]
+    if filters.get('types'):
+        filtered_df = filtered_df[filtered_df['vehicle_type'].isin(filters['types'])]
+    if filters.get('colors'):
+        filtered_df = filtered_df[filtered_df['color'].isin(filters['colors'])]
+    if filters.get('regions'):
+        filtered_df = filtered_df[filtered_df['region'].isin(filters['regions'])]
+    if filters.get('make_types'):
+        filtered_df = filtered_df[filtered_df['make_type'].isin(filters['make_types'])]
+    return filtered_df
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(sizes, repeat):
+    for n_rows in sizes:
+        df = synthetic_frame(n_rows)
+        start = time.perf_counter()
+        index = FilterIndex(df)
+        build = time.perf_counter() - start
+        print(f"\n{n_rows:,} rows — index build {build * 1000:.1f} ms, {index.nbytes() / 1e6:.1f} MB")
+        print(f"{'selection':<22}{'matches':>12}{'legacy ms':>12}{'select ms':>12}{'+ take ms':>12}{'speedup':>9}")
+        for name, filters in SELECTIONS.items():
+            legacy = best_of(lambda: legacy_apply_filters(df, filters), repeat)
+            select = best_of(lambda: index.select(filters), repeat)
+            indexed = best_of(lambda: df.iloc[index.select(filters)], repeat)
+            matches = len(np.arange(n_rows)[index.select(filters)])
+            print(f"{name:<22}{matches:>12,}{legacy * 1000:>12.2f}{select * 1000:>12.2f}"
+                  f"{indexed * 1000:>12.2f}{legacy / indexed:>8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare apply_filters() with the posting-list filter index.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
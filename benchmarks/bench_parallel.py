@@ -0,0 +1,56 @@
+import argparse
+import datetime
+import os
+
+from benchmarks.bench_filters import best_of
+from benchmarks.synthetic import synthetic_frame
+from cube import build_cube, count_by, quarterly_counts
+from filter_index import FilterIndex
+from parallel import get_pool, parallel_cube
+
+DATE_RANGE = {'date_range': (datetime.date(2021, 12, 1), datetime.date(2022, 3, 31))}
+
+
+def worker_counts(max_workers):
+    counts, workers = [], 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    return counts + [max_workers]
+
+
+def run(n_rows, max_workers, repeat):
+    df = synthetic_frame(n_rows)
+    index = FilterIndex(df)
+    workloads = {
+        'full cube': index.rows['region'],
+        'date range cube': index.select(DATE_RANGE)
+    }
+    reference = {name: build_cube(df.iloc[rows]) for name, rows in workloads.items()}
+    print(f"{n_rows:,} rows, {os.cpu_count()} cores visible")
+    print(f"{'workload':<18}{'rows':>12}" + ''.join(f"{f'{w} ms':>10}" for w in worker_counts(max_workers)) + f"{'speedup':>9}")
+    for name, rows in workloads.items():
+        timings = []
+        for workers in worker_counts(max_workers):
+            if workers > 1:
+                # Worker start-up is paid once per process, not per query.
+                get_pool(workers).submit(int).result()
+            cells = parallel_cube(df, rows, workers)
+            assert count_by(cells, 'region').equals(count_by(reference[name], 'region'))
+            assert quarterly_counts(cells).equals(quarterly_counts(reference[name]))
+            timings.append(best_of(lambda: parallel_cube(df, rows, workers), repeat))
+        print(f"{name:<18}{len(rows):>12,}" + ''.join(f"{t * 1000:>10.0f}" for t in timings)
+              + f"{timings[0] / min(timings):>8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cube aggregation speed-up from 1 to N worker processes.')
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.rows, args.workers, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
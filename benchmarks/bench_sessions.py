@@ -0,0 +1,382 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.bench_api import free_port, wait_until_ready
+from benchmarks.bench_dashboard import environment
+from benchmarks.synthetic import write_synthetic_csv
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each session is a headless browser tab: a websocket client speaking the
+# Streamlit protocol to a `streamlit run` server, so the reruns go through
+# the same server, session state and caches as for real users. Sessions
+# pick a tab, then alternate think time with one sidebar action and wait for
+# the rerun it triggers to finish.
+MULTISELECT_FILTERS = ['Make', 'Vehicle Type', 'Color', 'Region']
+DATE_FILTER = 'Theft date'
+RESET_BUTTON = 'Reset All Filters'
+ACTIONS = {'add': 0.5, 'remove': 0.15, 'date': 0.25, 'reset': 0.1}
+MAX_PICKS = 3
+PERCENTILES = [50, 90, 95, 99]
+SAMPLE_SECONDS = 0.2
+LOAD_KEYS = ['rows', 'engine', 'sessions', 'actions', 'think_s', 'ramp_s', 'seed']
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+class Session:
+
+    def __init__(self, ws, rng):
+        self.ws = ws
+        self.rng = rng
+        self.page_hash = ''
+        self.widgets = {}
+        self.tab_id = None
+        self.tabs = []
+        # Like the frontend, the session sends every widget value it has set
+        # with each rerun; widgets it never touched keep their defaults.
+        self.values = {}
+        self.reruns = []
+        self.errors = []
+
+    def widget_states(self, trigger):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = ''
+        msg.rerun_script.page_script_hash = self.page_hash
+        states = msg.rerun_script.widget_states.widgets
+        for widget_id, value in self.values.items():
+            state = states.add()
+            state.id = widget_id
+            if isinstance(value, str):
+                state.string_value = value
+            else:
+                state.string_array_value.data.extend(value)
+        if trigger:
+            state = states.add()
+            state.id = trigger
+            state.trigger_value = True
+        return msg.SerializeToString()
+
+    def read(self, msg):
+        # Records the widgets of the page as they are rendered; an app
+        # exception is an element too.
+        kind = msg.WhichOneof('type')
+        if kind == 'new_session':
+            self.page_hash = msg.new_session.page_script_hash
+        elif kind == 'delta' and msg.delta.WhichOneof('type') == 'new_element':
+            element = msg.delta.new_element
+            element_type = element.WhichOneof('type')
+            if element_type in ('multiselect', 'date_input', 'button'):
+                widget = getattr(element, element_type)
+                self.widgets[widget.label] = widget
+            elif element_type == 'exception':
+                self.errors.append(f'{element.exception.type}: {element.exception.message}')
+        elif kind == 'delta' and msg.delta.WhichOneof('type') == 'add_block':
+            block = msg.delta.add_block
+            if block.WhichOneof('type') == 'tab_container':
+                self.tab_id = block.tab_container.id
+            elif block.WhichOneof('type') == 'tab' and block.tab.label not in self.tabs:
+                self.tabs.append(block.tab.label)
+
+    async def rerun(self, action, trigger=None):
+        # A rerun ends with the first script run that is not cut short by
+        # st.rerun(), so a reset counts both of its runs.
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        started = time.perf_counter()
+        errors = len(self.errors)
+        await self.ws.send(self.widget_states(trigger))
+        received = 0
+        while True:
+            data = await self.ws.recv()
+            received += len(data)
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            self.read(msg)
+            if msg.WhichOneof('type') == 'script_finished' and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                break
+        self.reruns.append({'action': action, 'ms': (time.perf_counter() - started) * 1000, 'bytes': received})
+        # An error is reported with the widget values that caused it.
+        state = {label: self.values[widget.id] for label, widget in self.widgets.items() if widget.id in self.values}
+        self.errors[errors:] = [f'{error} after {action} with {json.dumps(state)}' for error in self.errors[errors:]]
+
+    async def act(self):
+        filters = [self.widgets[label] for label in MULTISELECT_FILTERS if label in self.widgets]
+        picked = [widget for widget in filters if self.values.get(widget.id)]
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        if action == 'remove' and not picked:
+            action = 'add'
+        if action == 'add':
+            widget = self.rng.choice(filters)
+            current = list(self.values.get(widget.id, []))
+            choices = [option for option in widget.options if option not in current]
+            if len(current) >= MAX_PICKS or not choices:
+                current.pop(self.rng.randrange(len(current)))
+            else:
+                current.append(self.rng.choice(choices))
+            self.values[widget.id] = current
+        elif action == 'remove':
+            widget = self.rng.choice(picked)
+            current = list(self.values[widget.id])
+            current.pop(self.rng.randrange(len(current)))
+            self.values[widget.id] = current
+        elif action == 'date':
+            # A range of two to twelve weeks, or back to the full span.
+            widget = self.widgets[DATE_FILTER]
+            first, last = datetime.date.fromisoformat(widget.min), datetime.date.fromisoformat(widget.max)
+            if self.rng.random() < 0.25:
+                self.values[widget.id] = [first.isoformat(), last.isoformat()]
+            else:
+                length = min(self.rng.randint(14, 84), (last - first).days)
+                start = first + datetime.timedelta(days=self.rng.randint(0, (last - first).days - length))
+                self.values[widget.id] = [start.isoformat(), (start + datetime.timedelta(days=length)).isoformat()]
+        if action == 'reset':
+            await self.rerun(action, self.widgets[RESET_BUTTON].id)
+            # The reset drops the filter widgets' state; the page comes back
+            # with the defaults, which the frontend then holds.
+            self.values = {key: value for key, value in self.values.items() if key == self.tab_id}
+        else:
+            await self.rerun(action)
+
+
+async def run_session(url, rng, actions, think_seconds, delay):
+    import websockets
+
+    await asyncio.sleep(delay)
+    async with websockets.connect(url, subprotocols=['streamlit'], max_size=None) as ws:
+        session = Session(ws, rng)
+        await session.rerun('load')
+        if session.tab_id and session.tabs:
+            session.values[session.tab_id] = rng.choice(session.tabs)
+            await session.rerun('tab')
+        for _ in range(actions):
+            if think_seconds:
+                await asyncio.sleep(rng.expovariate(1 / think_seconds))
+            await session.act()
+    return session
+
+
+async def run_sessions(url, n_sessions, actions, think_seconds, ramp_seconds, seed):
+    sessions = await asyncio.gather(*(
+        run_session(url, random.Random(seed + i), actions, think_seconds, ramp_seconds * i / n_sessions)
+        for i in range(n_sessions)
+    ), return_exceptions=True)
+    failed = [f'{type(s).__name__}: {s}' for s in sessions if isinstance(s, BaseException)]
+    return [s for s in sessions if not isinstance(s, BaseException)], failed
+
+
+def process_tree(pid):
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def tree_usage(pid):
+    # Resident bytes and CPU ticks of the server and its worker processes.
+    rss = ticks = 0
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{current}/statm') as f:
+                pages = int(f.read().split()[1])
+        except OSError:
+            continue
+        ticks += int(fields[11]) + int(fields[12])
+        rss += pages * os.sysconf('SC_PAGE_SIZE')
+    return rss, ticks
+
+
+class ResourceSampler(threading.Thread):
+    # Samples the server on its own thread, so a busy event loop in the
+    # clients does not skip samples. Linux only.
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.samples = []
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.is_set():
+            self.samples.append((time.monotonic(), *tree_usage(self.pid)))
+            self.done.wait(SAMPLE_SECONDS)
+        self.samples.append((time.monotonic(), *tree_usage(self.pid)))
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        times, rss, ticks = (np.array(column, dtype=np.float64) for column in zip(*self.samples))
+        cpu = np.diff(ticks) / CLOCK_TICKS / np.diff(times) * 100
+        return {
+            'peak_rss_mb': rss.max() / 1e6,
+            'final_rss_mb': rss[-1] / 1e6,
+            'cpu_seconds': (ticks[-1] - ticks[0]) / CLOCK_TICKS,
+            'mean_cpu_percent': (ticks[-1] - ticks[0]) / CLOCK_TICKS / (times[-1] - times[0]) * 100,
+            'peak_cpu_percent': float(cpu.max()) if len(cpu) else 0.0
+        }
+
+
+def latency_summary(reruns):
+    ms = np.array([rerun['ms'] for rerun in reruns])
+    summary = {'reruns': len(ms)}
+    if not len(ms):
+        return summary
+    summary.update({f'p{p}_ms': float(np.percentile(ms, p)) for p in PERCENTILES})
+    summary['max_ms'] = float(ms.max())
+    summary['mean_kb'] = float(np.mean([rerun['bytes'] for rerun in reruns])) / 1024
+    return summary
+
+
+def regressions(report, baseline, tolerance, floor_ms):
+    # Latencies below floor_ms are too noisy to compare.
+    pairs = [
+        (f'{scope} {key}', report_scope[key], baseline_scope[key])
+        for scope, report_scope, baseline_scope in [('all', report['latency'], baseline['latency'])] + [
+            (action, summary, baseline['by_action'][action])
+            for action, summary in report['by_action'].items() if action in baseline['by_action']
+        ]
+        for key in [f'p{p}_ms' for p in PERCENTILES] if key in report_scope and key in baseline_scope
+    ]
+    found = [
+        f"{key}: {old:.1f} -> {new:.1f} ms" for key, new, old in pairs if new > floor_ms and new > old * tolerance
+    ]
+    new_rss, old_rss = report['server']['peak_rss_mb'], baseline['server']['peak_rss_mb']
+    if new_rss > old_rss * tolerance:
+        found.append(f"peak RSS: {old_rss:.0f} -> {new_rss:.0f} MB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test app.py with concurrent headless browser sessions.')
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--actions', type=int, default=10, help='Sidebar actions per session')
+    parser.add_argument('--think', type=float, default=2.0, help='Mean seconds between actions; 0 for none')
+    parser.add_argument('--ramp', type=float, default=10.0, help='Seconds over which the sessions connect')
+    parser.add_argument('--rows', type=int, help='Serve this many synthetic rows instead of the bundled CSV')
+    parser.add_argument('--engine', help='THEFT_ENGINE for the server')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench_sessions.json')
+    parser.add_argument('--baseline', help='Earlier report to compare against; exits non-zero on regressions')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    parser.add_argument('--floor-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as work_dir:
+        # As in bench_api, the server runs from the directory holding the
+        # data and without a warm cache file.
+        data_dir = REPO_DIR
+        if args.rows:
+            data_dir = work_dir
+            write_synthetic_csv(os.path.join(work_dir, 'stolen_vehicles_enhanced.csv'), args.rows)
+        env = dict(os.environ, THEFT_WARM_CACHE=os.path.join(work_dir, 'none.pkl'))
+        if args.engine:
+            env['THEFT_ENGINE'] = args.engine
+        server = subprocess.Popen(
+            [
+                sys.executable, '-m', 'streamlit', 'run', os.path.join(REPO_DIR, 'app.py'), '--server.headless', 'true',
+                '--server.port', str(port), '--browser.gatherUsageStats', 'false'
+            ],
+            cwd=data_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_until_ready(server, port)
+            url = f'ws://127.0.0.1:{port}/_stcore/stream'
+            # One session loads the data first, so the cold start is reported
+            # on its own and not as the tail of every other session's latency.
+            first, failed = asyncio.run(run_sessions(url, 1, 0, 0, 0, args.seed - 1))
+            if failed:
+                raise RuntimeError(f'The first session failed: {failed[0]}')
+            first_load_ms = first[0].reruns[0]['ms']
+            idle_rss_mb = tree_usage(server.pid)[0] / 1e6
+            sampler = ResourceSampler(server.pid)
+            sampler.start()
+            started = time.perf_counter()
+            sessions, failed = asyncio.run(
+                run_sessions(url, args.sessions, args.actions, args.think, args.ramp, args.seed)
+            )
+            seconds = time.perf_counter() - started
+            usage = sampler.stop()
+        finally:
+            server.terminate()
+            server.wait()
+
+    reruns = [rerun for session in sessions for rerun in session.reruns]
+    errors = [error for session in sessions for error in session.errors] + failed
+    report = {
+        'environment': environment(),
+        'rows': args.rows,
+        'engine': args.engine or os.environ.get('THEFT_ENGINE'),
+        'sessions': args.sessions,
+        'actions': args.actions,
+        'think_s': args.think,
+        'ramp_s': args.ramp,
+        'seed': args.seed,
+        'first_load_ms': first_load_ms,
+        'duration_s': seconds,
+        'reruns_per_s': len(reruns) / seconds,
+        'latency': latency_summary(reruns),
+        'by_action': {
+            action: latency_summary([rerun for rerun in reruns if rerun['action'] == action])
+            for action in ['load', 'tab', *ACTIONS]
+        },
+        'server': {'idle_rss_mb': idle_rss_mb, **usage},
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:10]
+    }
+
+    print(f"{args.sessions} sessions, {len(reruns):,} reruns in {seconds:.1f} s, first load {first_load_ms:,.0f} ms")
+    print(f"{'':<8}{'reruns':>8}" + ''.join(f"{f'p{p}':>9}" for p in PERCENTILES) + f"{'max':>9}{'KB':>8}")
+    for name, summary in [('all', report['latency']), *report['by_action'].items()]:
+        if summary['reruns']:
+            print(
+                f"{name:<8}{summary['reruns']:>8,}" + ''.join(f"{summary[f'p{p}_ms']:>9.0f}" for p in PERCENTILES) +
+                f"{summary['max_ms']:>9.0f}{summary['mean_kb']:>8.0f}"
+            )
+    server_usage = report['server']
+    print(
+        f"server: RSS {server_usage['idle_rss_mb']:.0f} MB idle, {server_usage['peak_rss_mb']:.0f} MB peak; "
+        f"CPU {server_usage['mean_cpu_percent']:.0f}% mean, {server_usage['peak_cpu_percent']:.0f}% peak, "
+        f"{server_usage['cpu_seconds']:.1f} s"
+    )
+    for error in report['error_samples']:
+        print(f"ERROR {error}")
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # Latencies only compare under the same load.
+        differs = [key for key in LOAD_KEYS if baseline.get(key) != report[key]]
+        if differs:
+            print(f"NOTE the baseline was run with different {', '.join(differs)}")
+        found = regressions(report, baseline, args.tolerance, args.floor_ms)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
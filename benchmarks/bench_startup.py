@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_dashboard import environment
+
+# Time to first render of a cold session: the KPIs are on screen once the
+# script has sent them, so the target covers interpreter start, imports,
+# loading the dataset and the KPI block.
+TARGET_FIRST_RENDER_MS = 3000
+APP_MODULES = ['charts', 'cube', 'engines', 'filter_index', 'profiling', 'result_cache']
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+# Runs in a fresh interpreter, so nothing is imported or cached yet.
+FIRST_RENDER_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=600).run()
+run_ms = (time.perf_counter() - started) * 1000
+if at.exception:
+    sys.exit(at.exception[0].message)
+print(json.dumps({"run_ms": run_ms}))
+'''
+
+
+def import_profile(top):
+    # -X importtime reports each module's own and cumulative import time in
+    # microseconds, nested by indentation; streamlit is imported first, as
+    # in a served session, so only what the app adds is charged to it.
+    code = 'import streamlit; ' + '; '.join(f'import {module}' for module in APP_MODULES)
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True
+    ).stderr
+    rows = [IMPORT_LINE.match(line) for line in stderr.splitlines()]
+    rows = [(int(own), int(total), len(indent), name) for own, total, indent, name in (row.groups() for row in rows if row)]
+    streamlit_at = next(i for i, row in enumerate(rows) if row[3] == 'streamlit' and row[2] == 1)
+    app_rows = [row for row in rows[streamlit_at + 1:] if row[2] == 1]
+    packages = {}
+    for own, total, depth, name in rows[streamlit_at + 1:]:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + own
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        'streamlit_ms': rows[streamlit_at][1] / 1000,
+        'app_imports_ms': sum(total for _, total, _, _ in app_rows) / 1000,
+        'modules': {name: total / 1000 for _, total, _, name in app_rows},
+        'heaviest_packages': {name: own / 1000 for name, own in heaviest}
+    }
+
+
+def first_render():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = os.path.join(tmp_dir, 'timings.jsonl')
+        env = dict(os.environ, THEFT_TIMINGS_LOG=log_path)
+        result = subprocess.run(
+            [sys.executable, '-c', FIRST_RENDER_SCRIPT], capture_output=True, text=True, env=env, check=True
+        )
+        run_ms = json.loads(result.stdout.strip().splitlines()[-1])['run_ms']
+        with open(log_path) as f:
+            record = json.loads(f.readline())
+    # The script's own clock starts after its imports; everything the rerun
+    # did after the KPIs were sent does not delay them.
+    after_kpis = record['total_ms'] - record['marks']['first_render']
+    return {
+        'first_render_ms': run_ms - after_kpis,
+        'full_run_ms': run_ms,
+        'script_ms': record['total_ms'],
+        'harness_and_imports_ms': run_ms - record['total_ms'],
+        'setup_ms': sum(record['sections'].get('setup', {}).values())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the imports and the first render of a cold dashboard session.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--out', default='startup_report.json')
+    parser.add_argument('--baseline', help='Earlier report to compare against; exits non-zero on regressions')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    parser.add_argument('--target-ms', type=float, default=TARGET_FIRST_RENDER_MS)
+    args = parser.parse_args()
+
+    profile = import_profile(args.top)
+    runs = [first_render() for _ in range(args.repeat)]
+    # Medians, since a cold start is dominated by disk and page-cache noise.
+    render = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    report = {'environment': environment(), 'repeat': args.repeat, 'imports': profile, 'first_render': render}
+
+    print(f"streamlit import {profile['streamlit_ms']:.0f} ms, app modules on top {profile['app_imports_ms']:.0f} ms")
+    for name, ms in profile['heaviest_packages'].items():
+        print(f"  {name:<24}{ms:>8.1f} ms")
+    for key, ms in render.items():
+        print(f"{key:<26}{ms:>8.0f} ms")
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"Wrote {args.out}")
+
+    found = []
+    if render['first_render_ms'] > args.target_ms:
+        found.append(f"first render {render['first_render_ms']:.0f} ms is over the {args.target_ms:.0f} ms target")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        pairs = [('app_imports_ms', profile['app_imports_ms'], baseline['imports']['app_imports_ms'])]
+        pairs.extend((key, ms, baseline['first_render'][key]) for key, ms in render.items() if key in baseline['first_render'])
+        found.extend(f"{key}: {old:.0f} -> {new:.0f} ms" for key, new, old in pairs if new > old * args.tolerance)
+    for line in found:
+        print(f"REGRESSION {line}")
+    if found:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
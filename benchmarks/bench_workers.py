@@ -0,0 +1,98 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_filters import SELECTIONS
+from benchmarks.synthetic import write_synthetic_csv
+
+# The host view of several dashboard processes serving the same data. RSS
+# counts every page a process maps, shared or not; PSS splits each shared
+# page between the processes that map it, so the PSS of all workers adds up
+# to what the host actually spends on them. Linux only.
+ROLLUP_FIELDS = ['Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty']
+MODES = ['csv', 'snapshot']
+
+
+def serve(csv_path, snapshot_path):
+    # One worker: load the memory engine the way the dashboard does, answer
+    # every selection once so the pages it touches are resident, then hold
+    # the memory until the parent closes stdin.
+    from dataset import load_dataset
+
+    dataset = load_dataset(csv_path, snapshot_path, os.path.join(os.path.dirname(csv_path), 'deltas'))
+    for filters in SELECTIONS.values():
+        dataset.cells(filters)
+        dataset.model_region_counts(filters)
+    print('ready', flush=True)
+    sys.stdin.read()
+
+
+def smaps_rollup(pid):
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        fields = dict(line.split()[:2] for line in f if line.split()[0].rstrip(':') in ROLLUP_FIELDS)
+    return {name.rstrip(':'): int(kb) * 1024 for name, kb in fields.items()}
+
+
+def measure(mode, n_workers, csv_path, snapshot_path):
+    # csv parses the source into private memory in every worker; snapshot
+    # maps the Arrow file that all the workers share.
+    env = dict(os.environ, THEFT_WORKERS='1')
+    path = snapshot_path if mode == 'snapshot' else snapshot_path + '.none'
+    workers = [
+        subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.bench_workers', '--serve', csv_path, path],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=env
+        )
+        for _ in range(n_workers)
+    ]
+    try:
+        for worker in workers:
+            if worker.stdout.readline().strip() != 'ready':
+                raise RuntimeError(f'worker {worker.pid} failed to load the dataset')
+        usage = [smaps_rollup(worker.pid) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.stdin.close()
+            worker.wait()
+    return {
+        'rss': sum(u['Rss'] for u in usage) / n_workers,
+        'pss': sum(u['Pss'] for u in usage) / n_workers,
+        'shared': sum(u['Shared_Clean'] + u['Shared_Dirty'] for u in usage) / n_workers,
+        'private': sum(u['Private_Clean'] + u['Private_Dirty'] for u in usage) / n_workers,
+        'host': sum(u['Pss'] for u in usage)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the memory of several dashboard workers serving one dataset.')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--serve', nargs=2, metavar=('CSV', 'SNAPSHOT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(*args.serve)
+        return
+
+    from dataset import write_snapshot
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        csv_path = os.path.join(work_dir, 'thefts.csv')
+        snapshot_path = os.path.join(work_dir, 'thefts.feather')
+        write_synthetic_csv(csv_path, args.rows)
+        write_snapshot(csv_path, snapshot_path)
+        print(f"{args.rows:,} rows, memory per worker (MB)")
+        print(f"{'':<20}{'RSS':>10}{'PSS':>10}{'shared':>10}{'private':>10}{'host PSS':>10}")
+        for mode in args.modes:
+            for n_workers in args.workers:
+                usage = measure(mode, n_workers, csv_path, snapshot_path)
+                print(
+                    f"{f'{mode} x{n_workers}':<20}" +
+                    ''.join(f"{usage[key] / 1e6:>10.0f}" for key in ['rss', 'pss', 'shared', 'private', 'host'])
+                )
+
+
+if __name__ == '__main__':
+    main()
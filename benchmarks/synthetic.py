@@ -0,0 +1,83 @@
+import argparse
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataset import CSV_PATH, read_csv_typed
+
+SCHEMA = [
+    'vehicle_id', 'vehicle_type', 'make_id', 'model_year', 'vehicle_desc', 'color', 'date_stolen',
+    'location_id', 'make_name', 'make_type', 'region', 'country', 'population', 'density',
+    'year_stolen', 'month_stolen', 'weekday_stolen'
+]
+# Columns drawn together so that a model keeps its make and type, and a
+# location keeps its region, population and density.
+SAMPLED_GROUPS = [
+    ['vehicle_type', 'make_id', 'make_name', 'make_type', 'vehicle_desc', 'model_year'],
+    ['location_id', 'region', 'country', 'population', 'density'],
+    ['color']
+]
+CHUNK_ROWS = 1_000_000
+
+
+@functools.lru_cache(maxsize=None)
+def source_profile(csv_path=CSV_PATH):
+    # Empirical joint frequencies of the bundled data, which carry its skew:
+    # a few makes, models and regions account for most incidents.
+    source = read_csv_typed(csv_path)
+    groups = []
+    for columns in SAMPLED_GROUPS:
+        counts = source.groupby(columns, observed=True, dropna=False).size()
+        groups.append((counts.index.to_frame(index=False), (counts / counts.sum()).to_numpy()))
+    return source.dtypes, groups, source['date_stolen'].min(), source['date_stolen'].max()
+
+
+def synthetic_frame(n_rows, seed=0, csv_path=CSV_PATH, first_id=1, start=None, end=None):
+    # Returns the typed frame read_csv_typed() would produce for n_rows
+    # incidents spread uniformly over [start, end].
+    dtypes, groups, source_start, source_end = source_profile(csv_path)
+    rng = np.random.default_rng(seed)
+    parts = [pd.DataFrame({'vehicle_id': np.arange(first_id, first_id + n_rows)})]
+    for values, weights in groups:
+        parts.append(values.iloc[rng.choice(len(values), n_rows, p=weights)].reset_index(drop=True))
+    df = pd.concat(parts, axis=1)
+
+    start = pd.Timestamp(start) if start else source_start
+    end = pd.Timestamp(end) if end else source_end
+    dates = pd.Series(start + pd.to_timedelta(rng.integers(0, (end - start).days + 1, n_rows), unit='D'))
+    df['date_stolen'] = dates
+    df['year_stolen'] = dates.dt.year
+    df['month_stolen'] = dates.dt.month
+    df['weekday_stolen'] = dates.dt.day_name()
+    return df[SCHEMA].astype(dtypes.to_dict())
+
+
+def write_synthetic_csv(path, n_rows, seed=0, csv_path=CSV_PATH, start=None, end=None, chunk_rows=CHUNK_ROWS):
+    # Written chunk by chunk, so 50M rows need no more memory than one chunk.
+    tmp_path = path + '.tmp'
+    for i, first in enumerate(range(0, n_rows, chunk_rows)):
+        df = synthetic_frame(min(chunk_rows, n_rows - first), (seed, i), csv_path, first + 1, start, end)
+        # Population is comma-formatted in the source CSV.
+        df['population'] = df['population'].astype('category').cat.rename_categories('{:,}'.format)
+        df.to_csv(tmp_path, mode='a' if i else 'w', header=i == 0, index=False, date_format='%Y-%m-%d')
+    os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic incident CSV with the stolen_vehicles_enhanced schema.')
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', help='First theft date (default: first date in the source CSV)')
+    parser.add_argument('--end', help='Last theft date (default: last date in the source CSV)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    write_synthetic_csv(args.out, args.rows, args.seed, start=args.start, end=args.end, chunk_rows=args.chunk_rows)
+    print(f"Wrote {args.rows:,} rows to {args.out} ({os.path.getsize(args.out):,} bytes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,519 @@
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from cube import count_by, mean_model_year, total_count
+from dataset import region_totals
+from forecast import FORECAST_GROUPS
+from hotspots import HOTSPOT_COLUMNS, RECENT_WEEKS
+from region_stats import linear_fit, per_capita_rates
+
+MAX_POINTS = int(os.environ.get('THEFT_MAX_POINTS', 2000))
+WEBGL_POINTS = int(os.environ.get('THEFT_WEBGL_POINTS', 1000))
+
+COLOR_SCHEME = {
+    'primary': ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728'],
+    'background': 'rgba(0,0,0,0)',
+    'text': 'auto'
+}
+
+pio.templates.default = "plotly_white"
+
+
+@functools.cache
+def express():
+    # plotly.express is one of the slowest imports of a cold start and the
+    # KPIs do not need it, so the first figure loads it. Streamlit already
+    # imports graph_objects.
+    import plotly.express as px
+    return px
+
+
+def compute_kpis(regions, cells):
+    make_counts = count_by(cells, 'make_name')
+    total_thefts = total_count(cells)
+    region_data = region_totals(regions, count_by(cells, 'region'))
+    avg_population = (
+        np.average(region_data['population'], weights=region_data['theft_count'])
+        if total_thefts else np.nan
+    )
+    if pd.notnull(avg_population) and avg_population > 0:
+        theft_rate = (total_thefts / avg_population * 100000).round(2)
+    else:
+        theft_rate = None
+    return {
+        'total_thefts': total_thefts,
+        'unique_makes': len(make_counts),
+        'total_luxury': int(cells.loc[cells['make_type'] == 'Luxury', 'count'].sum()),
+        'avg_age': round(pd.Timestamp.now().year - mean_model_year(cells), 1),
+        'most_stolen': make_counts.index[0] if len(make_counts) else None,
+        'theft_rate': theft_rate,
+        'top10_makers': make_counts.head(10).index
+    }
+
+
+def compute_region_data(regions, cells):
+    region_data = region_totals(regions, count_by(cells, 'region').sort_index())
+    rate, low, high = per_capita_rates(region_data['theft_count'], region_data['population'])
+    region_data['thefts_per_10k_pop'] = rate
+    region_data['rate_low'] = low
+    region_data['rate_high'] = high
+    return region_data
+
+
+def density_fit(region_data):
+    return linear_fit(region_data['density'], region_data['theft_count'])
+
+
+def build_density_figure(region_data, fit):
+    # The trendline is drawn from the precomputed fit, the way px's "ols"
+    # trendline draws it, without fitting a model per render.
+    px = express()
+    mode = render_mode(len(region_data))
+    fig = px.scatter(
+        region_data,
+        x='density',
+        y='theft_count',
+        render_mode=mode,
+        title=f"Correlation Between Vehicle Thefts and Population Density (r = {fit['r']:.2f})",
+        color_discrete_sequence=['#636EFA'],
+        labels={
+            'density': 'Population Density',
+            'theft_count': 'Number of Thefts'
+        }
+    )
+    if np.isfinite(fit['slope']):
+        x = np.sort(region_data['density'].to_numpy())
+        trace = go.Scattergl if mode == 'webgl' else go.Scatter
+        fig.add_trace(trace(
+            x=x,
+            y=fit['intercept'] + fit['slope'] * x,
+            mode='lines',
+            name='',
+            showlegend=False,
+            marker=dict(color='#636EFA', symbol='circle'),
+            xaxis='x',
+            yaxis='y',
+            hovertemplate=(
+                f"<b>OLS trendline</b><br>theft_count = {fit['slope']:g} * density + {fit['intercept']:g}"
+                f"<br>R<sup>2</sup>={fit['r2']:g}<br><br>Population Density=%{{x}}<br>"
+                "Number of Thefts=%{y} <b>(trend)</b><extra></extra>"
+            )
+        ))
+    fig.update_traces(marker=dict(size=8, opacity=0.6))
+    fig.update_layout(height=500)
+    return fig
+
+
+def fit_summary(fit):
+    low, high = fit['slope_ci']
+    if not np.isfinite(low):
+        return None
+    return (
+        f"Each extra unit of density comes with {fit['slope']:.2f} more thefts "
+        f"(95% CI {low:.2f} to {high:.2f}, r² = {fit['r2']:.2f}, {fit['n']} regions)."
+    )
+
+
+def format_rate_table(rates):
+    per_10k = rates['thefts_per_10k_pop']
+    return pd.DataFrame({
+        'region': rates['region'],
+        'theft_count': rates['theft_count'].map('{:,}'.format),
+        'thefts_per_10k_pop': per_10k.map('{:,.2f}'.format).where(per_10k % 1 != 0, per_10k.map('{:,.0f}'.format)),
+        'interval': [f'{low:,.2f} – {high:,.2f}' for low, high in zip(rates['rate_low'], rates['rate_high'])]
+    })
+
+
+def render_mode(n_points):
+    # SVG keeps one DOM node per marker, which stalls the browser long
+    # before WebGL does.
+    return 'webgl' if n_points > WEBGL_POINTS else 'svg'
+
+
+def downsample(frame, y, by=None, max_points=MAX_POINTS):
+    # For a frame ordered by x, keeps the first, last, lowest and highest
+    # point of each of max_points / 4 buckets, so peaks and dips survive.
+    if by is not None and len(frame):
+        return pd.concat(
+            [downsample(group, y, max_points=max_points) for _, group in frame.groupby(by, observed=True, sort=False)],
+            ignore_index=True
+        )
+    if len(frame) <= max_points:
+        return frame
+    frame = frame.reset_index(drop=True)
+    buckets = pd.Series(frame[y].to_numpy()).groupby(np.arange(len(frame)) * (max_points // 4) // len(frame))
+    keep = np.concatenate([
+        buckets.head(1).index, buckets.tail(1).index, buckets.idxmin().to_numpy(), buckets.idxmax().to_numpy()
+    ])
+    return frame.iloc[np.unique(keep)]
+
+
+def create_themed_chart(fig):
+    fig.update_layout(
+        plot_bgcolor=COLOR_SCHEME['background'],
+        paper_bgcolor=COLOR_SCHEME['background'],
+        margin=dict(t=30, l=10, r=10, b=10)
+    )
+    return fig
+
+
+def model_count_frame(model_regions):
+    return count_by(model_regions, 'vehicle_desc').rename_axis('model').reset_index()
+
+
+def top_makes_frame(cells):
+    return count_by(cells, ['make_name', 'make_type']).head(15).reset_index(name='count')
+
+
+def make_type_frame(cells):
+    return count_by(cells, 'make_type').drop('Unknown', errors='ignore')
+
+
+def location_frame(cells):
+    return count_by(cells, 'region').head(10).reset_index(name='theft_count')
+
+
+def color_frame(cells):
+    return count_by(cells, 'color').reset_index(name='theft_count')
+
+
+def vehicle_type_frame(cells):
+    return count_by(cells, 'vehicle_type').head(10).reset_index(name='theft_count')
+
+
+def maker_color_frame(cells):
+    return count_by(cells, ['make_name', 'color']).sort_index().reset_index(name='theft_count')
+
+
+def models_figure(model_count, top_n=20):
+    px = express()
+    fig = px.bar(
+        model_count.head(top_n).sort_values('count', ascending=True),
+        x='count',
+        y='model',
+        orientation='h',
+        title=f'Top {top_n} Most Frequently Stolen Vehicle Models',
+        color='count',
+        color_continuous_scale='viridis'
+    )
+    fig.update_layout(
+        margin=dict(l=150, r=20, t=40, b=20),
+        yaxis={
+            'categoryorder': 'total descending',
+            'automargin': True
+        },
+        height=600,
+        xaxis_title="Number of Thefts",
+        yaxis_title="Vehicle Model"
+    )
+    fig.update_traces(marker_colorbar=dict(
+        title=dict(text='Number of Thefts'),
+        thickness=18,
+        len=0.75,
+        outlinewidth=1,
+        outlinecolor='rgba(128,128,128,0.3)'
+    ))
+    return fig
+
+
+def top_makes_figure(top_makes):
+    px = express()
+    fig = px.bar(
+        top_makes,
+        x='make_name',
+        y='count',
+        color='make_type',
+        title='Top 15 Most Stolen Vehicle Makes by Category',
+        barmode='group'
+    )
+    fig.update_layout(xaxis_tickangle=45, showlegend=True)
+    return fig
+
+
+def make_type_figure(make_type_counts):
+    fig = go.Figure(data=[go.Pie(
+        labels=make_type_counts.index,
+        values=make_type_counts.values,
+        hole=.7,
+        marker_colors=['#66b3ff', '#ff9999'][:len(make_type_counts)]
+    )])
+    fig.update_layout(
+        title='Luxury vs Standard Vehicle Thefts',
+        annotations=[dict(text='Vehicle<br>Types', x=0.5, y=0.5, font_size=20, showarrow=False)]
+    )
+    return fig
+
+
+def location_figure(location_counts):
+    px = express()
+    fig = px.bar(
+        location_counts,
+        x='region',
+        y='theft_count',
+        title='Top 10 Locations for Vehicle Theft',
+        color='theft_count',
+        color_continuous_scale='viridis'
+    )
+    fig.update_layout(xaxis_tickangle=45)
+    return fig
+
+
+def model_region_figure(model_regions, model_count):
+    px = express()
+    top_models = model_count['model'].head(10)
+    fig = px.bar(
+        model_regions[model_regions['vehicle_desc'].isin(top_models)],
+        x='region',
+        y='count',
+        color='vehicle_desc',
+        category_orders={'vehicle_desc': top_models.astype(str).tolist()},
+        title='Top 10 Stolen Vehicle Models by Region',
+        barmode='group'
+    )
+    fig.update_layout(
+        xaxis_tickangle=45,
+        yaxis_title='count',
+        legend_title="Vehicle Model",
+        showlegend=True
+    )
+    return fig
+
+
+def rate_table_figure(formatted, color, fill_color):
+    fig = go.Figure(data=[go.Table(
+        header=dict(
+            values=["Region", "Total Thefts", "Thefts per 10k", "95% interval"],
+            fill_color=color,
+            align='left',
+            font=dict(color='white', size=12)
+        ),
+        cells=dict(
+            values=[formatted[k].tolist() for k in formatted.columns],
+            fill_color=[fill_color] * len(formatted),
+            align='left',
+            font=dict(size=11),
+            height=30
+        )
+    )])
+    fig.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig
+
+
+def hotspot_table(result, column):
+    hotspots = result['hotspots']
+    return pd.DataFrame({
+        'Region': hotspots['region'].astype(str),
+        HOTSPOT_COLUMNS[column]: hotspots[column].astype(str),
+        f'Last {RECENT_WEEKS} weeks': hotspots['recent'],
+        'Expected': hotspots['expected'].round(1),
+        'Ratio': hotspots['ratio'].round(1),
+        'Surprise': hotspots['surprise'].round(1)
+    })
+
+
+def hotspot_figure(result, column, top_n=5):
+    # The weekly thefts of the leading hotspots, with the scored window
+    # shaded against the baseline weeks before it.
+    hotspots = result['hotspots'].head(top_n)
+    fig = go.Figure()
+    for (_, row), counts in zip(hotspots.iterrows(), result['counts']):
+        fig.add_trace(go.Scatter(
+            x=result['weeks'],
+            y=counts,
+            mode='lines+markers',
+            name=f"{row['region']} · {row[column]}"
+        ))
+    start, end = result['window']
+    fig.add_vrect(x0=start, x1=end, fillcolor='rgba(239, 85, 59, 0.1)', line_width=0)
+    fig.update_layout(
+        title=f"Weekly Thefts of the Top {HOTSPOT_COLUMNS[column]} Hotspots",
+        xaxis_title="Week",
+        yaxis_title="Number of Thefts",
+        height=450
+    )
+    return fig
+
+
+def forecast_table(result, group):
+    # One row per series: the trend and each quarter's forecast with its
+    # prediction interval.
+    table = result['table'][result['table']['group'] == group]
+    cells = (
+        table['forecast'].round().map('{:,.0f}'.format) + ' (' + table['low'].round().map('{:,.0f}'.format) +
+        '–' + table['high'].round().map('{:,.0f}'.format) + ')'
+    )
+    wide = cells.to_frame('cell').assign(label=table['label'], quarter=table['quarter'])
+    wide = wide.pivot(index='label', columns='quarter', values='cell')
+    trend = table.drop_duplicates('label').set_index('label')['trend']
+    wide.insert(0, 'Trend per quarter', (trend * 100).round(1).map('{:+.1f}%'.format))
+    wide = wide.loc[table.groupby('label', sort=False)['forecast'].last().sort_values(ascending=False).index]
+    return wide.rename_axis(FORECAST_GROUPS[group]).reset_index().rename_axis(None, axis=1)
+
+
+def forecast_figure(fit, result, group, top_n=5):
+    # The weekly thefts of the largest series followed by their projection,
+    # dashed, inside the band of the projected mean.
+    rows = np.flatnonzero(fit['keys']['group'].to_numpy() == group)
+    rows = rows[np.argsort(-result['mean'][rows].sum(axis=1), kind='stable')][:top_n]
+    colors = pio.templates[pio.templates.default].layout.colorway
+    fig = go.Figure()
+    for row, color in zip(rows, colors):
+        label = fit['keys']['label'].iloc[row]
+        fig.add_trace(go.Scatter(
+            x=fit['weeks'], y=fit['counts'][row], mode='lines', name=label, legendgroup=label,
+            line={'color': color}
+        ))
+        fig.add_trace(go.Scatter(
+            x=np.concatenate([result['future'], result['future'][::-1]]),
+            y=np.concatenate([result['high'][row], result['low'][row][::-1]]),
+            fill='toself', fillcolor=color, opacity=0.15, line={'width': 0},
+            legendgroup=label, showlegend=False, hoverinfo='skip'
+        ))
+        fig.add_trace(go.Scatter(
+            x=result['future'], y=result['mean'][row], mode='lines', name=f"{label} (forecast)",
+            legendgroup=label, showlegend=False, line={'color': color, 'dash': 'dash'}
+        ))
+    fig.update_layout(
+        title=f"Weekly Theft Forecast by {FORECAST_GROUPS[group]}",
+        xaxis_title="Week",
+        yaxis_title="Number of Thefts",
+        height=450
+    )
+    return fig
+
+
+def quarterly_figure(quarter_counts):
+    px = express()
+    fig = px.line(
+        downsample(quarter_counts, 'theft_count'),
+        x='quarter_label',
+        y='theft_count',
+        render_mode=render_mode(len(quarter_counts)),
+        title='Quarterly Vehicle Theft Trend',
+        markers=True
+    )
+    fig.update_layout(xaxis_tickangle=45)
+    return fig
+
+
+def model_year_figure(model_years):
+    px = express()
+    fig = px.line(
+        downsample(model_years, 'theft_count'),
+        x='model_year',
+        y='theft_count',
+        render_mode=render_mode(len(model_years)),
+        title='Number of Cars Stolen by Model Year',
+        markers=True
+    )
+    fig.update_layout(
+        xaxis_title="Model Year",
+        yaxis_title="Number of Thefts"
+    )
+    return fig
+
+
+def age_figure(age_type_trend):
+    px = express()
+    fig = px.line(
+        downsample(age_type_trend, 'count', by='make_type'),
+        x='vehicle_age',
+        y='count',
+        render_mode=render_mode(len(age_type_trend)),
+        color='make_type',
+        title='Vehicle Age vs Theft Count by Type',
+        markers=True
+    )
+    fig.update_layout(
+        xaxis_title="Vehicle Age (years)",
+        yaxis_title="Number of Thefts"
+    )
+    return fig
+
+
+def color_figure(color_counts):
+    px = express()
+    fig = px.bar(
+        color_counts,
+        x='color',
+        y='theft_count',
+        title='Total Count of Stolen Vehicles by Color',
+        labels={'color': 'Color', 'theft_count': 'Number of Thefts'},
+        color='theft_count',
+        color_continuous_scale='viridis',
+        template='plotly_white'
+    )
+    fig.update_traces(hovertemplate="<b>%{x}</b><br>Thefts: %{y}<extra></extra>", marker=dict(showscale=True))
+    fig.update_traces(marker_colorbar=dict(
+        title=dict(text='Number of Thefts'),
+        thickness=18,
+        len=0.75,
+        outlinewidth=1,
+        outlinecolor='rgba(128,128,128,0.3)'
+    ))
+    fig.update_layout(
+        xaxis=dict(
+            tickangle=45,
+            title=dict(text='Color')
+        ),
+        yaxis=dict(
+            title=dict(text='Number of Thefts'),
+            gridcolor='rgba(128,128,128,0.2)'
+        ),
+        height=420,
+        margin=dict(t=40, l=10, r=10, b=40),
+        showlegend=False
+    )
+    return create_themed_chart(fig)
+
+
+def vehicle_type_figure(type_counts):
+    px = express()
+    fig = px.bar(
+        type_counts,
+        x='vehicle_type',
+        y='theft_count',
+        title='Top 10 Stolen Vehicle Types',
+        labels={'vehicle_type': 'Vehicle Type', 'theft_count': 'Number of Thefts'},
+        template='plotly_white',
+        color_discrete_sequence=[COLOR_SCHEME['primary'][0]]
+    )
+    fig.update_traces(hovertemplate="<b>%{x}</b><br>Thefts: %{y}<extra></extra>")
+    fig.update_layout(
+        xaxis=dict(tickangle=45, title=dict(text='Vehicle Type')),
+        yaxis=dict(title=dict(text='Number of Thefts'), gridcolor='rgba(128,128,128,0.2)'),
+        height=420,
+        margin=dict(t=40, l=10, r=10, b=40),
+        showlegend=False
+    )
+    return create_themed_chart(fig)
+
+
+def make_color_figure(maker_color_counts, top10_makers):
+    px = express()
+    fig = px.bar(
+        maker_color_counts[maker_color_counts['make_name'].isin(top10_makers)],
+        x='theft_count',
+        y='make_name',
+        color='color',
+        orientation='h',
+        title='Top 10 Vehicle Makers — Thefts by Color',
+        color_discrete_sequence=px.colors.qualitative.Set3,
+        barmode='stack'
+    )
+    fig.update_layout(
+        showlegend=True,
+        legend_title="Vehicle Color",
+        yaxis={'categoryorder': 'total ascending'},
+        height=600
+    )
+    return fig
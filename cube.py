@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+
+from filter_index import FILTER_COLUMNS
+
+CUBE_DIMS = ['region', 'make_name', 'make_type', 'vehicle_type', 'color', 'model_year', 'quarter']
+
+
+def build_cube(df):
+    keys = [df[col] for col in CUBE_DIMS[:-1]]
+    keys.append(df['date_stolen'].dt.to_period('Q').rename('quarter'))
+    return (
+        df.groupby(keys, observed=True, dropna=False, sort=False)
+        .size()
+        .reset_index(name='count')
+    )
+
+
+def merge_counts(parts, columns):
+    cells = pd.concat(parts, ignore_index=True)
+    return (
+        cells.groupby(columns, observed=True, dropna=False, sort=False)['count']
+        .sum()
+        .reset_index()
+    )
+
+
+def merge_cubes(parts):
+    return merge_counts(parts, CUBE_DIMS)
+
+
+def slice_cube(cells, filters):
+    mask = np.ones(len(cells), dtype=bool)
+    for key, col in FILTER_COLUMNS.items():
+        if filters.get(key):
+            mask &= cells[col].isin(filters[key]).to_numpy()
+    return cells[mask]
+
+
+def full_quarters(date_range):
+    # The first and last quarter lying wholly inside an inclusive day range.
+    start, end = (pd.Timestamp(part).normalize() for part in date_range)
+    first, last = pd.Period(start, 'Q'), pd.Period(end, 'Q')
+    if start > first.start_time:
+        first += 1
+    if end < last.end_time.normalize():
+        last -= 1
+    return first, last
+
+
+def count_by(cells, columns):
+    counts = cells.groupby(columns, observed=True)['count'].sum()
+    return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+
+def total_count(cells):
+    return int(cells['count'].sum())
+
+
+def mean_model_year(cells):
+    known = cells['model_year'].notna()
+    if not known.any():
+        return np.nan
+    return np.average(cells.loc[known, 'model_year'], weights=cells.loc[known, 'count'])
+
+
+def quarterly_counts(cells):
+    counts = cells.groupby('quarter')['count'].sum()
+    counts = counts[counts > 0]
+    if counts.empty:
+        return pd.DataFrame({'quarter_label': pd.Series(dtype=str), 'theft_count': pd.Series(dtype='int64')})
+    quarters = pd.period_range(counts.index.min(), counts.index.max(), freq='Q')
+    counts = counts.reindex(quarters, fill_value=0)
+    return pd.DataFrame({'quarter_label': quarters.astype(str), 'theft_count': counts.to_numpy()})
+
+
+def model_year_counts(cells):
+    counts = cells.dropna(subset=['model_year']).groupby('model_year')['count'].sum()
+    counts = counts[counts > 0]
+    return pd.DataFrame({'model_year': counts.index.astype(int), 'theft_count': counts.to_numpy()})
+
+
+def age_type_counts(cells, current_year):
+    vehicle_age = (current_year - cells['model_year']).rename('vehicle_age')
+    in_range = (vehicle_age >= 0) & (vehicle_age < 100)
+    counts = (
+        cells[in_range]
+        .groupby([vehicle_age[in_range], 'make_type'], observed=True)['count']
+        .sum()
+    )
+    return counts[counts > 0].reset_index()
+
+
+def model_region_counts(models, regions):
+    # vehicle_desc is close to unique per incident at national scale, so it
+    # stays out of the cube and is counted on the selected rows instead.
+    model_codes = models.cat.codes.to_numpy().astype(np.int64)
+    region_codes = regions.cat.codes.to_numpy()
+    known = model_codes >= 0
+    n_regions = len(regions.cat.categories)
+    counts = np.bincount(
+        model_codes[known] * n_regions + region_codes[known],
+        minlength=len(models.cat.categories) * n_regions
+    )
+    cells = np.flatnonzero(counts)
+    return pd.DataFrame({
+        'vehicle_desc': pd.Categorical.from_codes(cells // n_regions, dtype=models.dtype),
+        'region': pd.Categorical.from_codes(cells % n_regions, dtype=regions.dtype),
+        'count': counts[cells]
+    })
+
+
+def week_start(dates):
+    # The Monday of each date's week; day 4 of the epoch was a Monday.
+    days = np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+    return ((days - 4) // 7 * 7 + 4).astype('datetime64[D]').astype('datetime64[ns]')
+
+
+def weekly_counts(regions, values, dates):
+    # Incidents per region, label and week in one bincount over the combined
+    # codes, like model_region_counts.
+    region_codes = regions.cat.codes.to_numpy().astype(np.int64)
+    value_codes = values.cat.codes.to_numpy().astype(np.int64)
+    weeks = week_start(dates)
+    known = (region_codes >= 0) & (value_codes >= 0) & ~np.isnat(weeks)
+    columns = [regions.name, values.name, 'week', 'count']
+    if not known.any():
+        return pd.DataFrame({
+            regions.name: pd.Categorical([], dtype=regions.dtype), values.name: pd.Categorical([], dtype=values.dtype),
+            'week': pd.Series(dtype='datetime64[ns]'), 'count': pd.Series(dtype='int64')
+        }, columns=columns)
+    first = weeks[known].min()
+    week_codes = (weeks[known] - first) // np.timedelta64(7, 'D')
+    n_values = len(values.cat.categories)
+    n_weeks = int(week_codes.max()) + 1
+    counts = np.bincount(
+        (region_codes[known] * n_values + value_codes[known]) * n_weeks + week_codes,
+        minlength=len(regions.cat.categories) * n_values * n_weeks
+    )
+    cells = np.flatnonzero(counts)
+    return pd.DataFrame({
+        regions.name: pd.Categorical.from_codes(cells // (n_values * n_weeks), dtype=regions.dtype),
+        values.name: pd.Categorical.from_codes(cells // n_weeks % n_values, dtype=values.dtype),
+        'week': first + (cells % n_weeks) * np.timedelta64(7, 'D'),
+        'count': counts[cells]
+    }, columns=columns)
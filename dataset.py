@@ -0,0 +1,408 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from cube import (
+    CUBE_DIMS, build_cube, full_quarters, merge_cubes, model_region_counts, slice_cube, weekly_counts
+)
+from filter_index import FilterIndex
+from parallel import WORKERS, parallel_cube
+
+CSV_PATH = 'stolen_vehicles_enhanced.csv'
+SNAPSHOT_PATH = os.environ.get('THEFT_SNAPSHOT', 'stolen_vehicles_enhanced.feather')
+DELTA_DIR = 'deltas'
+SNAPSHOT_VERSION = '4'
+
+CATEGORICAL_COLS = ['make_name', 'vehicle_type', 'color', 'region', 'make_type']
+DICTIONARY_COLS = CATEGORICAL_COLS + ['vehicle_desc', 'country', 'weekday_stolen']
+COMPACT_INT_COLS = {'location_id': 'int32', 'year_stolen': 'int16', 'month_stolen': 'int8'}
+REGION_COLS = ['region', 'country', 'population', 'density']
+
+
+def clean_categorical(df, columns):
+    df_clean = df.copy()
+    for col in columns:
+        if col in df_clean.columns:
+            values = df_clean[col].astype('category')
+            if values.isna().any():
+                if 'Unknown' not in values.cat.categories:
+                    values = values.cat.add_categories('Unknown')
+                values = values.fillna('Unknown')
+            df_clean[col] = values
+    return df_clean
+
+
+CSV_OPTIONS = {
+    'thousands': ',',
+    'dtype': {**{col: 'category' for col in DICTIONARY_COLS}, **COMPACT_INT_COLS},
+    'parse_dates': ['date_stolen']
+}
+
+
+def type_frame(df):
+    df['population'] = df['population'].astype('int64')
+    return clean_categorical(df, CATEGORICAL_COLS)
+
+
+def read_csv_typed(csv_path=CSV_PATH):
+    return type_frame(pd.read_csv(csv_path, **CSV_OPTIONS))
+
+
+def sort_by_date(df):
+    if df['date_stolen'].is_monotonic_increasing:
+        return df
+    return df.sort_values('date_stolen', kind='stable', ignore_index=True)
+
+
+def count_values(series):
+    # Categorical value_counts bins the integer codes but also reports
+    # categories that the current filter selection left empty.
+    counts = series.value_counts(sort=False)
+    counts = counts[counts > 0]
+    return counts.sort_values(ascending=False, kind='stable')
+
+
+def concat_typed(frames):
+    # Categories are unioned in order of appearance, so the first frame keeps
+    # its codes and the result stays categorical.
+    dtypes = {}
+    for col in DICTIONARY_COLS:
+        categories = frames[0][col].cat.categories
+        for frame in frames[1:]:
+            categories = categories.append(frame[col].cat.categories.difference(categories, sort=False))
+        dtypes[col] = pd.CategoricalDtype(categories)
+    return pd.concat([frame.astype(dtypes) for frame in frames], ignore_index=True)
+
+
+def pending_deltas(delta_dir, seen_deltas):
+    # Delta files are picked up once each, keyed by name, size and mtime,
+    # so a rerun only pays for a directory listing when nothing changed.
+    if not os.path.isdir(delta_dir):
+        return []
+    pending = []
+    for entry in sorted(os.scandir(delta_dir), key=lambda entry: entry.name):
+        if not entry.name.endswith('.csv'):
+            continue
+        stat = entry.stat()
+        token = (entry.name, stat.st_size, stat.st_mtime_ns)
+        if token not in seen_deltas:
+            pending.append((token, entry.path))
+    return pending
+
+
+def source_fingerprint(csv_path=CSV_PATH):
+    stat = os.stat(csv_path)
+    return {
+        b'snapshot_version': SNAPSHOT_VERSION.encode(),
+        b'source_size': str(stat.st_size).encode(),
+        b'source_mtime_ns': str(stat.st_mtime_ns).encode()
+    }
+
+
+def snapshot_is_fresh(csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH):
+    if not os.path.exists(snapshot_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    metadata = snapshot_metadata(snapshot_path)
+    expected = source_fingerprint(csv_path)
+    return all(metadata.get(key) == value for key, value in expected.items())
+
+
+def snapshot_metadata(snapshot_path=SNAPSHOT_PATH):
+    with pa.memory_map(snapshot_path) as source:
+        return pa.ipc.open_file(source).schema.metadata or {}
+
+
+def absorbed_deltas(csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH):
+    # The delta files folded into a fresh snapshot; a stale one is not read,
+    # so its deltas have to be replayed.
+    if not snapshot_is_fresh(csv_path, snapshot_path):
+        return set()
+    tokens = json.loads(snapshot_metadata(snapshot_path).get(b'absorbed_deltas', b'[]'))
+    return {tuple(token) for token in tokens}
+
+
+def write_snapshot(csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH, delta_dir=None):
+    df = read_csv_typed(csv_path)
+    # Compaction: the staged deltas become part of the snapshot, and their
+    # tokens are recorded so that loading it does not replay them.
+    pending = pending_deltas(delta_dir, set()) if delta_dir else []
+    if pending:
+        delta = concat_typed([read_csv_typed(path) for _, path in pending]).drop_duplicates('vehicle_id')
+        df = concat_typed([df, delta[~delta['vehicle_id'].isin(df['vehicle_id'])]])
+    df = sort_by_date(df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Missing make ids and model years stay NaN rather than becoming Arrow
+    # nulls: a column with a validity bitmap has to be copied into pandas.
+    for col in df.select_dtypes('float').columns:
+        position = table.schema.get_field_index(col)
+        table = table.set_column(position, col, pa.array(df[col].to_numpy(), from_pandas=False))
+    metadata = dict(table.schema.metadata or {})
+    metadata.update(source_fingerprint(csv_path))
+    metadata[b'absorbed_deltas'] = json.dumps([token for token, _ in pending]).encode()
+    table = table.replace_schema_metadata(metadata).combine_chunks()
+    # Uncompressed Arrow IPC in a single record batch, so every column is one
+    # contiguous buffer that readers can memory-map without a copy.
+    tmp_path = snapshot_path + '.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed', chunksize=max(table.num_rows, 1))
+    os.replace(tmp_path, snapshot_path)
+    return df
+
+
+def read_snapshot(snapshot_path=SNAPSHOT_PATH):
+    # The frame's columns are read-only views of the mapped file: every
+    # process on the host that reads the same snapshot shares its pages
+    # through the page cache instead of holding a private copy.
+    table = feather.read_table(snapshot_path, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def load_frame(csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH):
+    if snapshot_is_fresh(csv_path, snapshot_path):
+        return read_snapshot(snapshot_path)
+    return read_csv_typed(csv_path)
+
+
+def build_regions(frame, index):
+    # Population and density are properties of the region, so one row per
+    # region code is enough. The first row of each region's posting list
+    # supplies the values without scanning the frame.
+    offsets = index.offsets['region']
+    codes = np.flatnonzero(np.diff(offsets))
+    regions = frame.iloc[index.rows['region'][offsets[codes]], frame.columns.get_indexer(REGION_COLS)]
+    regions.index = pd.Index(codes, name='region_code')
+    return regions
+
+
+def region_totals(regions, region_counts):
+    info = regions.loc[region_counts.index.codes]
+    return pd.DataFrame({
+        'region': region_counts.index.astype(str),
+        'theft_count': region_counts.to_numpy(),
+        'population': info['population'].to_numpy(),
+        'density': info['density'].to_numpy()
+    })
+
+
+def unknown_incidents(vehicle_ids, delta):
+    # The rows of delta whose vehicle_id is not in the sorted vehicle_ids,
+    # keeping the first of any repeated within delta.
+    delta = delta.drop_duplicates('vehicle_id')
+    ids = delta['vehicle_id'].to_numpy()
+    positions = np.searchsorted(vehicle_ids, ids).clip(max=len(vehicle_ids) - 1)
+    known = vehicle_ids[positions] == ids if len(vehicle_ids) else np.zeros(len(ids), dtype=bool)
+    return delta[~known]
+
+
+def insert_ids(vehicle_ids, ids):
+    # Merges new ids into the sorted ones without re-sorting the history.
+    ids = np.sort(ids)
+    return np.insert(vehicle_ids, np.searchsorted(vehicle_ids, ids), ids)
+
+
+def align_categories(frame, delta):
+    # New labels are appended after the existing categories so that codes
+    # already held by the filter index and the cube keep their meaning.
+    frame = frame.copy(deep=False)
+    delta = delta.copy(deep=False)
+    for col in DICTIONARY_COLS:
+        added = delta[col].cat.categories.difference(frame[col].cat.categories, sort=False)
+        if len(added):
+            frame[col] = frame[col].cat.add_categories(added)
+        delta[col] = delta[col].cat.set_categories(frame[col].cat.categories)
+    return frame, delta
+
+
+class Dataset:
+    # Rows are kept in date order, so the filter index can answer a date
+    # range by binary search.
+
+    def __init__(self, frame, workers=WORKERS):
+        frame = sort_by_date(frame)
+        self.frame = frame
+        self.workers = workers
+        self.index = FilterIndex(frame)
+        self.cube = parallel_cube(frame, self.index.rows['region'], workers)
+        self.regions = build_regions(frame, self.index)
+        self.vehicle_ids = np.sort(frame['vehicle_id'].to_numpy())
+        self.seen_deltas = set()
+        self.lock = threading.Lock()
+        self.sketched = False
+
+    def new_incidents(self, delta):
+        return unknown_incidents(self.vehicle_ids, delta)
+
+    def append(self, delta):
+        # Costs one memcpy of the frame plus work proportional to the delta:
+        # no re-parse, no index rebuild and no re-aggregation of the history.
+        delta = self.new_incidents(delta)
+        if delta.empty:
+            return delta
+        frame, delta = align_categories(self.frame, delta)
+        delta = sort_by_date(delta.reset_index(drop=True))
+        cube = self.cube.astype({col: frame[col].dtype for col in CUBE_DIMS if col in DICTIONARY_COLS})
+
+        # Rows newer than the oldest incident of the delta are merged with it
+        # by date and re-indexed; for a delta of newer incidents that tail is
+        # just the delta, and the whole frame stays in date order either way.
+        split = np.searchsorted(self.index.dates, delta['date_stolen'].to_numpy()[:1], side='right')[0]
+        if split < len(frame):
+            tail = sort_by_date(pd.concat([frame.iloc[split:], delta], ignore_index=True))
+            index = self.index.truncated(split).extended(tail)
+        else:
+            tail = delta
+            index = self.index.extended(tail)
+        cube = merge_cubes([cube, build_cube(delta)])
+        # Readers take row ids from the index and then look them up in the
+        # frame, so the longer frame has to be published first. Ids below
+        # split keep their rows; a back-dated delta moves the others, and a
+        # result computed across the swap is dropped by the invalidation
+        # that follows the append.
+        frame = pd.concat([frame.iloc[:split], tail], ignore_index=True)
+        regions = build_regions(frame, index)
+        self.frame = frame
+        self.index = index
+        self.cube = cube
+        self.regions = regions
+        self.vehicle_ids = insert_ids(self.vehicle_ids, delta['vehicle_id'].to_numpy())
+        return delta
+
+    def sync_deltas(self, delta_dir=DELTA_DIR):
+        # All new delta files are appended together, so the frame is copied
+        # once however many of them are pending.
+        with self.lock:
+            pending = pending_deltas(delta_dir, self.seen_deltas)
+            if not pending:
+                return None
+            self.seen_deltas.update(token for token, _ in pending)
+            delta = self.append(concat_typed([read_csv_typed(path) for _, path in pending]))
+        return None if delta.empty else delta
+
+    @property
+    def n_rows(self):
+        return len(self.frame)
+
+    def options(self, col):
+        return sorted(self.frame[col].cat.categories)
+
+    def rows(self, filters):
+        return self.index.select(filters)
+
+    def select(self, filters):
+        return self.frame.iloc[self.rows(filters)]
+
+    def date_bounds(self):
+        dates = self.index.dates
+        if self.index.date_sorted:
+            return pd.Timestamp(dates[0]), pd.Timestamp(dates[-1])
+        return pd.Timestamp(dates.min()), pd.Timestamp(dates.max())
+
+    def cells(self, filters, rows=None):
+        date_range = filters.get('date_range')
+        if date_range and len(date_range) == 2:
+            if rows is None:
+                rows = self.rows(filters)
+            first, last = full_quarters(date_range)
+            if not self.index.date_sorted or first > last:
+                return parallel_cube(self.frame, rows, self.workers)
+            # Quarters wholly inside the range come from the cube; only the
+            # partial quarters at either end are aggregated from rows, which
+            # in date order are a prefix and a suffix of the selection.
+            lo, hi = self.index.date_interval((first.start_time, last.end_time))
+            edges = np.concatenate([rows[:np.searchsorted(rows, lo)], rows[np.searchsorted(rows, hi):]])
+            inner = slice_cube(self.cube, filters)
+            inner = inner[(inner['quarter'] >= first) & (inner['quarter'] <= last)]
+            return pd.concat([inner, parallel_cube(self.frame, edges, self.workers)], ignore_index=True)
+        return slice_cube(self.cube, filters)
+
+    def model_region_counts(self, filters):
+        rows = self.rows(filters)
+        return model_region_counts(self.frame['vehicle_desc'].iloc[rows], self.frame['region'].iloc[rows])
+
+    def distinct_models(self, filters):
+        return self.frame['vehicle_desc'].iloc[self.rows(filters)].nunique()
+
+    def weekly_counts(self, filters, column):
+        rows = self.rows(filters)
+        return weekly_counts(
+            self.frame['region'].iloc[rows], self.frame[column].iloc[rows], self.frame['date_stolen'].iloc[rows]
+        )
+
+
+def load_dataset(csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH, delta_dir=DELTA_DIR):
+    dataset = Dataset(load_frame(csv_path, snapshot_path))
+    dataset.seen_deltas.update(absorbed_deltas(csv_path, snapshot_path))
+    dataset.sync_deltas(delta_dir)
+    return dataset
+
+
+def stage_delta(path, csv_path=CSV_PATH, snapshot_path=SNAPSHOT_PATH, delta_dir=DELTA_DIR):
+    dataset = load_dataset(csv_path, snapshot_path, delta_dir)
+    incoming = read_csv_typed(path)
+    delta = dataset.new_incidents(incoming)
+    if delta.empty:
+        return None, len(incoming)
+    os.makedirs(delta_dir, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.path.splitext(os.path.basename(path))[0]}.csv"
+    target = os.path.join(delta_dir, name)
+    delta.to_csv(target + '.tmp', index=False, date_format='%Y-%m-%d')
+    os.replace(target + '.tmp', target)
+    return target, len(incoming) - len(delta)
+
+
+def memory_report(csv_path=CSV_PATH):
+    # The object layout is what load_data() produced before the typed schema.
+    before = pd.read_csv(csv_path)
+    before['date_stolen'] = pd.to_datetime(before['date_stolen'])
+    for col in CATEGORICAL_COLS:
+        before[col] = before[col].fillna('Unknown').astype(str)
+    after = read_csv_typed(csv_path)
+
+    report = pd.DataFrame({
+        'before_dtype': before.dtypes.astype(str),
+        'before_bytes': before.memory_usage(deep=True, index=False),
+        'after_dtype': after.dtypes.astype(str),
+        'after_bytes': after.memory_usage(deep=True, index=False)
+    })
+    report.loc['TOTAL'] = ['', report['before_bytes'].sum(), '', report['after_bytes'].sum()]
+    report['ratio'] = (report['before_bytes'] / report['after_bytes']).round(1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f'Convert the theft CSV and the deltas in {DELTA_DIR}/ into a typed Arrow snapshot.')
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--memory-report', action='store_true',
+                        help='Print per-column memory before/after the typed schema instead of writing a snapshot')
+    parser.add_argument('--append', metavar='DELTA_CSV',
+                        help=f'Stage the new vehicle_ids from a delta file into {DELTA_DIR}/ instead of writing a snapshot')
+    args = parser.parse_args()
+
+    if args.memory_report:
+        print(memory_report(args.csv).to_string())
+        return
+    if args.append:
+        target, skipped = stage_delta(args.append, args.csv, args.snapshot)
+        if target is None:
+            print(f"No new incidents in {args.append} ({skipped:,} already loaded)")
+        else:
+            print(f"Staged {target} ({skipped:,} already loaded incidents skipped)")
+        return
+
+    df = write_snapshot(args.csv, args.snapshot, DELTA_DIR)
+    absorbed = len(absorbed_deltas(args.csv, args.snapshot))
+    print(f"Wrote {len(df):,} rows to {args.snapshot} ({os.path.getsize(args.snapshot):,} bytes, "
+          f"{absorbed} delta files absorbed)")
+
+
+if __name__ == '__main__':
+    main()
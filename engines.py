@@ -0,0 +1,22 @@
+import os
+
+from dataset import load_dataset
+from sql_engine import load_sql_dataset
+from streaming import load_streaming_dataset
+
+ENGINES = {
+    'memory': load_dataset,
+    'streaming': load_streaming_dataset,
+    'sql': load_sql_dataset
+}
+DEFAULT_ENGINE = 'memory'
+
+
+def open_dataset(engine=None):
+    # THEFT_ENGINE=streaming keeps only aggregates in memory and rescans the
+    # source for selections the cube cannot answer; THEFT_ENGINE=sql pushes
+    # every selection down to an indexed SQLite file.
+    engine = engine or os.environ.get('THEFT_ENGINE', DEFAULT_ENGINE)
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of: {', '.join(ENGINES)}")
+    return ENGINES[engine]()
@@ -0,0 +1,165 @@
+import copy
+
+import numpy as np
+
+FILTER_COLUMNS = {
+    'makes': 'make_name',
+    'types': 'vehicle_type',
+    'colors': 'color',
+    'regions': 'region',
+    'make_types': 'make_type'
+}
+
+ALL_ROWS = slice(None)
+
+
+def is_sorted(values):
+    return bool(np.all(values[1:] >= values[:-1]))
+
+
+def day_bounds(date_range):
+    # An inclusive range of days as a half-open datetime64 interval.
+    start = np.datetime64(date_range[0], 'D')
+    end = np.datetime64(date_range[1], 'D') + np.timedelta64(1, 'D')
+    return start, end
+
+
+class FilterIndex:
+    # For each filter dimension the row ids are stored grouped by category
+    # code (CSR layout): rows[offsets[c]:offsets[c + 1]] is the sorted
+    # posting list of code c. A selection ORs the posting lists of the
+    # chosen values in the most selective dimension and ANDs the other
+    # dimensions by probing their codes for just those candidate rows.
+    # When the rows are in date order, a date range is an interval of row
+    # ids found by binary search, and posting lists are cut to it the same
+    # way.
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self.categories = {}
+        self.codes = {}
+        self.rows = {}
+        self.offsets = {}
+        for col in FILTER_COLUMNS.values():
+            categories = df[col].cat.categories
+            codes = df[col].cat.codes.to_numpy()
+            order = np.argsort(codes, kind='stable').astype(np.int32)
+            self.categories[col] = categories
+            self.codes[col] = codes
+            self.rows[col] = order
+            self.offsets[col] = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+        self.dates = df['date_stolen'].to_numpy()
+        self.date_sorted = is_sorted(self.dates)
+
+    def extended(self, df):
+        # Returns a new index covering the appended rows, which get ids
+        # n_rows... Their categories may only add codes at the end, so
+        # existing codes stay valid. Each posting list is merged as old rows
+        # followed by new rows, keeping ids ascending.
+        index = copy.copy(self)
+        index.categories, index.codes = dict(self.categories), dict(self.codes)
+        index.rows, index.offsets = dict(self.rows), dict(self.offsets)
+        for col in FILTER_COLUMNS.values():
+            categories = df[col].cat.categories
+            new_codes = df[col].cat.codes.to_numpy()
+            new_order = np.argsort(new_codes, kind='stable')
+            new_offsets = np.searchsorted(new_codes[new_order], np.arange(len(categories) + 1))
+            old_offsets = self.offsets[col]
+            old_offsets = np.concatenate([
+                old_offsets,
+                np.full(len(categories) - len(self.categories[col]), old_offsets[-1])
+            ])
+
+            rows = np.empty(old_offsets[-1] + new_offsets[-1], dtype=np.int32)
+            old_code = np.repeat(np.arange(len(categories)), np.diff(old_offsets))
+            rows[np.arange(old_offsets[-1]) + new_offsets[old_code]] = self.rows[col]
+            new_code = np.repeat(np.arange(len(categories)), np.diff(new_offsets))
+            rows[np.arange(new_offsets[-1]) + old_offsets[new_code + 1]] = new_order + self.n_rows
+
+            index.categories[col] = categories
+            index.codes[col] = np.concatenate([self.codes[col], new_codes])
+            index.rows[col] = rows
+            index.offsets[col] = old_offsets + new_offsets
+        new_dates = df['date_stolen'].to_numpy()
+        index.dates = np.concatenate([self.dates, new_dates])
+        index.date_sorted = self.date_sorted and is_sorted(index.dates[max(self.n_rows - 1, 0):])
+        index.n_rows = self.n_rows + len(df)
+        return index
+
+    def truncated(self, n_rows):
+        # Returns a new index over the first n_rows rows only. Dropping the
+        # later ids from each posting list keeps it grouped by code and
+        # ascending, so only the offsets have to be recounted.
+        index = copy.copy(self)
+        index.codes = {col: codes[:n_rows] for col, codes in self.codes.items()}
+        index.rows = {col: rows[rows < n_rows] for col, rows in self.rows.items()}
+        index.offsets = {
+            col: np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(self.categories[col])))])
+            for col, codes in index.codes.items()
+        }
+        index.dates = self.dates[:n_rows]
+        index.date_sorted = self.date_sorted or is_sorted(index.dates)
+        index.n_rows = n_rows
+        return index
+
+    def matches_any(self, filters):
+        rows = self.select(filters)
+        return self.n_rows > 0 if isinstance(rows, slice) else len(rows) > 0
+
+    def nbytes(self):
+        return sum(self.rows[col].nbytes + self.offsets[col].nbytes for col in self.rows)
+
+    def selected_codes(self, col, values):
+        codes = self.categories[col].get_indexer(list(values))
+        return codes[codes >= 0]
+
+    def posting_size(self, col, codes):
+        offsets = self.offsets[col]
+        return int((offsets[codes + 1] - offsets[codes]).sum())
+
+    def postings(self, col, codes):
+        rows, offsets = self.rows[col], self.offsets[col]
+        if len(codes) == 0:
+            return rows[:0]
+        if len(codes) == 1:
+            return rows[offsets[codes[0]]:offsets[codes[0] + 1]]
+        return np.sort(np.concatenate([rows[offsets[c]:offsets[c + 1]] for c in codes]))
+
+    def date_interval(self, date_range):
+        start, end = day_bounds(date_range)
+        return np.searchsorted(self.dates, start), np.searchsorted(self.dates, end)
+
+    def select(self, filters):
+        selections = []
+        for key, col in FILTER_COLUMNS.items():
+            if filters.get(key):
+                selections.append((col, self.selected_codes(col, filters[key])))
+        date_range = filters.get('date_range')
+        has_dates = bool(date_range) and len(date_range) == 2
+
+        if not selections and not has_dates:
+            return ALL_ROWS
+
+        if has_dates and self.date_sorted:
+            lo, hi = self.date_interval(date_range)
+            if not selections:
+                return np.arange(lo, hi, dtype=np.int32)
+
+        if selections:
+            selections.sort(key=lambda item: self.posting_size(*item))
+            col, codes = selections[0]
+            rows = self.postings(col, codes)
+            if has_dates and self.date_sorted:
+                rows = rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)]
+            for col, codes in selections[1:]:
+                lookup = np.zeros(len(self.categories[col]) + 1, dtype=bool)
+                lookup[codes] = True
+                rows = rows[lookup[self.codes[col][rows]]]
+        else:
+            rows = np.arange(self.n_rows, dtype=np.int32)
+
+        if has_dates and not self.date_sorted:
+            start, end = day_bounds(date_range)
+            dates = self.dates[rows]
+            rows = rows[(dates >= start) & (dates < end)]
+        return rows
@@ -0,0 +1,146 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from hotspots import week_grid
+
+# Every series is a Poisson GLM of its weekly thefts, log(mean) = intercept +
+# trend * years, plus a term per quarter of the year once the weeks cover
+# SEASONAL_MIN_WEEKS. The coefficients other than the intercept are shrunk
+# towards zero by RIDGE_PENALTY, so a short or sparse series projects close
+# to its current level instead of following one noisy run of weeks. Half a
+# theft spread over the weeks, as in the hotspot scores, keeps a series
+# without thefts at a small finite rate instead of one that falls forever.
+FORECAST_GROUPS = {'region': 'Region', 'make_type': 'Make type'}
+HORIZON_QUARTERS = 2
+MIN_WEEKS = 8
+SEASONAL_MIN_WEEKS = 104
+RIDGE_PENALTY = 1.0
+PRIOR_THEFTS = 0.5
+MAX_ITERATIONS = 50
+MAX_STEP = 2.0
+TOLERANCE = 1e-8
+CONFIDENCE = 0.95
+DAYS_PER_YEAR = 365.25
+
+
+def group_series(weekly, weeks):
+    # One row per region (summed over make types) followed by one per make
+    # type (summed over regions), one column per week of the grid.
+    positions = weeks.searchsorted(weekly['week'])
+    inside = positions < len(weeks)
+    inside[inside] = weeks[positions[inside]] == weekly['week'].to_numpy()[inside]
+    weekly, positions = weekly[inside], positions[inside]
+    blocks, keys = [], []
+    for group in FORECAST_GROUPS:
+        labels = weekly[group].cat.categories
+        counts = np.zeros((len(labels), len(weeks)))
+        np.add.at(counts, (weekly[group].cat.codes.to_numpy(), positions), weekly['count'].to_numpy())
+        blocks.append(counts)
+        keys.append(pd.DataFrame({'group': group, 'label': labels.astype(str)}))
+    counts = np.concatenate(blocks)
+    keys = pd.concat(keys, ignore_index=True)
+    active = counts.sum(axis=1) > 0
+    return keys[active].reset_index(drop=True), counts[active]
+
+
+def design_matrix(weeks, last, seasonal):
+    # Intercept, trend in years from the last observed week and, for seasonal
+    # fits, indicators of quarters two to four.
+    years = (weeks - last).days.to_numpy() / DAYS_PER_YEAR
+    columns = [np.ones(len(weeks)), years]
+    if seasonal:
+        quarters = weeks.quarter.to_numpy()
+        columns.extend((quarters == q).astype(np.float64) for q in (2, 3, 4))
+    return np.column_stack(columns)
+
+
+def fit_poisson(counts, design, penalty=RIDGE_PENALTY):
+    # Newton-Raphson for all series at once: the design matrix is shared, so
+    # each iteration is a handful of matrix products and one batched solve
+    # of the small (coefficients x coefficients) systems.
+    counts = counts + PRIOR_THEFTS / counts.shape[1]
+    n_series, n_coef = len(counts), design.shape[1]
+    outer = (design[:, :, None] * design[:, None, :]).reshape(len(design), n_coef * n_coef)
+    ridge = np.full(n_coef, penalty)
+    ridge[0] = 0.0
+    coef = np.zeros((n_series, n_coef))
+    coef[:, 0] = np.log(counts.mean(axis=1))
+    for iteration in range(1, MAX_ITERATIONS + 1):
+        mean = np.exp(np.clip(coef @ design.T, -30, 30))
+        gradient = (counts - mean) @ design - coef * ridge
+        hessian = (mean @ outer).reshape(n_series, n_coef, n_coef) + np.diag(ridge)
+        step = np.clip(np.linalg.solve(hessian, gradient[:, :, None])[:, :, 0], -MAX_STEP, MAX_STEP)
+        coef += step
+        if np.abs(step).max() < TOLERANCE:
+            break
+    mean = np.exp(np.clip(coef @ design.T, -30, 30))
+    hessian = (mean @ outer).reshape(n_series, n_coef, n_coef) + np.diag(ridge)
+    return coef, np.linalg.inv(hessian), iteration
+
+
+def fit_forecasts(weekly, first, last):
+    # The fitted parameters of every series of the selection; project() turns
+    # them into forecasts without touching the data again.
+    weeks = week_grid(first, last)
+    if len(weeks) < MIN_WEEKS:
+        return None
+    keys, counts = group_series(weekly, weeks)
+    if not len(keys):
+        return None
+    seasonal = len(weeks) >= SEASONAL_MIN_WEEKS
+    coef, cov, iterations = fit_poisson(counts, design_matrix(weeks, weeks[-1], seasonal))
+    return {
+        'keys': keys,
+        'weeks': weeks,
+        'counts': counts,
+        'seasonal': seasonal,
+        'coef': coef,
+        'cov': cov,
+        'iterations': iterations
+    }
+
+
+def project(fit, horizon=HORIZON_QUARTERS, confidence=CONFIDENCE):
+    # Weekly means with a band for the mean, and quarterly totals with a
+    # prediction interval: the parameter uncertainty by the delta method plus
+    # the Poisson noise of the count. The quarter in progress adds the thefts
+    # already observed in it to the projection of its remaining weeks.
+    weeks, counts, coef, cov = fit['weeks'], fit['counts'], fit['coef'], fit['cov']
+    first_quarter = (weeks[-1] + pd.Timedelta(days=7)).to_period('Q')
+    quarters = pd.period_range(first_quarter, periods=horizon + 1, freq='Q')
+    future = pd.date_range(weeks[-1] + pd.Timedelta(days=7), quarters[-1].end_time.normalize(), freq='W-MON')
+    design = design_matrix(future, weeks[-1], fit['seasonal'])
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    eta = coef @ design.T
+    eta_se = np.sqrt(np.einsum('fi,sij,fj->sf', design, cov, design))
+    mean = np.exp(eta)
+
+    in_quarter = (future.to_period('Q').to_numpy()[:, None] == quarters.to_numpy()[None, :]).astype(np.float64)
+    projected = mean @ in_quarter
+    gradient = np.einsum('sf,fi,fq->sqi', mean, design, in_quarter)
+    variance = np.einsum('sqi,sij,sqj->sq', gradient, cov, gradient) + projected
+    observed = np.zeros_like(projected)
+    observed[:, 0] = counts[:, weeks.to_period('Q') == quarters[0]].sum(axis=1)
+
+    n_series, n_quarters = projected.shape
+    table = pd.DataFrame({
+        'group': np.repeat(fit['keys']['group'].to_numpy(), n_quarters),
+        'label': np.repeat(fit['keys']['label'].to_numpy(), n_quarters),
+        'quarter': np.tile(quarters.astype(str), n_series),
+        'observed': observed.ravel().astype(np.int64),
+        'forecast': (observed + projected).ravel(),
+        'low': (observed + np.maximum(projected - z * np.sqrt(variance), 0)).ravel(),
+        'high': (observed + projected + z * np.sqrt(variance)).ravel(),
+        'trend': np.repeat(np.expm1(coef[:, 1] / 4), n_quarters)
+    })
+    return {
+        'table': table,
+        'keys': fit['keys'],
+        'future': future,
+        'mean': mean,
+        'low': np.exp(eta - z * eta_se),
+        'high': np.exp(eta + z * eta_se)
+    }
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+from region_stats import poisson_surprise
+
+# Each week is scored by the thefts of the last RECENT_WEEKS weeks against
+# the rate of the BASELINE_WEEKS weeks before them. PRIOR_COUNT thefts are
+# added to every baseline so that a series with no history gets a finite
+# expectation instead of an infinite surprise.
+RECENT_WEEKS = 4
+BASELINE_WEEKS = 12
+PRIOR_COUNT = 0.5
+MIN_RECENT = 3
+TOP_HOTSPOTS = 15
+HOTSPOT_COLUMNS = {'make_name': 'Make', 'vehicle_type': 'Vehicle type'}
+
+
+def week_grid(first, last):
+    # Mondays of the complete weeks between two days. A partial week at
+    # either end would read as a drop in thefts.
+    first, last = pd.Timestamp(first).normalize(), pd.Timestamp(last).normalize()
+    start = first + pd.Timedelta(days=(7 - first.weekday()) % 7)
+    end = last - pd.Timedelta(days=(last.weekday() + 1) % 7)
+    return pd.date_range(start, end - pd.Timedelta(days=6), freq='W-MON')
+
+
+def series_matrix(weekly, column, weeks):
+    # One row per (region, label) pair with thefts in the grid, one column
+    # per week: the long weekly counts scattered into a dense 2-D array.
+    positions = weeks.searchsorted(weekly['week'])
+    inside = positions < len(weeks)
+    inside[inside] = weeks[positions[inside]] == weekly['week'].to_numpy()[inside]
+    weekly, positions = weekly[inside], positions[inside]
+    n_values = len(weekly[column].cat.categories)
+    pairs = weekly['region'].cat.codes.to_numpy().astype(np.int64) * n_values + weekly[column].cat.codes.to_numpy()
+    series_ids, series = np.unique(pairs, return_inverse=True)
+    counts = np.zeros((len(series_ids), len(weeks)))
+    counts[series, positions] = weekly['count'].to_numpy()
+    keys = pd.DataFrame({
+        'region': pd.Categorical.from_codes(series_ids // n_values, dtype=weekly['region'].dtype),
+        column: pd.Categorical.from_codes(series_ids % n_values, dtype=weekly[column].dtype)
+    })
+    return keys, counts
+
+
+def rolling_scores(counts, recent=RECENT_WEEKS, baseline=BASELINE_WEEKS, prior=PRIOR_COUNT, last=None):
+    # Every series and every week at once from running totals: column j
+    # scores the recent window ending with week baseline + recent - 1 + j.
+    # last=n keeps only the n latest windows.
+    totals = np.concatenate([np.zeros((len(counts), 1)), np.cumsum(counts, axis=1)], axis=1)
+    ends = np.arange(recent + baseline, counts.shape[1] + 1)
+    if last:
+        ends = ends[-last:]
+    observed = totals[:, ends] - totals[:, ends - recent]
+    history = totals[:, ends - recent] - totals[:, ends - recent - baseline]
+    expected = (history + prior) * recent / baseline
+    z = (observed - expected) / np.sqrt(expected)
+    return observed, expected, z, poisson_surprise(observed, expected)
+
+
+def detect_hotspots(weekly, column, first, last, top=TOP_HOTSPOTS, recent=RECENT_WEEKS, baseline=BASELINE_WEEKS):
+    # The series whose latest recent window is most surprising given their
+    # own baseline, with at least MIN_RECENT thefts in it.
+    weeks = week_grid(first, last)
+    if len(weeks) < recent + baseline:
+        return None
+    keys, counts = series_matrix(weekly, column, weeks)
+    observed, expected, z, surprise = rolling_scores(counts, recent, baseline, last=1)
+    latest = pd.DataFrame({
+        'recent': observed[:, -1].astype(np.int64),
+        'expected': expected[:, -1],
+        'ratio': observed[:, -1] / expected[:, -1],
+        'z': z[:, -1],
+        'surprise': surprise[:, -1]
+    })
+    hotspots = pd.concat([keys, latest], axis=1)
+    hotspots = hotspots[(hotspots['recent'] >= MIN_RECENT) & (hotspots['z'] > 0)]
+    hotspots = hotspots.sort_values(['surprise', 'recent'], ascending=False, kind='stable').head(top)
+    return {
+        'hotspots': hotspots.reset_index(drop=True),
+        'weeks': weeks,
+        'window': (weeks[-recent], weeks[-1] + pd.Timedelta(days=6)),
+        'series': len(keys),
+        'counts': counts[hotspots.index]
+    }
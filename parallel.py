@@ -0,0 +1,44 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cube import CUBE_DIMS, build_cube, merge_cubes
+
+WORKERS = int(os.environ.get('THEFT_WORKERS', os.cpu_count() or 1))
+MIN_PARTITION_ROWS = 250_000
+TASKS_PER_WORKER = 2
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(workers):
+    # Spawned rather than forked: the Streamlit server runs several threads
+    # and a forked child would inherit whatever locks they hold.
+    with pools_lock:
+        pool = pools.get(workers)
+        if pool is None:
+            pool = pools[workers] = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return pool
+
+
+def partitions(rows, workers):
+    n_parts = min(workers * TASKS_PER_WORKER, len(rows) // MIN_PARTITION_ROWS)
+    return np.array_split(rows, max(n_parts, 1))
+
+
+def parallel_cube(frame, rows, workers=WORKERS):
+    # When rows come from the region posting lists, each partition covers a
+    # contiguous run of regions, so the partial cubes barely overlap and
+    # merging them is cheap.
+    columns = frame.columns.get_indexer(CUBE_DIMS[:-1] + ['date_stolen'])
+    parts = partitions(rows, workers) if workers > 1 else [rows]
+    if len(parts) == 1:
+        return build_cube(frame.iloc[rows, columns])
+    cubes = get_pool(workers).map(build_cube, (frame.iloc[part, columns] for part in parts))
+    return merge_cubes(list(cubes))
@@ -0,0 +1,94 @@
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import time
+
+import pandas as pd
+import plotly.io as pio
+
+PHASES = ['compute', 'figure', 'send']
+TIMINGS_LOG = os.environ.get('THEFT_TIMINGS_LOG', 'render_timings.jsonl')
+PROFILE_DIR = os.environ.get('THEFT_PROFILE_DIR', 'profiles')
+
+
+class RerunTimer:
+    # Lap timer for one script run: lap(section, phase) charges the time since
+    # the previous lap to that section and phase, so the dashboard code only
+    # needs a call at each boundary instead of a block per section.
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.sections = {}
+        self.payloads = []
+        self.marks = {}
+
+    def lap(self, section, phase):
+        now = time.perf_counter()
+        phases = self.sections.setdefault(section, dict.fromkeys(PHASES, 0.0))
+        phases[phase] += (now - self.last) * 1000
+        self.last = now
+
+    def mark(self, name):
+        self.marks[name] = round((time.perf_counter() - self.started) * 1000, 2)
+
+    def payload(self, section, fig):
+        # Serialising the figure a second time to measure it is not charged
+        # to any section.
+        layout = fig['layout'] if isinstance(fig, dict) else fig.layout.to_plotly_json()
+        title = layout.get('title', {}).get('text') or section
+        size = len(pio.to_json(fig, validate=False).encode())
+        self.payloads.append({'section': section, 'figure': title, 'bytes': size})
+        self.last = time.perf_counter()
+
+    def payload_table(self):
+        table = pd.DataFrame(self.payloads, columns=['section', 'figure', 'bytes'])
+        table['KB'] = table.pop('bytes') / 1024
+        return table
+
+    def table(self):
+        table = pd.DataFrame.from_dict(self.sections, orient='index', columns=PHASES)
+        table['total'] = table.sum(axis=1)
+        table.loc['TOTAL'] = table.sum()
+        return table.rename_axis('section')
+
+    def record(self, **extra):
+        return {
+            'timestamp': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'total_ms': round((self.last - self.started) * 1000, 2),
+            'sections': {
+                section: {phase: round(ms, 2) for phase, ms in phases.items()}
+                for section, phases in self.sections.items()
+            },
+            'payload_bytes': self.payloads,
+            'marks': self.marks,
+            **extra
+        }
+
+
+def append_log(record, path=TIMINGS_LOG):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_profile(profiler, directory=PROFILE_DIR, top=30):
+    # Only the script thread is profiled; the .prof file opens in snakeviz or
+    # pstats, and the text summary is what the debug panel shows.
+    profiler.disable()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime('rerun-%Y%m%d-%H%M%S.prof'))
+    profiler.dump_stats(path)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(top)
+    return path, summary.getvalue()
@@ -0,0 +1,101 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+CONFIDENCE = 0.95
+
+
+def t_quantile(p, df):
+    # Exact for one and two degrees of freedom; beyond that the
+    # Cornish-Fisher expansion around the normal quantile. For the 97.5%
+    # quantile it is 0.12% low at three degrees of freedom, within 0.05%
+    # from four and within 0.002% from seven up.
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def linear_fit(x, y, confidence=CONFIDENCE):
+    # Ordinary least squares of y on x from the centred sums, with the same
+    # coefficients, r and t-based intervals statsmodels reports.
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    fit = {'n': n, 'slope': np.nan, 'intercept': np.nan, 'r': np.nan, 'r2': np.nan,
+           'slope_ci': (np.nan, np.nan), 'intercept_ci': (np.nan, np.nan)}
+    if n < 2:
+        return fit
+    x_mean, y_mean = x.mean(), y.mean()
+    dx, dy = x - x_mean, y - y_mean
+    sxx, syy, sxy = dx @ dx, dy @ dy, dx @ dy
+    if sxx == 0:
+        return fit
+    slope = sxy / sxx
+    fit.update(slope=slope, intercept=y_mean - slope * x_mean)
+    if syy > 0:
+        fit.update(r=sxy / math.sqrt(sxx * syy), r2=sxy * sxy / (sxx * syy))
+    if n > 2:
+        s2 = max(syy - slope * sxy, 0.0) / (n - 2)
+        t = t_quantile(0.5 + confidence / 2, n - 2)
+        slope_se = math.sqrt(s2 / sxx)
+        intercept_se = math.sqrt(s2 * (1 / n + x_mean ** 2 / sxx))
+        fit.update(
+            slope_ci=(slope - t * slope_se, slope + t * slope_se),
+            intercept_ci=(fit['intercept'] - t * intercept_se, fit['intercept'] + t * intercept_se)
+        )
+    return fit
+
+
+def poisson_interval(counts, confidence=CONFIDENCE):
+    # Byar's approximation to the exact interval of a Poisson count: within
+    # 1% of it from five events up, and slightly wider below.
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    k = np.asarray(counts, dtype=np.float64)
+    safe = np.maximum(k, 1)
+    lower = np.where(k > 0, safe * (1 - 1 / (9 * safe) - z / (3 * np.sqrt(safe))) ** 3, 0.0)
+    upper = (k + 1) * (1 - 1 / (9 * (k + 1)) + z / (3 * np.sqrt(k + 1))) ** 3
+    return lower, upper
+
+
+def per_capita_rates(counts, population, per=10_000, confidence=CONFIDENCE):
+    # Rates and their intervals for every region in one vectorised pass.
+    scale = per / np.asarray(population, dtype=np.float64)
+    lower, upper = poisson_interval(counts, confidence)
+    return np.asarray(counts) * scale, lower * scale, upper * scale
+
+
+# Coefficients of the Numerical Recipes erfc approximation, fractional error
+# below 1.2e-7 for every argument, lowest power first.
+ERFC_COEFFICIENTS = [
+    -1.26551223, 1.00002368, 0.37409196, 0.09678418, -0.18628806,
+    0.27886807, -1.13520398, 1.48851587, -0.82215223, 0.17087277
+]
+
+
+def log_normal_sf(z):
+    # log P(Z > z) for a standard normal, element-wise and without underflow
+    # far into the tail.
+    z = np.asarray(z, dtype=np.float64)
+    x = np.abs(z) / math.sqrt(2)
+    t = 1 / (1 + 0.5 * x)
+    tail = math.log(0.5) + np.log(t) - x * x + np.polyval(ERFC_COEFFICIENTS[::-1], t)
+    return np.where(z >= 0, tail, np.log1p(-np.exp(tail)))
+
+
+def poisson_surprise(observed, expected):
+    # -log10 P(X >= observed) for X ~ Poisson(expected), using Byar's
+    # approximation: slightly conservative in the far tail, exactly 0 when
+    # nothing was observed.
+    k = np.asarray(observed, dtype=np.float64)
+    mu = np.asarray(expected, dtype=np.float64)
+    safe = np.maximum(k, 1)
+    z = 3 * np.sqrt(safe) * (1 - 1 / (9 * safe) - np.cbrt(mu / safe))
+    return np.where(k > 0, -log_normal_sf(z) / math.log(10), 0.0)
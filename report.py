@@ -0,0 +1,203 @@
+import argparse
+import html
+import importlib.util
+import json
+import os
+import re
+import time
+import unicodedata
+
+import plotly.offline
+
+from charts import (
+    age_figure, build_density_figure, color_figure, location_figure, make_color_figure, make_type_figure,
+    model_region_figure, model_year_figure, models_figure, quarterly_figure, rate_table_figure, top_makes_figure,
+    vehicle_type_figure
+)
+from engines import ENGINES, open_dataset
+from parallel import WORKERS, get_pool
+from result_cache import ResultCache
+from selection import Selection
+
+REPORT_DIR = 'reports'
+FORMATS = ['html', 'csv', 'png']
+NATIONAL = 'national'
+
+
+def slug(name):
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', '-', ascii_name.lower()).strip('-')
+
+
+def in_regions(frame, filters):
+    if not filters.get('regions'):
+        return frame
+    return frame[frame['region'].isin(filters['regions'])]
+
+
+class ReportData:
+    # The part of the dataset interface the report's selections use,
+    # answered from one aggregation pass over the whole dataset: region is a
+    # cube dimension, so each region's cells and model counts are exact
+    # slices of the national ones.
+
+    def __init__(self, dataset):
+        self.regions = dataset.regions
+        self.all_cells = dataset.cells({})
+        self.all_model_regions = dataset.model_region_counts({})
+
+    def cells(self, filters):
+        return in_regions(self.all_cells, filters)
+
+    def model_region_counts(self, filters):
+        return in_regions(self.all_model_regions, filters)
+
+
+def view_frames(selection):
+    return {
+        'model_count': selection.model_count(),
+        'model_regions': selection.model_regions(),
+        'top_makes': selection.top_makes(),
+        'make_type_counts': selection.make_type_counts().rename_axis('make_type').reset_index(name='count'),
+        'location_counts': selection.location_counts(),
+        'region_data': selection.region_data(),
+        'top5': selection.top5(),
+        'bottom5': selection.bottom5(),
+        'quarterly_counts': selection.quarterly_counts(),
+        'model_year_counts': selection.model_year_counts(),
+        'age_type_trend': selection.age_type_trend(),
+        'color_counts': selection.color_counts(),
+        'type_counts': selection.type_counts(),
+        'maker_color_counts': selection.maker_color_counts()
+    }
+
+
+def view_figures(frames, kpis, fit):
+    figures = {
+        'models': models_figure(frames['model_count']),
+        'top_makes': top_makes_figure(frames['top_makes']),
+        'make_types': make_type_figure(frames['make_type_counts'].set_index('make_type')['count']),
+        'locations': location_figure(frames['location_counts']),
+        'model_regions': model_region_figure(frames['model_regions'], frames['model_count'])
+    }
+    # A correlation across regions needs more than one of them.
+    if len(frames['region_data']) > 1:
+        figures['density'] = build_density_figure(frames['region_data'], fit)
+    figures.update({
+        'top_rates': rate_table_figure(frames['top5'], '#636EFA', 'rgba(99, 110, 250, 0.1)'),
+        'bottom_rates': rate_table_figure(frames['bottom5'], '#EF553B', 'rgba(239, 85, 59, 0.1)'),
+        'quarterly': quarterly_figure(frames['quarterly_counts']),
+        'model_years': model_year_figure(frames['model_year_counts']),
+        'age': age_figure(frames['age_type_trend']),
+        'colors': color_figure(frames['color_counts']),
+        'vehicle_types': vehicle_type_figure(frames['type_counts']),
+        'make_colors': make_color_figure(frames['maker_color_counts'], kpis['top10_makers'])
+    })
+    return figures
+
+
+def kpi_summary(title, kpis):
+    return {
+        'view': title,
+        'total_thefts': kpis['total_thefts'],
+        'unique_makes': kpis['unique_makes'],
+        'total_luxury': kpis['total_luxury'],
+        'avg_age': kpis['avg_age'],
+        'most_stolen': kpis['most_stolen'],
+        'theft_rate': kpis['theft_rate'],
+        'top10_makers': [str(make) for make in kpis['top10_makers']]
+    }
+
+
+def render_view(title, frames, kpis, fit, out_dir, formats):
+    # Runs in a worker process: the view's frames arrive computed, so the
+    # workers only build and write the figures.
+    started = time.perf_counter()
+    view_dir = os.path.join(out_dir, slug(title))
+    os.makedirs(view_dir, exist_ok=True)
+    figures = view_figures(frames, kpis, fit)
+
+    if 'csv' in formats:
+        for name, frame in frames.items():
+            frame.to_csv(os.path.join(view_dir, f'{name}.csv'), index=False)
+    if 'png' in formats:
+        for name, fig in figures.items():
+            fig.write_image(os.path.join(view_dir, f'{name}.png'), width=1200, height=fig.layout.height or 500)
+    if 'html' in formats:
+        # plotly.js is written once next to the views and shared by them.
+        body = '\n'.join(
+            fig.to_html(full_html=False, include_plotlyjs='../plotly.min.js' if i == 0 else False)
+            for i, fig in enumerate(figures.values())
+        )
+        heading = html.escape(title)
+        with open(os.path.join(view_dir, 'index.html'), 'w', encoding='utf-8') as f:
+            f.write(
+                f"<!DOCTYPE html>\n<html><head><meta charset='utf-8'><title>{heading} — Vehicle Thefts</title></head>"
+                f"<body><h1>{heading}</h1><p>{kpis['total_thefts']:,} thefts · {kpis['unique_makes']:,} makes · "
+                f"most stolen: {html.escape(str(kpis['most_stolen']))}</p>\n{body}\n</body></html>\n"
+            )
+    with open(os.path.join(view_dir, 'kpis.json'), 'w') as f:
+        json.dump(kpi_summary(title, kpis), f, indent=1, default=str)
+    return title, len(figures), time.perf_counter() - started
+
+
+def write_index(out_dir, titles):
+    links = '\n'.join(f"<li><a href='{slug(title)}/index.html'>{html.escape(title)}</a></li>" for title in titles)
+    with open(os.path.join(out_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(
+            "<!DOCTYPE html>\n<html><head><meta charset='utf-8'><title>Vehicle Theft Report</title></head>"
+            f"<body><h1>Vehicle Theft Report</h1><ul>\n{links}\n</ul></body></html>\n"
+        )
+
+
+def build_report(dataset, out_dir=REPORT_DIR, formats=('html', 'csv'), workers=WORKERS, views=None):
+    # Every view is a selection, computed through the same Selection class
+    # as the dashboard; only the figures are built in the workers.
+    data = ReportData(dataset)
+    os.makedirs(out_dir, exist_ok=True)
+    if 'html' in formats:
+        with open(os.path.join(out_dir, 'plotly.min.js'), 'w') as f:
+            f.write(plotly.offline.get_plotlyjs())
+
+    views_filters = [(NATIONAL.title(), {})]
+    views_filters += [(str(region), {'regions': [str(region)]}) for region in data.regions['region']]
+    cache = ResultCache()
+    jobs = []
+    for title, filters in views_filters:
+        if views and slug(title) not in views:
+            continue
+        selection = Selection(data, cache, filters)
+        jobs.append((title, view_frames(selection), selection.kpis(), selection.density_fit()))
+
+    if workers > 1 and len(jobs) > 1:
+        pool = get_pool(workers)
+        futures = [pool.submit(render_view, *job, out_dir, formats) for job in jobs]
+        results = [future.result() for future in futures]
+    else:
+        results = [render_view(*job, out_dir, formats) for job in jobs]
+    if 'html' in formats:
+        write_index(out_dir, [title for title, _, _ in results])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the dashboard charts for the nation and every region to static files.')
+    parser.add_argument('--out', default=REPORT_DIR)
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['html', 'csv'])
+    parser.add_argument('--engine', choices=list(ENGINES), help='Defaults to THEFT_ENGINE')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--views', nargs='+', help="Only these views, e.g. national auckland")
+    args = parser.parse_args()
+    if 'png' in args.formats and importlib.util.find_spec('kaleido') is None:
+        parser.error('PNG export needs kaleido: pip install kaleido')
+
+    started = time.perf_counter()
+    dataset = open_dataset(args.engine)
+    results = build_report(dataset, args.out, args.formats, args.workers, args.views)
+    for title, n_figures, seconds in results:
+        print(f"{title:<24}{n_figures:>3} charts {seconds * 1000:>8.0f} ms")
+    print(f"Wrote {len(results)} views to {args.out} in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
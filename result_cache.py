@@ -0,0 +1,144 @@
+import hashlib
+import json
+import math
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 3600
+
+
+def canonical_filters(filters):
+    # Empty selections are equivalent to no selection and the order in which
+    # values were picked in a multiselect does not change the result.
+    canonical = {}
+    for key, value in filters.items():
+        if not value:
+            continue
+        if key == 'date_range':
+            canonical[key] = [str(part) for part in value]
+        else:
+            canonical[key] = sorted(str(part) for part in value)
+    return canonical
+
+
+def filters_key(filters):
+    payload = json.dumps(canonical_filters(filters), sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class ResultCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.filter_states = {}
+        self.lock = threading.Lock()
+        # Bumped by clear() and invalidate(); a result whose compute started
+        # under an older generation may predate the new data and is not kept.
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, name, filters, compute, ttl_seconds=None):
+        # ttl_seconds overrides the cache's TTL for this entry; math.inf keeps
+        # it until it is evicted or invalidated.
+        key = (name, filters_key(filters))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self.generation
+
+        value = compute()
+
+        with self.lock:
+            if generation != self.generation:
+                return value
+            self.filter_states[key[1]] = canonical_filters(filters)
+            ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            if len(self.filter_states) > self.max_entries:
+                live = {state for _, state in self.entries}
+                self.filter_states = {
+                    state: filters for state, filters in self.filter_states.items() if state in live
+                }
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.filter_states.clear()
+            self.generation += 1
+
+    def invalidate(self, affected):
+        # Drops the entries of every filter state for which affected(filters)
+        # is true; results for the other selections are kept.
+        with self.lock:
+            self.generation += 1
+            stale = {
+                state for state, filters in self.filter_states.items()
+                if affected(filters)
+            }
+            for key in [key for key in self.entries if key[1] in stale]:
+                del self.entries[key]
+            for state in stale:
+                del self.filter_states[state]
+            return len(stale)
+
+    def save(self, path, tag):
+        # The tag names the dataset the results were computed from; load()
+        # ignores a file written for any other.
+        with self.lock:
+            items = [
+                (key, self.filter_states[key[1]], value, math.isinf(expiry))
+                for key, (expiry, value) in self.entries.items()
+            ]
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'tag': tag, 'items': items}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return len(items)
+
+    def load(self, path, tag):
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+        if saved['tag'] != tag:
+            return 0
+        # Expiry times are monotonic clock readings, which do not carry over
+        # between processes, so loaded entries start a fresh TTL unless they
+        # were kept without one.
+        expires = time.monotonic() + self.ttl_seconds
+        with self.lock:
+            for key, filters, value, pinned in saved['items'][-self.max_entries:]:
+                self.filter_states[key[1]] = filters
+                self.entries[key] = (math.inf if pinned else expires, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return min(len(saved['items']), self.max_entries)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
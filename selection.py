@@ -0,0 +1,147 @@
+import datetime
+import math
+
+from charts import (
+    build_density_figure, color_frame, compute_kpis, compute_region_data, density_fit, format_rate_table,
+    location_frame, make_type_frame, maker_color_frame, model_count_frame, top_makes_frame, vehicle_type_frame
+)
+from cube import age_type_counts, model_year_counts, quarterly_counts
+from forecast import fit_forecasts, project
+from hotspots import detect_hotspots
+
+# Every result of a selection, in an order where each only needs earlier ones.
+RESULTS = [
+    'cells', 'kpis', 'model_regions', 'model_count', 'distinct_models', 'top_makes', 'make_type_counts',
+    'location_counts', 'region_data', 'density_fit', 'density_figure', 'top5', 'bottom5', 'quarterly_counts',
+    'model_year_counts', 'age_type_trend', 'color_counts', 'type_counts', 'maker_color_counts', 'make_hotspots',
+    'type_hotspots', 'forecast_fit'
+]
+SPAN_RESULTS = {'make_hotspots', 'type_hotspots'}
+SIZE_RESULTS = {'forecast_fit', 'forecast'}
+
+
+class Selection:
+    # The numbers the dashboard shows for one filter selection. Each result
+    # is computed on first use and kept in the shared result cache under its
+    # name, so the dashboard, the warm-up and the JSON API reuse each other's
+    # work.
+
+    def __init__(self, dataset, cache, filters):
+        self.dataset = dataset
+        self.cache = cache
+        self.filters = filters
+
+    def cached(self, name, compute, ttl_seconds=None):
+        return self.cache.get_or_compute(name, self.filters, compute, ttl_seconds)
+
+    def cells(self):
+        return self.cached('cells', lambda: self.dataset.cells(self.filters))
+
+    def kpis(self):
+        return self.cached('kpis', lambda: compute_kpis(self.dataset.regions, self.cells()))
+
+    def model_regions(self):
+        return self.cached('model_regions', lambda: self.dataset.model_region_counts(self.filters))
+
+    def model_count(self):
+        return self.cached('model_count', lambda: model_count_frame(self.model_regions()))
+
+    def distinct_models(self):
+        return self.cached('distinct_models', lambda: self.dataset.distinct_models(self.filters))
+
+    def top_makes(self):
+        return self.cached('top_makes', lambda: top_makes_frame(self.cells()))
+
+    def make_type_counts(self):
+        return self.cached('make_type_counts', lambda: make_type_frame(self.cells()))
+
+    def location_counts(self):
+        return self.cached('location_counts', lambda: location_frame(self.cells()))
+
+    def region_data(self):
+        return self.cached('region_data', lambda: compute_region_data(self.dataset.regions, self.cells()))
+
+    def density_fit(self):
+        return self.cached('density_fit', lambda: density_fit(self.region_data()))
+
+    def density_figure(self):
+        return self.cached('density_figure', lambda: build_density_figure(self.region_data(), self.density_fit()).to_dict())
+
+    def top5(self):
+        return self.cached('top5', lambda: format_rate_table(self.region_data().nlargest(5, 'thefts_per_10k_pop')))
+
+    def bottom5(self):
+        return self.cached('bottom5', lambda: format_rate_table(self.region_data().nsmallest(5, 'thefts_per_10k_pop')))
+
+    def quarterly_counts(self):
+        return self.cached('quarterly_counts', lambda: quarterly_counts(self.cells()))
+
+    def model_year_counts(self):
+        return self.cached('model_year_counts', lambda: model_year_counts(self.cells()))
+
+    def age_type_trend(self):
+        return self.cached('age_type_trend', lambda: age_type_counts(self.cells(), datetime.datetime.now().year))
+
+    def color_counts(self):
+        return self.cached('color_counts', lambda: color_frame(self.cells()))
+
+    def type_counts(self):
+        return self.cached('type_counts', lambda: vehicle_type_frame(self.cells()))
+
+    def maker_color_counts(self):
+        return self.cached('maker_color_counts', lambda: maker_color_frame(self.cells()))
+
+    def date_span(self):
+        date_range = self.filters.get('date_range')
+        if date_range and len(date_range) == 2:
+            return date_range
+        return self.dataset.date_bounds()
+
+    def span_scope(self):
+        return '@{:%Y-%m-%d}..{:%Y-%m-%d}'.format(*self.date_span())
+
+    def size_scope(self):
+        return f'@{self.dataset.n_rows}'
+
+    def scope(self, name):
+        # What a result depends on beyond the filters, as a suffix for the
+        # names it and anything made from it are cached under: new data can
+        # widen the date span or add rows without touching the selection.
+        if name in SPAN_RESULTS:
+            return self.span_scope()
+        if name in SIZE_RESULTS:
+            return self.size_scope()
+        return ''
+
+    def hotspots(self, column):
+        # Without a date filter the weeks run over the dataset's date span,
+        # so the span is part of the name.
+        first, last = self.date_span()
+        return self.cached(
+            f'hotspots_{column}{self.span_scope()}',
+            lambda: detect_hotspots(self.dataset.weekly_counts(self.filters, column), column, first, last)
+        )
+
+    def make_hotspots(self):
+        return self.hotspots('make_name')
+
+    def type_hotspots(self):
+        return self.hotspots('vehicle_type')
+
+    def forecast_fit(self):
+        # The fitted parameters do not expire: they are named after the row
+        # count, so only new data makes a selection refit, and projecting
+        # them is cheap enough to redo on every rerun.
+        return self.cached(
+            f'forecast_fit{self.size_scope()}',
+            lambda: fit_forecasts(self.dataset.weekly_counts(self.filters, 'make_type'), *self.date_span()),
+            ttl_seconds=math.inf
+        )
+
+    def forecast(self):
+        fit = self.forecast_fit()
+        return None if fit is None else project(fit)
+
+    def compute_all(self):
+        for name in RESULTS:
+            getattr(self, name)()
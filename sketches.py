@@ -0,0 +1,154 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+
+# Error bounds, for N counted incidents:
+#   Space-Saving with k counters overestimates any count by at most N / k and
+#   keeps every label whose count exceeds N / k.
+#   Count-Min with width w and depth d overestimates a count by at most
+#   e * N / w with probability 1 - exp(-d).
+#   HyperLogLog with 2**p registers has a relative standard error of
+#   1.04 / sqrt(2**p).
+CAPACITY = int(os.environ.get('THEFT_SKETCH_CAPACITY', 1024))
+CMS_WIDTH = 2048
+CMS_DEPTH = 5
+HLL_PRECISION = 14
+
+
+def hash_labels(labels):
+    # pandas hashes with a fixed key, so the same label hashes the same in
+    # every chunk and every worker process.
+    return pd.util.hash_array(np.asarray(labels, dtype=object))
+
+
+class SpaceSaving:
+    # Heavy hitters as label -> (count, error). Counts never underestimate;
+    # error bounds the overestimate of each monitored label.
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64')
+        self.errors = pd.Series(dtype='int64')
+
+    def floor(self):
+        # The most a label that is not monitored can have been counted.
+        return int(self.counts.min()) if len(self.counts) >= self.capacity else 0
+
+    def combine(self, counts, errors, floor):
+        # The mergeable-summaries rule: a label missing from a full summary
+        # may have up to that summary's floor.
+        index = self.counts.index.union(counts.index)
+        own_floor = self.floor()
+        merged = self.counts.reindex(index, fill_value=own_floor) + counts.reindex(index, fill_value=floor)
+        errors = self.errors.reindex(index, fill_value=own_floor) + errors.reindex(index, fill_value=floor)
+        keep = merged.sort_values(ascending=False, kind='stable').index[:self.capacity]
+        self.counts = merged[keep].astype('int64')
+        self.errors = errors[keep].astype('int64')
+
+    def add(self, labels, counts):
+        counts = pd.Series(np.asarray(counts, dtype='int64'), index=pd.Index(labels))
+        self.combine(counts, pd.Series(0, index=counts.index, dtype='int64'), 0)
+
+    def merge(self, other):
+        self.combine(other.counts, other.errors, other.floor())
+
+    def estimate(self, labels):
+        return self.counts.reindex(labels, fill_value=self.floor()).to_numpy()
+
+
+class CountMin:
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH):
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def columns(self, hashes):
+        # Double hashing: row i probes h1 + i * h2.
+        h1 = hashes & np.uint64(0xffffffff)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        depth, width = self.table.shape
+        return [((h1 + np.uint64(i) * h2) % np.uint64(width)).astype(np.intp) for i in range(depth)]
+
+    def add(self, hashes, counts):
+        counts = np.asarray(counts, dtype=np.int64)
+        for row, columns in zip(self.table, self.columns(hashes)):
+            np.add.at(row, columns, counts)
+
+    def merge(self, other):
+        self.table += other.table
+
+    def estimate(self, hashes):
+        return np.min([row[columns] for row, columns in zip(self.table, self.columns(hashes))], axis=0)
+
+
+class HyperLogLog:
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, hashes):
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        # The top 32 of the remaining bits are enough below billions of
+        # labels and convert to float exactly.
+        rest = ((hashes << p) >> np.uint64(32)).astype(np.float64)
+        rank = np.where(rest > 0, 32 - np.floor(np.log2(np.maximum(rest, 1))), 33).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate while registers are empty.
+            return int(round(m * np.log(m / zeros)))
+        return int(round(raw))
+
+
+class RankingSketch:
+    # Top-k counts and the distinct count of one label column, fed with
+    # (label, count) pairs and mergeable across partitions.
+
+    def __init__(self, capacity=CAPACITY):
+        self.top = SpaceSaving(capacity)
+        self.cms = CountMin()
+        self.hll = HyperLogLog()
+        self.total = 0
+
+    def add(self, labels, counts):
+        hashes = hash_labels(labels)
+        self.top.add(labels, counts)
+        self.cms.add(hashes, counts)
+        self.hll.add(hashes)
+        self.total += int(np.sum(counts))
+
+    def merge(self, other):
+        self.top.merge(other.top)
+        self.cms.merge(other.cms)
+        self.hll.merge(other.hll)
+        self.total += other.total
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+    def estimate(self, labels):
+        # Both sketches only overestimate, so the smaller answer is closer.
+        return np.minimum(self.top.estimate(labels), self.cms.estimate(hash_labels(labels)))
+
+    def heavy_hitters(self, n):
+        labels = self.top.counts.index[:n]
+        return pd.Series(self.estimate(labels), index=labels).sort_values(ascending=False, kind='stable')
+
+    def distinct(self):
+        return self.hll.estimate()
+
+
+def merge_sketches(sketches):
+    merged = RankingSketch()
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
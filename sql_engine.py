@@ -0,0 +1,219 @@
+import datetime
+import os
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+
+import pandas as pd
+
+from cube import CUBE_DIMS
+from dataset import CSV_PATH, DELTA_DIR, REGION_COLS, read_csv_typed
+from filter_index import FILTER_COLUMNS
+from streaming import CHUNK_ROWS, GLOBAL_COLS, MODEL_DIMS, csv_chunks, merge_labels
+
+DATABASE_PATH = os.environ.get('THEFT_DATABASE', 'stolen_vehicles_enhanced.sqlite')
+DATABASE_VERSION = '2'
+
+INDEXED_COLS = list(FILTER_COLUMNS.values()) + ['date_stolen']
+
+
+def source_token(csv_path):
+    stat = os.stat(csv_path)
+    return f"{DATABASE_VERSION}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def sql_rows(df):
+    # Dates are stored as ISO day strings so that range predicates compare
+    # lexically and can use the index; the quarter is precomputed because
+    # SQLite has no quarter function.
+    rows = df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+    rows['quarter'] = df['date_stolen'].dt.to_period('Q').astype(str)
+    rows['date_stolen'] = df['date_stolen'].dt.strftime('%Y-%m-%d')
+    return rows
+
+
+@contextmanager
+def connect(database_path):
+    # sqlite3's own context manager only commits, it does not close.
+    with closing(sqlite3.connect(database_path)) as con, con:
+        yield con
+
+
+def database_is_fresh(csv_path=CSV_PATH, database_path=DATABASE_PATH):
+    if not os.path.exists(database_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    with connect(database_path) as con:
+        row = con.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+    return row is not None and row[0] == source_token(csv_path)
+
+
+def write_database(csv_path=CSV_PATH, database_path=DATABASE_PATH, chunk_rows=CHUNK_ROWS):
+    tmp_path = database_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    with connect(tmp_path) as con:
+        for chunk in csv_chunks(csv_path, chunk_rows):
+            sql_rows(chunk).to_sql('thefts', con, if_exists='append', index=False)
+        for col in INDEXED_COLS + ['vehicle_id']:
+            con.execute(f"CREATE INDEX idx_thefts_{col} ON thefts ({col})")
+        con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        con.execute("CREATE TABLE applied_deltas (name TEXT PRIMARY KEY)")
+        con.execute("INSERT INTO meta VALUES ('source', ?)", (source_token(csv_path),))
+    os.replace(tmp_path, database_path)
+
+
+def known_ids(con, ids):
+    # The vehicle_ids of a delta that are already loaded, found through the
+    # vehicle_id index rather than by reading the table's ids.
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS incoming (vehicle_id INTEGER PRIMARY KEY)")
+    con.execute("DELETE FROM incoming")
+    con.executemany("INSERT OR IGNORE INTO incoming VALUES (?)", ((int(i),) for i in ids))
+    rows = con.execute(
+        "SELECT DISTINCT incoming.vehicle_id FROM incoming JOIN thefts ON thefts.vehicle_id = incoming.vehicle_id"
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def where_clause(filters):
+    # Mirrors FilterIndex.select(): OR within a dimension, AND across
+    # dimensions, and an inclusive day range.
+    clauses, params = [], []
+    for key, col in FILTER_COLUMNS.items():
+        if filters.get(key):
+            values = [str(value) for value in filters[key]]
+            clauses.append(f"{col} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    date_range = filters.get('date_range')
+    if date_range and len(date_range) == 2:
+        start, end = (pd.Timestamp(part).date() for part in date_range)
+        clauses.append("date_stolen >= ? AND date_stolen < ?")
+        params.extend([start.isoformat(), (end + datetime.timedelta(days=1)).isoformat()])
+    if not clauses:
+        return '', params
+    return 'WHERE ' + ' AND '.join(clauses), params
+
+
+class SqlDataset:
+    # Same interface as dataset.Dataset, backed by an SQLite file with an
+    # index per filter column. Every selection is answered by a GROUP BY
+    # query, so only the aggregated cells reach pandas.
+
+    def __init__(self, csv_path=CSV_PATH, database_path=DATABASE_PATH):
+        if not database_is_fresh(csv_path, database_path):
+            write_database(csv_path, database_path)
+        self.database_path = database_path
+        self.lock = threading.Lock()
+        self.seen_deltas = set()
+        self.dtypes = {}
+        self.sketched = False
+        self.refresh()
+
+    def query(self, sql, params=()):
+        # A connection per query keeps the engine safe to share between
+        # Streamlit sessions; opening an SQLite file is cheap.
+        with connect(self.database_path) as con:
+            return pd.read_sql_query(sql, con, params=params)
+
+    def refresh(self):
+        # Labels added by a delta go after the known ones, so cached results
+        # keep their category codes.
+        dtypes = {}
+        for col in GLOBAL_COLS:
+            labels = self.query(f"SELECT DISTINCT {col} FROM thefts WHERE {col} IS NOT NULL")[col]
+            known = self.dtypes[col].categories if col in self.dtypes else []
+            dtypes[col] = pd.CategoricalDtype(merge_labels(known, labels, col))
+        self.dtypes = dtypes
+        summary = self.query("SELECT COUNT(*) AS n, MIN(date_stolen) AS first, MAX(date_stolen) AS last FROM thefts")
+        self.total_rows = int(summary['n'].iloc[0])
+        self.bounds = (pd.Timestamp(summary['first'].iloc[0]), pd.Timestamp(summary['last'].iloc[0]))
+        regions = self.query(f"SELECT {', '.join(REGION_COLS)} FROM thefts GROUP BY region")
+        regions['region'] = regions['region'].astype(self.dtypes['region'])
+        regions.index = pd.Index(regions['region'].cat.codes.to_numpy(), name='region_code')
+        self.regions = regions.sort_index()
+
+    def typed(self, cells):
+        cells = cells.astype({col: self.dtypes[col] for col in cells.columns if col in GLOBAL_COLS})
+        return cells.astype({'count': 'int64'})
+
+    def sync_deltas(self, delta_dir=DELTA_DIR):
+        # The database outlives the process, so applied delta files are
+        # recorded next to the rows they added.
+        if not os.path.isdir(delta_dir):
+            return None
+        appended = []
+        with self.lock:
+            for entry in sorted(os.scandir(delta_dir), key=lambda entry: entry.name):
+                if not entry.name.endswith('.csv') or entry.name in self.seen_deltas:
+                    continue
+                self.seen_deltas.add(entry.name)
+                with connect(self.database_path) as con:
+                    if con.execute("SELECT 1 FROM applied_deltas WHERE name = ?", (entry.name,)).fetchone():
+                        continue
+                    # Incidents already loaded are skipped, as in Dataset.append.
+                    delta = read_csv_typed(entry.path).drop_duplicates('vehicle_id')
+                    delta = delta[~delta['vehicle_id'].isin(known_ids(con, delta['vehicle_id']))]
+                    if not delta.empty:
+                        sql_rows(delta).to_sql('thefts', con, if_exists='append', index=False)
+                    con.execute("INSERT INTO applied_deltas VALUES (?)", (entry.name,))
+                if not delta.empty:
+                    appended.append(delta)
+            if appended:
+                self.refresh()
+        if not appended:
+            return None
+        # Each file was read with its own categories; on the refreshed global
+        # ones the deltas concatenate as categoricals.
+        dtypes = {col: self.dtypes[col] for col in GLOBAL_COLS}
+        return pd.concat([delta.astype(dtypes) for delta in appended], ignore_index=True)
+
+    @property
+    def n_rows(self):
+        return self.total_rows
+
+    def options(self, col):
+        return sorted(self.dtypes[col].categories)
+
+    def date_bounds(self):
+        return self.bounds
+
+    def cells(self, filters):
+        where, params = where_clause(filters)
+        dims = ', '.join(CUBE_DIMS)
+        cells = self.query(f"SELECT {dims}, COUNT(*) AS count FROM thefts {where} GROUP BY {dims}", params)
+        cells['quarter'] = pd.PeriodIndex(cells['quarter'], freq='Q')
+        cells['model_year'] = cells['model_year'].astype('float64')
+        return self.typed(cells)
+
+    def model_region_counts(self, filters):
+        where, params = where_clause(filters)
+        known = 'vehicle_desc IS NOT NULL'
+        where = f"{where} AND {known}" if where else f"WHERE {known}"
+        dims = ', '.join(MODEL_DIMS)
+        counts = self.query(f"SELECT {dims}, COUNT(*) AS count FROM thefts {where} GROUP BY {dims}", params)
+        return self.typed(counts).sort_values(MODEL_DIMS, ignore_index=True)
+
+    def weekly_counts(self, filters, column):
+        if column not in FILTER_COLUMNS.values():
+            raise ValueError(f"Unknown column {column!r}")
+        where, params = where_clause(filters)
+        # SQLite's 'weekday 1' moves forward to a Monday, so step back six
+        # days first to land on the Monday that starts each date's week.
+        counts = self.query(
+            f"SELECT region, {column}, date(date_stolen, '-6 days', 'weekday 1') AS week, COUNT(*) AS count "
+            f"FROM thefts {where} GROUP BY region, {column}, week",
+            params
+        )
+        counts['week'] = pd.to_datetime(counts['week'])
+        return self.typed(counts)
+
+    def distinct_models(self, filters):
+        where, params = where_clause(filters)
+        return int(self.query(f"SELECT COUNT(DISTINCT vehicle_desc) AS n FROM thefts {where}", params)['n'].iloc[0])
+
+
+def load_sql_dataset(csv_path=CSV_PATH, database_path=DATABASE_PATH, delta_dir=DELTA_DIR):
+    dataset = SqlDataset(csv_path, database_path)
+    dataset.sync_deltas(delta_dir)
+    return dataset
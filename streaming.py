@@ -0,0 +1,346 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from cube import CUBE_DIMS, build_cube, merge_counts, model_region_counts, slice_cube, weekly_counts
+from dataset import (
+    CATEGORICAL_COLS, CSV_OPTIONS, CSV_PATH, DELTA_DIR, DICTIONARY_COLS, REGION_COLS, SNAPSHOT_PATH,
+    absorbed_deltas, insert_ids, pending_deltas, read_csv_typed, snapshot_is_fresh, type_frame, unknown_incidents
+)
+from filter_index import ALL_ROWS, FilterIndex
+from result_cache import canonical_filters, filters_key
+from sketches import RankingSketch, merge_sketches
+
+SOURCE_PATH = os.environ.get('THEFT_SOURCE', CSV_PATH)
+CHUNK_ROWS = int(os.environ.get('THEFT_CHUNK_ROWS', 250_000))
+MERGE_EVERY = 8
+SCAN_MEMO = 4
+# Past this many rows the model counts are kept as per-region sketches
+# instead of exactly; SKETCH_TOP candidates are returned to the charts.
+SKETCH_ROWS = int(os.environ.get('THEFT_SKETCH_ROWS', 10_000_000))
+SKETCH_TOP = 100
+
+GLOBAL_COLS = [col for col in CUBE_DIMS if col in DICTIONARY_COLS] + ['vehicle_desc']
+MODEL_DIMS = ['vehicle_desc', 'region']
+
+
+def csv_chunks(csv_path, chunk_rows):
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, **CSV_OPTIONS):
+        yield type_frame(chunk)
+
+
+def snapshot_chunks(snapshot_path, chunk_rows):
+    # The snapshot is memory-mapped and slicing it is free, so only the rows
+    # of the current chunk are materialised as pandas columns.
+    with pa.memory_map(snapshot_path) as source:
+        table = pa.ipc.open_file(source).read_all()
+        for offset in range(0, table.num_rows, chunk_rows):
+            yield table.slice(offset, chunk_rows).to_pandas()
+
+
+def parquet_chunks(parquet_path, chunk_rows):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(parquet_path).iter_batches(batch_size=chunk_rows):
+        df = batch.to_pandas()
+        df = df.astype({col: 'category' for col in DICTIONARY_COLS})
+        df['date_stolen'] = pd.to_datetime(df['date_stolen'])
+        yield type_frame(df)
+
+
+def source_chunks(path, snapshot_path, chunk_rows):
+    if path.endswith('.parquet'):
+        return parquet_chunks(path, chunk_rows)
+    if snapshot_is_fresh(path, snapshot_path):
+        return snapshot_chunks(snapshot_path, chunk_rows)
+    return csv_chunks(path, chunk_rows)
+
+
+def plain(cells, columns):
+    # Chunks carry their own category sets, so partial results are merged on
+    # labels and only mapped onto the global categories at the end.
+    return cells.astype({col: object for col in columns if col in GLOBAL_COLS})
+
+
+def merge_labels(labels, new_labels, col):
+    # Labels of a later source go after the known ones so the codes already
+    # handed out keep their meaning, mirroring Dataset.append().
+    added = sorted(set(new_labels).difference(labels))
+    if col in CATEGORICAL_COLS and 'Unknown' in added:
+        added.remove('Unknown')
+        added.append('Unknown')
+    return list(labels) + added
+
+
+def sketch_model_regions(sketches, top=SKETCH_TOP):
+    # The national heavy hitters, with each region's count estimated by that
+    # region's sketch.
+    candidates = merge_sketches(sketches.values()).heavy_hitters(top).index
+    parts = [
+        pd.DataFrame({'vehicle_desc': candidates, 'region': region, 'count': sketch.estimate(candidates)})
+        for region, sketch in sketches.items()
+    ]
+    if not parts:
+        return pd.DataFrame(columns=MODEL_DIMS + ['count'])
+    counts = pd.concat(parts, ignore_index=True)
+    counts = counts[counts['count'] > 0]
+    return counts.astype({'vehicle_desc': pd.CategoricalDtype(sorted(candidates))})
+
+
+class Fold:
+    # Partial aggregates of a stream of chunks. Peak memory is one chunk plus
+    # at most MERGE_EVERY partial cubes, independent of the source size.
+    # Model counts are also sketched per region from the start, and once
+    # sketch_rows rows have been folded the exact ones are dropped.
+
+    def __init__(self, sketch_rows=SKETCH_ROWS):
+        self.cubes = []
+        self.models = []
+        self.regions = []
+        self.sketches = {}
+        self.labels = {col: set() for col in GLOBAL_COLS}
+        self.dates = []
+        self.n_rows = 0
+        self.sketch_rows = sketch_rows
+        self.sketched = sketch_rows <= 0
+
+    def add(self, chunk, with_regions=False):
+        self.n_rows += len(chunk)
+        if len(chunk):
+            self.dates.extend([chunk['date_stolen'].min(), chunk['date_stolen'].max()])
+        for col in GLOBAL_COLS:
+            if not (self.sketched and col == 'vehicle_desc'):
+                self.labels[col].update(chunk[col].cat.categories)
+        self.cubes.append(plain(build_cube(chunk), CUBE_DIMS))
+        models = plain(model_region_counts(chunk['vehicle_desc'], chunk['region']), MODEL_DIMS)
+        for region, group in models.groupby('region', sort=False):
+            self.sketches.setdefault(region, RankingSketch()).add(group['vehicle_desc'], group['count'])
+        if not self.sketched and self.n_rows >= self.sketch_rows:
+            self.sketched = True
+            self.models = []
+            self.labels['vehicle_desc'] = set()
+        if not self.sketched:
+            self.models.append(models)
+        if with_regions:
+            self.regions.append(plain(chunk[REGION_COLS].drop_duplicates('region'), REGION_COLS))
+        if len(self.cubes) >= MERGE_EVERY:
+            self.cubes = [merge_counts(self.cubes, CUBE_DIMS)]
+            self.models = [merge_counts(self.models, MODEL_DIMS)] if self.models else []
+            self.regions = [pd.concat(self.regions).drop_duplicates('region')] if self.regions else []
+
+    def cube(self):
+        if not self.cubes:
+            return pd.DataFrame(columns=CUBE_DIMS + ['count'])
+        return merge_counts(self.cubes, CUBE_DIMS)
+
+    def model_regions(self):
+        if self.sketched:
+            return sketch_model_regions(self.sketches)
+        if not self.models:
+            return pd.DataFrame(columns=MODEL_DIMS + ['count'])
+        return merge_counts(self.models, MODEL_DIMS)
+
+    def distinct_models(self, model_regions):
+        if self.sketched:
+            return merge_sketches(self.sketches.values()).distinct()
+        return model_regions['vehicle_desc'].nunique()
+
+
+class StreamingDataset:
+    # Same interface as dataset.Dataset, but no rows are kept in memory: the
+    # load pass folds the source into the unfiltered cube and model counts,
+    # and selections the cube cannot answer rescan the source chunk by chunk.
+
+    def __init__(self, source_path=SOURCE_PATH, snapshot_path=SNAPSHOT_PATH, chunk_rows=CHUNK_ROWS):
+        self.sources = [source_path]
+        self.snapshot_path = snapshot_path
+        self.chunk_rows = chunk_rows
+        # Deltas compacted into the snapshot are already in its rows.
+        self.seen_deltas = set() if source_path.endswith('.parquet') else absorbed_deltas(source_path, snapshot_path)
+        self.scans = OrderedDict()
+        self.lock = threading.Lock()
+        self.labels = {col: [] for col in GLOBAL_COLS}
+        self.total_rows = 0
+        # Sorted ids of every loaded incident, and for each delta file the
+        # rows it repeats, which rescans of that file skip.
+        self.vehicle_ids = np.empty(0, dtype=np.int64)
+        self.skipped = {}
+        self.fold_in(self.chunks(source_path))
+
+    def chunks(self, path):
+        if path == self.sources[0]:
+            return source_chunks(path, self.snapshot_path, self.chunk_rows)
+        if path in self.skipped:
+            skipped = self.skipped[path]
+            return (chunk.drop(index=skipped.intersection(chunk.index)) for chunk in csv_chunks(path, self.chunk_rows))
+        return csv_chunks(path, self.chunk_rows)
+
+    def all_chunks(self):
+        for path in list(self.sources):
+            yield from self.chunks(path)
+
+    def fold_in(self, chunks):
+        fold = Fold(SKETCH_ROWS - self.total_rows)
+        if self.total_rows:
+            fold.cubes.append(plain(self.cube, CUBE_DIMS))
+            if not fold.sketched:
+                fold.models.append(plain(self.model_regions, MODEL_DIMS))
+            fold.regions.append(self.region_rows)
+            fold.dates.extend(self.bounds)
+            fold.sketches = {region: sketch.copy() for region, sketch in self.sketches.items()}
+        ids = []
+        for chunk in chunks:
+            fold.add(chunk, with_regions=True)
+            ids.append(chunk['vehicle_id'].to_numpy())
+        if ids:
+            self.vehicle_ids = insert_ids(self.vehicle_ids, np.concatenate(ids))
+        labels = {col: merge_labels(self.labels[col], fold.labels[col], col) for col in GLOBAL_COLS}
+        region_rows = pd.concat(fold.regions).drop_duplicates('region')
+
+        self.dtypes = {col: pd.CategoricalDtype(labels[col]) for col in GLOBAL_COLS}
+        self.cube = self.globalise(fold.cube())
+        self.model_regions = self.globalise(fold.model_regions()).sort_values(MODEL_DIMS, ignore_index=True)
+        if fold.sketched:
+            # Only the current candidates are known as labels.
+            labels['vehicle_desc'] = list(self.model_regions['vehicle_desc'].cat.categories)
+        self.labels = labels
+        self.n_models = fold.distinct_models(self.model_regions)
+        self.sketches = fold.sketches
+        self.sketched = fold.sketched
+        self.bounds = [min(fold.dates), max(fold.dates)]
+        self.region_rows = region_rows
+        self.regions = self.build_regions(region_rows)
+        self.total_rows += fold.n_rows
+        self.scans.clear()
+        return fold.n_rows
+
+    def globalise(self, cells):
+        # Sketched model counts come with their own candidate categories.
+        cells = cells.astype({
+            col: self.dtypes[col] for col in cells.columns
+            if col in GLOBAL_COLS and not isinstance(cells[col].dtype, pd.CategoricalDtype)
+        })
+        return cells.astype({'count': 'int64'})
+
+    def typed(self, delta):
+        # Every delta file is read with its own category sets; on the global
+        # ones the deltas concatenate as categoricals. Sketched model labels
+        # are only the candidates, so vehicle_desc is left as read.
+        return delta.astype({
+            col: self.dtypes[col] for col in GLOBAL_COLS if not (self.sketched and col == 'vehicle_desc')
+        })
+
+    def build_regions(self, region_rows):
+        regions = region_rows.astype({'region': self.dtypes['region']})
+        regions.index = pd.Index(regions['region'].cat.codes.to_numpy(), name='region_code')
+        return regions.sort_index()
+
+    def sync_deltas(self, delta_dir=DELTA_DIR):
+        # Each new file is folded into the aggregates without the incidents
+        # already loaded, as in Dataset.append, and becomes one more source
+        # for later scans.
+        appended = []
+        with self.lock:
+            known = self.vehicle_ids
+            for token, path in pending_deltas(delta_dir, self.seen_deltas):
+                self.seen_deltas.add(token)
+                rows = read_csv_typed(path)
+                delta = unknown_incidents(known, rows)
+                if len(delta) < len(rows):
+                    self.skipped[path] = rows.index.difference(delta.index)
+                if not delta.empty:
+                    known = insert_ids(known, delta['vehicle_id'].to_numpy())
+                    self.sources.append(path)
+                    appended.append(delta)
+            if appended:
+                self.fold_in(appended)
+        if not appended:
+            return None
+        return pd.concat([self.typed(delta) for delta in appended], ignore_index=True)
+
+    @property
+    def n_rows(self):
+        return self.total_rows
+
+    def options(self, col):
+        return sorted(self.labels[col])
+
+    def date_bounds(self):
+        return tuple(self.bounds)
+
+    def scan(self, filters):
+        key = filters_key(filters)
+        with self.lock:
+            if key in self.scans:
+                self.scans.move_to_end(key)
+                return self.scans[key]
+
+        fold = Fold()
+        for chunk in self.all_chunks():
+            rows = FilterIndex(chunk).select(filters)
+            fold.add(chunk if rows is ALL_ROWS else chunk.iloc[rows])
+        model_regions = fold.model_regions()
+        if self.sketched:
+            # Only the sketch candidates are global labels.
+            model_regions = model_regions.astype({'vehicle_desc': 'category'})
+        model_regions = self.globalise(model_regions).sort_values(MODEL_DIMS, ignore_index=True)
+        result = (self.globalise(fold.cube()), model_regions, fold.distinct_models(model_regions))
+
+        with self.lock:
+            self.scans[key] = result
+            while len(self.scans) > SCAN_MEMO:
+                self.scans.popitem(last=False)
+        return result
+
+    def cells(self, filters):
+        date_range = filters.get('date_range')
+        if date_range and len(date_range) == 2:
+            return self.scan(filters)[0]
+        return slice_cube(self.cube, filters)
+
+    def region_sketches(self, filters):
+        # A region selection is a union of sketch partitions, so once the
+        # counts are sketched it needs no rescan.
+        filters = canonical_filters(filters)
+        if self.sketched and list(filters) == ['regions']:
+            return {region: self.sketches[region] for region in filters['regions'] if region in self.sketches}
+        return None
+
+    def model_region_counts(self, filters):
+        sketches = self.region_sketches(filters)
+        if sketches is not None:
+            return self.globalise(sketch_model_regions(sketches)).sort_values(MODEL_DIMS, ignore_index=True)
+        if canonical_filters(filters):
+            return self.scan(filters)[1]
+        return self.model_regions
+
+    def distinct_models(self, filters):
+        sketches = self.region_sketches(filters)
+        if sketches is not None:
+            return merge_sketches(sketches.values()).distinct()
+        if canonical_filters(filters):
+            return self.scan(filters)[2]
+        return self.n_models
+
+    def weekly_counts(self, filters, column):
+        # Weeks are too fine for the cube, so every call rescans the source;
+        # callers cache the result per selection.
+        dims = ['region', column, 'week']
+        parts = []
+        for chunk in self.all_chunks():
+            rows = FilterIndex(chunk).select(filters)
+            chunk = chunk if rows is ALL_ROWS else chunk.iloc[rows]
+            parts.append(plain(weekly_counts(chunk['region'], chunk[column], chunk['date_stolen']), dims))
+            if len(parts) >= MERGE_EVERY:
+                parts = [merge_counts(parts, dims)]
+        return self.globalise(merge_counts(parts, dims))
+
+
+def load_streaming_dataset(source_path=SOURCE_PATH, snapshot_path=SNAPSHOT_PATH, delta_dir=DELTA_DIR):
+    dataset = StreamingDataset(source_path, snapshot_path)
+    dataset.sync_deltas(delta_dir)
+    return dataset
@@ -0,0 +1,254 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from api import SYNC_INTERVAL_SECONDS, AggregateApi
+from dataset import load_dataset
+from filter_index import FilterIndex
+from result_cache import ResultCache
+from selection import Selection
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stolen_vehicles_enhanced.csv')
+BASE_ROWS = 3000
+
+
+@pytest.fixture
+def source():
+    # The bundled incidents as text, so slices are written back exactly in
+    # the source format.
+    return pd.read_csv(SOURCE, dtype=str)
+
+
+@pytest.fixture
+def paths(tmp_path, source):
+    csv_path = tmp_path / 'thefts.csv'
+    source.iloc[:BASE_ROWS].to_csv(csv_path, index=False)
+    delta_dir = tmp_path / 'deltas'
+    delta_dir.mkdir()
+    return str(csv_path), str(tmp_path / 'thefts.feather'), str(delta_dir)
+
+
+def write_delta(source, delta_dir, name, start, stop, make=None):
+    delta = source.iloc[start:stop].copy()
+    if make is not None:
+        delta['make_name'] = make
+    delta.to_csv(os.path.join(delta_dir, name), index=False)
+    return delta
+
+
+def test_two_deltas_with_new_labels_stay_categorical(paths, source):
+    csv_path, snapshot_path, delta_dir = paths
+    dataset = load_dataset(csv_path, snapshot_path, delta_dir)
+    cache = ResultCache()
+    selection = Selection(dataset, cache, {'makes': ['NewMakeB']})
+    assert selection.kpis()['total_thefts'] == 0
+
+    write_delta(source, delta_dir, '1.csv', BASE_ROWS, BASE_ROWS + 10, make='NewMakeA')
+    write_delta(source, delta_dir, '2.csv', BASE_ROWS + 10, BASE_ROWS + 20, make='NewMakeB')
+    new_incidents = dataset.sync_deltas(delta_dir)
+
+    assert len(new_incidents) == 20
+    for col in ['make_name', 'vehicle_type', 'color', 'region', 'make_type']:
+        assert isinstance(new_incidents[col].dtype, pd.CategoricalDtype), col
+    assert cache.invalidate(FilterIndex(new_incidents).matches_any) == 1
+    assert Selection(dataset, cache, {'makes': ['NewMakeB']}).kpis()['total_thefts'] == 10
+    assert dataset.n_rows == BASE_ROWS + 20
+
+
+def test_known_incidents_are_not_appended_twice(paths, source):
+    csv_path, snapshot_path, delta_dir = paths
+    dataset = load_dataset(csv_path, snapshot_path, delta_dir)
+    write_delta(source, delta_dir, '1.csv', BASE_ROWS - 5, BASE_ROWS + 5)
+    new_incidents = dataset.sync_deltas(delta_dir)
+
+    assert len(new_incidents) == 5
+    assert dataset.n_rows == BASE_ROWS + 5
+    assert (dataset.vehicle_ids == np.sort(dataset.frame['vehicle_id'].to_numpy())).all()
+    assert dataset.sync_deltas(delta_dir) is None
+
+
+def test_streaming_deltas_stay_categorical(paths, source):
+    from streaming import StreamingDataset
+
+    csv_path, snapshot_path, delta_dir = paths
+    dataset = StreamingDataset(csv_path, snapshot_path)
+    write_delta(source, delta_dir, '1.csv', BASE_ROWS, BASE_ROWS + 10)
+    write_delta(source, delta_dir, '2.csv', BASE_ROWS + 10, BASE_ROWS + 20, make='NewMakeB')
+    new_incidents = dataset.sync_deltas(delta_dir)
+
+    assert len(new_incidents) == 20
+    assert isinstance(new_incidents['make_name'].dtype, pd.CategoricalDtype)
+    assert FilterIndex(new_incidents).matches_any({'makes': ['NewMakeB']})
+    assert dataset.n_rows == BASE_ROWS + 20
+
+
+def test_sql_deltas_stay_categorical(paths, source, tmp_path):
+    from sql_engine import load_sql_dataset
+
+    csv_path, _, delta_dir = paths
+    dataset = load_sql_dataset(csv_path, str(tmp_path / 'thefts.sqlite'), delta_dir)
+    write_delta(source, delta_dir, '1.csv', BASE_ROWS, BASE_ROWS + 10)
+    write_delta(source, delta_dir, '2.csv', BASE_ROWS + 10, BASE_ROWS + 20, make='NewMakeB')
+    new_incidents = dataset.sync_deltas(delta_dir)
+
+    assert len(new_incidents) == 20
+    assert isinstance(new_incidents['make_name'].dtype, pd.CategoricalDtype)
+    assert FilterIndex(new_incidents).matches_any({'makes': ['NewMakeB']})
+    assert dataset.n_rows == BASE_ROWS + 20
+
+
+def test_compacted_deltas_are_not_replayed(paths, source):
+    from dataset import absorbed_deltas, write_snapshot
+    from streaming import load_streaming_dataset
+
+    csv_path, snapshot_path, delta_dir = paths
+    write_delta(source, delta_dir, '1.csv', BASE_ROWS, BASE_ROWS + 10, make='NewMakeA')
+    write_delta(source, delta_dir, '2.csv', BASE_ROWS + 10, BASE_ROWS + 20)
+    write_snapshot(csv_path, snapshot_path, delta_dir)
+    assert {token[0] for token in absorbed_deltas(csv_path, snapshot_path)} == {'1.csv', '2.csv'}
+
+    dataset = load_dataset(csv_path, snapshot_path, delta_dir)
+    assert dataset.n_rows == BASE_ROWS + 20
+    assert 'NewMakeA' in dataset.options('make_name')
+    assert load_streaming_dataset(csv_path, snapshot_path, delta_dir).n_rows == BASE_ROWS + 20
+
+    write_delta(source, delta_dir, '3.csv', BASE_ROWS + 20, BASE_ROWS + 30)
+    assert len(dataset.sync_deltas(delta_dir)) == 10
+    assert dataset.n_rows == BASE_ROWS + 30
+
+
+def test_back_dated_delta_keeps_date_order(paths, source):
+    csv_path, snapshot_path, delta_dir = paths
+    dataset = load_dataset(csv_path, snapshot_path, delta_dir)
+    first, last = dataset.date_bounds()
+    delta = source.iloc[BASE_ROWS:BASE_ROWS + 40].copy()
+    delta['date_stolen'] = pd.date_range(first, last, periods=40).strftime('%Y-%m-%d')
+    delta.iloc[:20].to_csv(os.path.join(delta_dir, '1.csv'), index=False)
+    delta.iloc[20:].to_csv(os.path.join(delta_dir, '2.csv'), index=False)
+    dataset.sync_deltas(delta_dir)
+
+    assert dataset.index.date_sorted
+    assert dataset.frame['date_stolen'].is_monotonic_increasing
+    expected = FilterIndex(dataset.frame)
+    for key in ['make_name', 'region', 'color']:
+        assert (dataset.index.rows[key] == expected.rows[key]).all()
+        assert (dataset.index.offsets[key] == expected.offsets[key]).all()
+
+    filters = {'regions': ['Auckland'], 'date_range': [first + pd.Timedelta(days=60), last - pd.Timedelta(days=60)]}
+    start, end = filters['date_range']
+    frame = dataset.frame
+    matches = (frame['region'] == 'Auckland') & (frame['date_stolen'] >= start) & (frame['date_stolen'] <= end)
+    assert (dataset.rows(filters) == matches.to_numpy().nonzero()[0]).all()
+    assert dataset.cells(filters)['count'].sum() == matches.sum()
+    assert dataset.n_rows == BASE_ROWS + 40
+
+
+def write_later_delta(source, delta_dir, dataset, days=60):
+    # Newer incidents of a make no test selection includes, so the cached
+    # results of those selections are not invalidated.
+    _, last = dataset.date_bounds()
+    delta = source.iloc[BASE_ROWS:BASE_ROWS + 5].copy()
+    delta['make_name'] = 'NewMakeA'
+    delta['date_stolen'] = (last + pd.Timedelta(days=days)).strftime('%Y-%m-%d')
+    delta.to_csv(os.path.join(delta_dir, 'later.csv'), index=False)
+
+
+def test_hotspots_follow_a_wider_date_span(paths, source):
+    csv_path, snapshot_path, delta_dir = paths
+    dataset = load_dataset(csv_path, snapshot_path, delta_dir)
+    cache = ResultCache()
+    weeks = len(Selection(dataset, cache, {'makes': ['Toyota']}).make_hotspots()['weeks'])
+
+    write_later_delta(source, delta_dir, dataset)
+    dataset.sync_deltas(delta_dir)
+
+    assert len(Selection(dataset, cache, {'makes': ['Toyota']}).make_hotspots()['weeks']) > weeks
+
+
+def api_result(api, path, query):
+    # Lets the next request pick up delta files at once.
+    api.synced -= SYNC_INTERVAL_SECONDS
+    status, body, _ = api.respond(path, query)
+    assert status == 200
+    return json.loads(body)['result']
+
+
+def test_api_responses_follow_a_wider_date_span(paths, source):
+    csv_path, snapshot_path, delta_dir = paths
+    dataset = load_dataset(csv_path, snapshot_path, delta_dir)
+    api = AggregateApi(dataset, ResultCache(), delta_dir)
+    weeks = len(api_result(api, '/trends/hotspots/makes', 'makes=Toyota')['weeks'])
+
+    write_later_delta(source, delta_dir, dataset)
+    result = api_result(api, '/trends/hotspots/makes', 'makes=Toyota')
+
+    expected = Selection(dataset, ResultCache(), {'makes': ['Toyota']}).make_hotspots()
+    assert len(result['weeks']) == len(expected['weeks']) > weeks
+
+
+@pytest.mark.parametrize('path, name', [
+    ('/trends/hotspots/makes', 'make_hotspots'),
+    ('/trends/hotspots/types', 'type_hotspots')
+])
+def test_api_hotspots_return_the_new_week_grid(paths, source, path, name):
+    csv_path, snapshot_path, delta_dir = paths
+    dataset = load_dataset(csv_path, snapshot_path, delta_dir)
+    api = AggregateApi(dataset, ResultCache(), delta_dir)
+    before = api_result(api, path, 'makes=Toyota')['weeks']
+
+    write_later_delta(source, delta_dir, dataset)
+    after = api_result(api, path, 'makes=Toyota')['weeks']
+
+    expected = getattr(Selection(dataset, ResultCache(), {'makes': ['Toyota']}), name)()['weeks']
+    assert after == [week.isoformat() for week in expected]
+    assert after[:len(before)] == before and len(after) > len(before)
+
+
+def test_api_forecast_moves_with_new_data(paths, source):
+    csv_path, snapshot_path, delta_dir = paths
+    dataset = load_dataset(csv_path, snapshot_path, delta_dir)
+    api = AggregateApi(dataset, ResultCache(), delta_dir)
+    before = api_result(api, '/trends/forecast', 'makes=Toyota')['future']
+
+    write_later_delta(source, delta_dir, dataset)
+    after = api_result(api, '/trends/forecast', 'makes=Toyota')['future']
+
+    expected = Selection(dataset, ResultCache(), {'makes': ['Toyota']}).forecast()['future']
+    assert after == [week.isoformat() for week in expected]
+    assert after[0] > before[0]
+
+
+def test_sql_skips_known_incidents(paths, source, tmp_path):
+    from sql_engine import load_sql_dataset
+
+    csv_path, _, delta_dir = paths
+    dataset = load_sql_dataset(csv_path, str(tmp_path / 'thefts.sqlite'), delta_dir)
+    write_delta(source, delta_dir, '1.csv', BASE_ROWS - 5, BASE_ROWS + 5)
+    assert len(dataset.sync_deltas(delta_dir)) == 5
+
+    # The same incidents replayed under another name.
+    write_delta(source, delta_dir, '2.csv', BASE_ROWS - 5, BASE_ROWS + 5)
+    assert dataset.sync_deltas(delta_dir) is None
+    assert dataset.n_rows == BASE_ROWS + 5
+    assert dataset.cells({})['count'].sum() == BASE_ROWS + 5
+
+
+def test_streaming_skips_known_incidents(paths, source):
+    from streaming import load_streaming_dataset
+
+    csv_path, snapshot_path, delta_dir = paths
+    dataset = load_streaming_dataset(csv_path, snapshot_path, delta_dir)
+    write_delta(source, delta_dir, '1.csv', BASE_ROWS - 5, BASE_ROWS + 5)
+    assert len(dataset.sync_deltas(delta_dir)) == 5
+    write_delta(source, delta_dir, '2.csv', BASE_ROWS - 5, BASE_ROWS + 5)
+    assert dataset.sync_deltas(delta_dir) is None
+
+    # A date range rescans the delta files, which must skip the same rows.
+    memory = load_dataset(csv_path, snapshot_path, delta_dir)
+    first, last = memory.date_bounds()
+    filters = {'date_range': (first.date(), last.date())}
+    assert dataset.n_rows == memory.n_rows == BASE_ROWS + 5
+    assert dataset.cells(filters)['count'].sum() == memory.cells(filters)['count'].sum() == BASE_ROWS + 5
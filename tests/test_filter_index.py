@@ -0,0 +1,58 @@
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from dataset import read_csv_typed, sort_by_date
+from filter_index import FILTER_COLUMNS, FilterIndex
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stolen_vehicles_enhanced.csv')
+
+SELECTIONS = [
+    {},
+    {'makes': []},
+    {'makes': ['Toyota']},
+    {'makes': ['Toyota', 'Mazda', 'Nissan']},
+    {'makes': ['Toyota', 'Mazda'], 'colors': ['Silver', 'White'], 'regions': ['Auckland', 'Canterbury']},
+    {'types': ['Trailer', 'Boat Trailer'], 'make_types': ['Standard']},
+    {'date_range': (datetime.date(2021, 11, 15), datetime.date(2022, 2, 10))},
+    {'date_range': (datetime.date(2022, 1, 1), datetime.date(2022, 1, 1))},
+    {'regions': ['Auckland', 'Wellington'], 'date_range': (datetime.date(2021, 12, 1), datetime.date(2022, 3, 31))},
+    {'makes': ['No Such Make']},
+    {'makes': ['Toyota'], 'regions': ['No Such Region']},
+    {'date_range': (datetime.date(1990, 1, 1), datetime.date(1990, 12, 31))}
+]
+
+
+@pytest.fixture(scope='module', params=['date order', 'file order'])
+def frame(request):
+    # In file order the index cannot use binary search for date ranges.
+    df = read_csv_typed(SOURCE)
+    return sort_by_date(df) if request.param == 'date order' else df
+
+
+def expected_rows(df, filters):
+    mask = np.ones(len(df), dtype=bool)
+    for key, col in FILTER_COLUMNS.items():
+        if filters.get(key):
+            mask &= df[col].isin(filters[key]).to_numpy()
+    if filters.get('date_range'):
+        start, end = filters['date_range']
+        days = df['date_stolen'].dt.date
+        mask &= ((days >= start) & (days <= end)).to_numpy()
+    return np.flatnonzero(mask)
+
+
+@pytest.mark.parametrize('filters', SELECTIONS)
+def test_select_matches_a_boolean_mask(frame, filters):
+    index = FilterIndex(frame)
+    rows = np.arange(len(frame))[index.select(filters)]
+    expected = expected_rows(frame, filters)
+    assert np.array_equal(rows, expected)
+    assert index.matches_any(filters) == (len(expected) > 0)
+
+
+def test_file_order_is_detected(frame):
+    index = FilterIndex(frame)
+    assert index.date_sorted == frame['date_stolen'].is_monotonic_increasing
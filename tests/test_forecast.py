@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from forecast import MIN_WEEKS, design_matrix, fit_forecasts, fit_poisson, project
+
+WEEKS = pd.date_range('2021-01-04', periods=156, freq='W-MON')
+
+
+def test_fit_recovers_rate_and_trend():
+    # 200 series of three years at 20 thefts a week, growing 30% a year.
+    rng = np.random.default_rng(3)
+    design = design_matrix(WEEKS, WEEKS[-1], seasonal=False)
+    truth = np.array([np.log(20.0), np.log(1.3)])
+    counts = rng.poisson(np.exp(design @ truth), size=(200, len(WEEKS))).astype(np.float64)
+    coef, cov, iterations = fit_poisson(counts, design)
+
+    assert iterations < 20
+    se = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+    assert (np.abs(coef - truth) < 4 * se).all()
+    assert np.abs(coef.mean(axis=0) - truth).max() < 0.01
+
+
+def fit_of(counts, weeks):
+    design = design_matrix(weeks, weeks[-1], seasonal=False)
+    coef, cov, iterations = fit_poisson(counts, design)
+    keys = pd.DataFrame({'group': 'region', 'label': [f'series-{i}' for i in range(len(counts))]})
+    return {'keys': keys, 'weeks': weeks, 'counts': counts, 'seasonal': False, 'coef': coef, 'cov': cov,
+            'iterations': iterations}
+
+
+def test_empty_and_short_series_project_near_zero():
+    weeks = WEEKS[:MIN_WEEKS]
+    counts = np.zeros((2, len(weeks)))
+    counts[1, 0] = 1
+    forecast = project(fit_of(counts, weeks))
+
+    table = forecast['table']
+    assert np.isfinite(forecast['mean']).all() and np.isfinite(forecast['high']).all()
+    assert np.isfinite(table[['forecast', 'low', 'high']].to_numpy()).all()
+    assert (table['low'] >= 0).all()
+    # Under one theft a quarter without any so far, and close to the rate
+    # of 1.6 a quarter of the single theft.
+    forecasts = table.groupby('label')['forecast'].max()
+    assert forecasts['series-0'] < 1
+    assert forecasts['series-1'] < 3
+
+
+def test_too_few_weeks_are_not_fitted():
+    first = WEEKS[0]
+    last = first + pd.Timedelta(days=7 * (MIN_WEEKS - 2))
+    assert fit_forecasts(None, first, last) is None
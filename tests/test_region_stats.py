@@ -0,0 +1,60 @@
+import math
+
+import numpy as np
+import pytest
+
+from region_stats import linear_fit, per_capita_rates, poisson_interval, t_quantile
+
+# Expected values from statsmodels' OLS and scipy's t and chi-squared
+# quantiles, which these closed forms replace.
+X = [1, 2, 3, 4, 5, 6]
+Y = [2.1, 3.9, 6.2, 7.8, 10.1, 12.2]
+
+
+@pytest.mark.parametrize('df, exact, tolerance', [
+    (1, 12.706204736174696, 1e-12),
+    (2, 4.302652729749464, 1e-12),
+    (3, 3.1824463052837078, 1.3e-3),
+    (4, 2.7764451051977934, 5e-4),
+    (30, 2.0422724563012378, 1e-6)
+])
+def test_t_quantile(df, exact, tolerance):
+    assert t_quantile(0.975, df) == pytest.approx(exact, rel=tolerance)
+
+
+def test_linear_fit_matches_ols():
+    fit = linear_fit(X, Y)
+    assert fit['n'] == 6
+    assert fit['slope'] == pytest.approx(2.02)
+    assert fit['intercept'] == pytest.approx(-0.02, abs=1e-12)
+    assert fit['r2'] == pytest.approx(0.9982106661074999)
+    assert fit['r'] == pytest.approx(math.sqrt(0.9982106661074999))
+    # The intervals differ only by the error of t_quantile at df=4, 0.03%
+    # of their half-widths.
+    assert fit['slope_ci'] == pytest.approx((1.90127421, 2.13872579), abs=1e-4)
+    assert fit['intercept_ci'] == pytest.approx((-0.48237051, 0.44237051), abs=3e-4)
+
+
+def test_linear_fit_without_enough_points():
+    assert math.isnan(linear_fit([1], [2])['slope'])
+    fit = linear_fit([1, 2], [3, 5])
+    assert fit['slope'] == pytest.approx(2.0)
+    assert all(math.isnan(bound) for bound in fit['slope_ci'])
+
+
+def test_poisson_interval_is_close_to_exact():
+    # Exact (Garwood) 95% limits; Byar's approximation is within 1% of them
+    # from five events up.
+    counts = [5, 10, 50]
+    lower, upper = poisson_interval(counts)
+    assert lower == pytest.approx([1.6234863901184207, 4.7953886961324335, 37.110963737461866], rel=0.01)
+    assert upper == pytest.approx([11.66833207932267, 18.39035604201778, 65.91876666433681], rel=0.01)
+    lower, upper = poisson_interval([0])
+    assert lower[0] == 0 and upper[0] == pytest.approx(3.6888794541139354, rel=0.01)
+
+
+def test_per_capita_rates_scale_the_interval():
+    rates, lower, upper = per_capita_rates(np.array([10, 50]), np.array([100_000, 250_000]))
+    assert rates == pytest.approx([1.0, 2.0])
+    assert lower == pytest.approx(poisson_interval([10, 50])[0] / np.array([10, 25]))
+    assert (lower < rates).all() and (upper > rates).all()
@@ -0,0 +1,24 @@
+from result_cache import ResultCache
+
+
+def test_result_computed_across_invalidate_is_not_kept():
+    cache = ResultCache()
+
+    def compute():
+        # New data arrives while the old result is being computed.
+        cache.invalidate(lambda filters: True)
+        return 'stale'
+
+    assert cache.get_or_compute('kpis', {}, compute) == 'stale'
+    assert cache.get_or_compute('kpis', {}, lambda: 'fresh') == 'fresh'
+    assert cache.get_or_compute('kpis', {}, lambda: 'recomputed') == 'fresh'
+
+
+def test_invalidate_keeps_unaffected_selections():
+    cache = ResultCache()
+    cache.get_or_compute('kpis', {'regions': ['Auckland']}, lambda: 1)
+    cache.get_or_compute('kpis', {'regions': ['Otago']}, lambda: 2)
+
+    assert cache.invalidate(lambda filters: 'Auckland' in filters.get('regions', [])) == 1
+    assert cache.get_or_compute('kpis', {'regions': ['Otago']}, lambda: 3) == 2
+    assert cache.get_or_compute('kpis', {'regions': ['Auckland']}, lambda: 4) == 4
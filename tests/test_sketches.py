@@ -0,0 +1,60 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sketches import CAPACITY, CMS_DEPTH, CMS_WIDTH, HLL_PRECISION, RankingSketch, hash_labels, merge_sketches
+
+PARTITIONS = 8
+
+
+@pytest.fixture(scope='module')
+def zipf():
+    # Model counts with a Zipf tail, fed partition by partition as the
+    # streaming engine feeds its chunks, then merged.
+    rng = np.random.default_rng(7)
+    draws = rng.zipf(1.2, size=400_000)
+    labels = pd.Series(draws[draws < 1_000_000]).map('model-{}'.format)
+    partition = rng.integers(0, PARTITIONS, size=len(labels))
+    sketches = []
+    for part in range(PARTITIONS):
+        counts = labels[partition == part].value_counts()
+        sketch = RankingSketch()
+        sketch.add(counts.index.to_numpy(), counts.to_numpy())
+        sketches.append(sketch)
+    return labels.value_counts(), merge_sketches(sketches)
+
+
+def test_space_saving_keeps_the_heavy_hitters(zipf):
+    truth, sketch = zipf
+    n = truth.sum()
+    assert sketch.total == n
+    heavy = truth[truth > n / CAPACITY]
+    assert heavy.index.isin(sketch.top.counts.index).all()
+    top = sketch.heavy_hitters(20)
+    assert set(top.index) == set(truth.index[:20])
+    estimates = sketch.top.estimate(heavy.index)
+    assert (estimates >= heavy.to_numpy()).all()
+    assert (estimates - heavy.to_numpy() <= n / CAPACITY).all()
+
+
+def test_count_min_never_undercounts(zipf):
+    truth, sketch = zipf
+    n = truth.sum()
+    estimates = sketch.cms.estimate(hash_labels(truth.index.to_numpy()))
+    over = estimates - truth.to_numpy()
+    assert (over >= 0).all()
+    # Each label is within e * N / w with probability 1 - exp(-d).
+    within = np.mean(over <= math.e * n / CMS_WIDTH)
+    assert within >= 1 - math.exp(-CMS_DEPTH)
+
+
+def test_hyperloglog_error_after_merging(zipf):
+    truth, sketch = zipf
+    standard_error = 1.04 / math.sqrt(2 ** HLL_PRECISION)
+    assert abs(sketch.distinct() - len(truth)) / len(truth) < 3 * standard_error
+
+    whole = RankingSketch()
+    whole.add(truth.index.to_numpy(), truth.to_numpy())
+    assert np.array_equal(whole.hll.registers, sketch.hll.registers)
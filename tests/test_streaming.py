@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from dataset import Dataset, read_csv_typed
+from streaming import MERGE_EVERY, StreamingDataset
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stolen_vehicles_enhanced.csv')
+CHUNK_ROWS = 200
+
+
+@pytest.fixture(scope='module')
+def engines(tmp_path_factory):
+    # No snapshot, so the streaming engine reads the CSV in many more chunks
+    # than it merges at once.
+    snapshot_path = str(tmp_path_factory.mktemp('streaming') / 'missing.feather')
+    streaming = StreamingDataset(SOURCE, snapshot_path, chunk_rows=CHUNK_ROWS)
+    return Dataset(read_csv_typed(SOURCE), workers=1), streaming
+
+
+@pytest.mark.parametrize('filters', [{}, {'regions': ['Auckland', 'Otago']}, {'makes': ['Toyota']}])
+def test_weekly_counts_match_the_memory_engine(engines, filters):
+    memory, streaming = engines
+    assert streaming.n_rows > MERGE_EVERY * CHUNK_ROWS
+    dims = ['region', 'make_type', 'week']
+    expected = memory.weekly_counts(filters, 'make_type').astype({'region': str, 'make_type': str})
+    result = streaming.weekly_counts(filters, 'make_type').astype({'region': str, 'make_type': str})
+    expected = expected.sort_values(dims, ignore_index=True)
+    result = result.sort_values(dims, ignore_index=True)
+    assert result[dims].equals(expected[dims])
+    assert (result['count'].to_numpy() == expected['count'].to_numpy()).all()
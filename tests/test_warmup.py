@@ -0,0 +1,18 @@
+import json
+
+from warmup import usage_states
+
+
+def test_usage_states_rank_logged_selections(tmp_path):
+    log_path = tmp_path / 'render_timings.jsonl'
+    records = (
+        [{'filters': {'regions': ['Auckland']}}] * 3
+        + [{'filters': {'makes': ['Toyota'], 'date_range': ['2022-01-01', '2022-03-31']}, 'sections': {}}] * 2
+        + [{'filters': {}}]
+    )
+    log_path.write_text(''.join(json.dumps(record) + '\n' for record in records) + 'not json\n')
+
+    states = usage_states(str(log_path), top=2)
+    assert states[0] == {'regions': ['Auckland']}
+    assert states[1]['makes'] == ['Toyota']
+    assert [str(day) for day in states[1]['date_range']] == ['2022-01-01', '2022-03-31']
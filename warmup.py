@@ -0,0 +1,112 @@
+import argparse
+import datetime
+import json
+import os
+import time
+from collections import Counter
+
+import pandas as pd
+
+from dataset import CSV_PATH, snapshot_is_fresh, write_snapshot
+from engines import DEFAULT_ENGINE, ENGINES, open_dataset
+from profiling import TIMINGS_LOG
+from result_cache import ResultCache, canonical_filters, filters_key
+from selection import Selection
+
+WARM_CACHE_PATH = os.environ.get('THEFT_WARM_CACHE', 'result_cache.pkl')
+DEFAULT_TOP_STATES = 10
+
+
+def dataset_tag(dataset):
+    # Cached results are only valid for the data they were computed from:
+    # the same source file with the same deltas applied. The year is part of
+    # it because the vehicle ages are counted from the current year.
+    stat = os.stat(CSV_PATH) if os.path.exists(CSV_PATH) else None
+    return {
+        'engine': type(dataset).__name__,
+        'rows': int(dataset.n_rows),
+        'dates': [str(day) for day in dataset.date_bounds()],
+        'source': [stat.st_size, stat.st_mtime_ns] if stat else None,
+        'year': datetime.date.today().year
+    }
+
+
+def usage_states(log_path=TIMINGS_LOG, top=DEFAULT_TOP_STATES):
+    # Every timed rerun logs its canonical filter state, so the log doubles
+    # as a record of which selections officers actually open.
+    if not top or not os.path.exists(log_path):
+        return []
+    counts = Counter()
+    with open(log_path) as f:
+        for line in f:
+            try:
+                filters = json.loads(line).get('filters')
+            except ValueError:
+                continue
+            if filters is not None:
+                counts[json.dumps(filters, sort_keys=True)] += 1
+    states = []
+    for payload, _ in counts.most_common(top):
+        filters = json.loads(payload)
+        if 'date_range' in filters:
+            filters['date_range'] = tuple(pd.Timestamp(part).date() for part in filters['date_range'])
+        states.append(filters)
+    return states
+
+
+def warm_states(dataset, log_path=TIMINGS_LOG, top=DEFAULT_TOP_STATES):
+    # The unfiltered view, each single region, then the most used states.
+    states = [{}] + [{'regions': [region]} for region in dataset.options('region')]
+    states += usage_states(log_path, top)
+    unique = {}
+    for filters in states:
+        unique.setdefault(filters_key(filters), filters)
+    return list(unique.values())
+
+
+def prewarm(dataset, cache, states):
+    timings = []
+    for filters in states:
+        started = time.perf_counter()
+        selection = Selection(dataset, cache, filters)
+        selection.compute_all()
+        timings.append((canonical_filters(filters), selection.kpis()['total_thefts'], time.perf_counter() - started))
+    return timings
+
+
+def load_warm_cache(dataset, cache, path=WARM_CACHE_PATH):
+    try:
+        return cache.load(path, dataset_tag(dataset))
+    except Exception:
+        # A cache file that cannot be read only costs the warm start.
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load the dataset and precompute the dashboard results of the most common selections.'
+    )
+    parser.add_argument('--engine', choices=list(ENGINES), help='Defaults to THEFT_ENGINE')
+    parser.add_argument('--usage-log', default=TIMINGS_LOG, help='Timings log to take the most used selections from')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP_STATES, help='Most used selections to warm, 0 for none')
+    parser.add_argument('--out', default=WARM_CACHE_PATH)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    engine = args.engine or os.environ.get('THEFT_ENGINE', DEFAULT_ENGINE)
+    # The typed snapshot makes every later start of the memory engine a
+    # memory-mapped read; the SQL engine rebuilds its database on open.
+    if engine == 'memory' and os.path.exists(CSV_PATH) and not snapshot_is_fresh():
+        write_snapshot()
+    dataset = open_dataset(engine)
+    print(f"Loaded {dataset.n_rows:,} rows in {time.perf_counter() - started:.1f} s")
+    cache = ResultCache()
+    states = warm_states(dataset, args.usage_log, args.top)
+    for filters, matches, seconds in prewarm(dataset, cache, states):
+        print(f"{json.dumps(filters, ensure_ascii=False) if filters else 'all incidents':<60}{matches:>10,} {seconds * 1000:>8.0f} ms")
+    saved = cache.save(args.out, dataset_tag(dataset))
+    print(f"Wrote {saved:,} results for {len(states)} selections to {args.out} in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == '__main__':
+    main()